@@ -1,12 +1,16 @@
 import asyncio
+import atexit
 import discord
 import os
 import sys
 from discord.ext import commands
 from core import ctxmenuhandler
+from core import messageregistry
 from core import settings
+from core import statscounter
 from core.logging_setup import get_logger
 from dotenv import load_dotenv
+from core.messageregistry import registry
 from core.queuehandler import GlobalQueue
 
 #from core.mask_server import MaskEditorServer
@@ -27,6 +31,9 @@ bot.logger = get_logger(__name__)
 try:
     settings.startup_check()
     settings.files_check()
+    GlobalQueue.start_workers()
+    registry.load()
+    atexit.register(registry.save)
     print("✅ Inicialización completada exitosamente")
 except Exception as e:
     print(f"⚠️  Advertencia durante la inicialización: {e}")
@@ -54,9 +61,13 @@ bot.load_extension('core.chatbotcog')
 @bot.slash_command(name='stats', description='How many images have I generated?')
 async def stats(ctx):
     print(f"/Stats request -- {ctx.author.name}#{ctx.author.discriminator}")
-    with open('resources/stats.txt', 'r') as f:
-        data = list(map(int, f.readlines()))
-    embed = discord.Embed(title='Art generated', description=f'I have created {data[0]} pictures!', color=discord.Color.random())
+    # served from memory, the counter saves itself in the background
+    embed = discord.Embed(title='Art generated', description=f'I have created {statscounter.counter.get("images")} pictures!', color=discord.Color.random())
+    embed.add_field(name='Upscales', value=str(statscounter.counter.get('upscales')), inline=True)
+    embed.add_field(name='Identifies', value=str(statscounter.counter.get('identifies')), inline=True)
+    top_models = sorted(statscounter.counter.models().items(), key=lambda item: item[1], reverse=True)[:5]
+    if top_models:
+        embed.add_field(name='Top models', value='\n'.join(f'{name}: {count}' for name, count in top_models), inline=False)
     await ctx.respond(embed=embed, delete_after=45.0)
 
 # Queue slash command
@@ -73,11 +84,9 @@ async def queue(ctx):
 @bot.slash_command(name='ping', description='Pong!')
 async def ping(ctx):
     print(f"/Ping request ({round(bot.latency * 1000)}ms)-- {ctx.author.name}#{ctx.author.discriminator}")
-    # Check for an existing progression message, if yes delete the previous one
-    async for old_msg in ctx.channel.history(limit=15):
-        if old_msg.embeds:
-            if old_msg.embeds[0].title.startswith("**Pong!** -"):
-                await old_msg.delete()
+    # Check for an existing pong message, if yes delete the previous one
+    for old_msg_id in registry.ids(ctx.channel.id, messageregistry.PONG):
+        await GlobalQueue.delete_tracked(ctx.channel, old_msg_id)
     latency_ms = round(bot.latency * 1000)
     title = f'**Pong!** - `{latency_ms}ms`'
     embed = discord.Embed(title=title, color=discord.Color.random())
@@ -102,6 +111,7 @@ async def on_ready():
     bot.logger.info(f'Logged in as {bot.user.name} ({bot.user.id})')
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name='drawing tutorials.'))
     await bot.sync_commands()
+    registry.start_autosave()
     for guild in bot.guilds:
         print(f"I'm active in {guild.id} a.k.a {guild}!")
 
@@ -111,17 +121,35 @@ async def on_raw_reaction_add(ctx):
     if ctx.emoji.name == '❌':
         try:
             end_user = f'{ctx.user_id}'
-            message = await bot.get_channel(ctx.channel_id).fetch_message(ctx.message_id)
-            if end_user in message.content and "Queue" not in message.content:
-                await message.delete()
-            # This is for deleting outputs from /identify
-            if message.embeds:
-                if message.embeds[0].footer.text == f'{ctx.member.name}#{ctx.member.discriminator}':
+            end_user_name = f'{ctx.member.name}#{ctx.member.discriminator}' if ctx.member else None
+            channel = bot.get_channel(ctx.channel_id)
+            tracked = registry.get(ctx.message_id)
+            if tracked is not None:
+                # the owner (mention or /identify footer) is already known, no fetch needed
+                if tracked.owned_by(end_user, end_user_name):
+                    await GlobalQueue.delete_tracked(channel, ctx.message_id)
+            elif not registry.known(ctx.message_id):
+                # older than what the registry has seen, check the message itself
+                message = await channel.fetch_message(ctx.message_id)
+                if end_user in message.content and "Queue" not in message.content:
                     await message.delete()
+                # This is for deleting outputs from /identify
+                elif message.embeds:
+                    if message.embeds[0].footer.text == end_user_name:
+                        await message.delete()
         except(Exception,):
             # So console log isn't spammed with errors
             pass
 
+# Events: keep the message registry up to date from the gateway
+@bot.listen('on_message')
+async def track_message(message):
+    registry.observe(message, bot.user)
+
+@bot.listen('on_raw_message_delete')
+async def forget_message(payload):
+    registry.deleted(payload.channel_id, payload.message_id)
+
 # Event: on_guild_join
 @bot.event
 async def on_guild_join(guild):
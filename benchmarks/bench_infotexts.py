@@ -0,0 +1,106 @@
+"""Reading the infotexts of a finished batch (core/infotexts.py).
+
+Times three ways to get the parameters text of 32 1024x1024 PNGs:
+"old" posts every image to a local server doing what /sdapi/v1/png-info does,
+"new" parses the infotexts of the txt2img response's "info" once, and
+"fallback" reads each PNG's own tEXt "parameters" chunk. All three must agree.
+
+    python benchmarks/bench_infotexts.py
+"""
+import base64
+import http.server
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+from PIL import Image, PngImagePlugin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.infotexts import response_infotexts  # noqa: E402
+
+IMAGES = 32
+SIZE = (1024, 1024)
+PARAMETERS = ('a castle on a hill, highly detailed\nNegative prompt: blurry\n'
+              'Steps: 30, Sampler: DPM++ 2M, CFG scale: 7, Seed: {}, Size: 1024x1024, Model: sdxl')
+
+
+class PngInfo(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        image = Image.open(io.BytesIO(base64.b64decode(body['image'].split(',', 1)[1])))
+        reply = json.dumps({'info': image.info.get('parameters', '')}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+def txt2img_response():
+    base = Image.effect_noise(SIZE, 40).convert('RGB')
+    images, infotexts = [], []
+    for n in range(IMAGES):
+        infotexts.append(PARAMETERS.format(n))
+        metadata = PngImagePlugin.PngInfo()
+        metadata.add_text('parameters', infotexts[-1])
+        buffer = io.BytesIO()
+        base.save(buffer, 'PNG', pnginfo=metadata, compress_level=1)
+        images.append(base64.b64encode(buffer.getvalue()).decode())
+    return {'images': images, 'info': json.dumps({'infotexts': infotexts, 'seed': 0})}, infotexts
+
+
+def main():
+    response_data, expected = txt2img_response()
+    images = response_data['images']
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), PngInfo)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/sdapi/v1/png-info'
+    session = requests.Session()
+
+    # each path decodes the images, post_dream needs them either way
+    def old():
+        result = []
+        for image_b64 in images:
+            Image.open(io.BytesIO(base64.b64decode(image_b64)))
+            response = session.post(url, json={'image': 'data:image/png;base64,' + image_b64})
+            result.append(response.json().get('info'))
+        return result
+
+    def new():
+        infotexts = response_infotexts(response_data, len(images))
+        result = []
+        for count, image_b64 in enumerate(images):
+            image = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+            result.append(infotexts[count] if infotexts else image.info.get('parameters', ''))
+        return result
+
+    def fallback():
+        return [Image.open(io.BytesIO(base64.b64decode(image_b64))).info.get('parameters', '')
+                for image_b64 in images]
+
+    try:
+        old()
+        for path in (old, new, fallback):
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                assert path() == expected
+                timings.append(time.perf_counter() - start)
+            print(f'{path.__name__:8s}  {min(timings) * 1e3:7.1f} ms for {IMAGES} images')
+        print(f're-uploaded by png-info: {sum(len(image) for image in images) / 1e6:.1f} MB per batch')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
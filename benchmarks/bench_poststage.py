@@ -0,0 +1,93 @@
+"""Backend idle time between jobs with and without the post-processing stage (core/poststage.py).
+
+One BackendWorker runs JOBS queued draws against a fake cog: GENERATION seconds of
+"generation", then the old post-processing of two 1024x1024 PNGs (decode, a png-info
+round trip, save, re-encode). "before" does that work inside dream like the cog used
+to, "after" hands it to the stage. BackendPool.idle_gap() is the average time the
+backend sat idle between a result coming back and its next job starting.
+
+    python benchmarks/bench_poststage.py
+"""
+import asyncio
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import settings  # noqa: E402,F401  (settings first, the pool imports it)
+from core import jobstate, poststage  # noqa: E402
+from core.backendpool import BackendPool, BackendWorker  # noqa: E402
+from core.scheduler import JobScheduler  # noqa: E402
+
+JOBS = 6
+GENERATION = 1.0
+PNG_INFO = 0.05
+
+
+def sample_images():
+    result = []
+    for n in range(2):
+        buffer = io.BytesIO()
+        Image.effect_noise((1024, 1024), 30 + n).convert('RGB').save(buffer, 'PNG')
+        result.append(base64.b64encode(buffer.getvalue()).decode())
+    return result
+
+
+def post_process(images, directory):
+    for n, image_b64 in enumerate(images):
+        image = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+        time.sleep(PNG_INFO)
+        image.save(os.path.join(directory, f'{n}.png'))
+        image.save(io.BytesIO(), 'PNG')
+
+
+class FakeCog:
+    def __init__(self, staged, images, directory):
+        self.staged = staged
+        self.images = images
+        self.directory = directory
+
+    def dream(self, event_loop, queue_object):
+        time.sleep(GENERATION)
+        jobstate.advance(queue_object, jobstate.POSTPROCESSING)
+        queue_object.is_done = True
+        if self.staged:
+            poststage.stage.submit([queue_object], post_process, self.images, self.directory)
+        else:
+            post_process(self.images, self.directory)
+
+
+async def run(staged, images, directory):
+    pool = BackendPool(JobScheduler())
+    pool.configure(['http://127.0.0.1:7860'])
+    backend = pool.backends[0]
+    backend.last_ok = time.time() + 3600
+    worker = BackendWorker(pool, backend, asyncio.get_running_loop())
+    cog = FakeCog(staged, images, directory)
+    jobs = [SimpleNamespace(cog=cog, user_id=1, data_model='', is_done=False) for _ in range(JOBS)]
+    for job in jobs:
+        pool.queue.push(job)
+    for _ in jobs:
+        await worker.run_once()
+    for job in jobs:
+        await jobstate.JobHandle(job)
+    return pool.idle_gap()
+
+
+def main():
+    images = sample_images()
+    with tempfile.TemporaryDirectory() as directory:
+        for name, staged in (('before', False), ('after', True)):
+            gap = asyncio.run(run(staged, images, directory))
+            print(f'{name:6s}  {gap:.3f} s average idle gap between {JOBS} jobs')
+
+
+if __name__ == '__main__':
+    main()
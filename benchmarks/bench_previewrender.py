@@ -0,0 +1,89 @@
+"""Event loop lag while progress previews are rendered (core/previewrender.py).
+
+A coroutine sleeps 5 ms at a time and records how late it wakes up while ten
+previews of an 832x1216 PNG are processed. "before" is the old inline path of
+the progress loop (decode, 1.5x LANCZOS upscale, JPEG encode on the loop),
+"after" is PreviewRenderer, which renders in its worker threads.
+
+    python benchmarks/bench_previewrender.py
+"""
+import asyncio
+import base64
+import io
+import os
+import statistics
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.previewrender import PreviewRenderer  # noqa: E402
+
+FRAMES = 10
+SIZE = (832, 1216)
+
+
+def frames():
+    # distinct frames, like the steps of a generation
+    base = Image.effect_noise(SIZE, 24).convert('RGB')
+    result = []
+    for n in range(FRAMES):
+        buffer = io.BytesIO()
+        base.rotate(n).save(buffer, 'PNG', compress_level=1)
+        result.append(base64.b64encode(buffer.getvalue()).decode())
+    return result
+
+
+def render_inline(image_b64):
+    image = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+    if image.mode in ('RGBA', 'P'):
+        image = image.convert('RGB')
+    image = image.resize((int(image.width * 1.5), int(image.height * 1.5)), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+async def measure(render, images):
+    lags = []
+    running = True
+
+    async def monitor():
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    task = asyncio.create_task(monitor())
+    await asyncio.sleep(0.02)
+    sizes = []
+    for image_b64 in images:
+        sizes.append(len(await render(image_b64)))
+        # the progress loop polls every so often, give the monitor a turn
+        await asyncio.sleep(0.01)
+    running = False
+    await task
+    lags.sort()
+    return max(lags), lags[int(len(lags) * 0.99)], statistics.mean(sizes)
+
+
+async def main():
+    images = frames()
+
+    async def before(image_b64):
+        return render_inline(image_b64)
+
+    renderer = PreviewRenderer()
+    for name, render in (('before', before), ('after', renderer.render)):
+        worst, p99, size = await measure(render, images)
+        print(f'{name:6s}  max loop lag {worst * 1e3:6.1f} ms  p99 {p99 * 1e3:6.1f} ms  preview {size / 1024:6.1f} KiB')
+
+    start = time.perf_counter()
+    assert await renderer.render(images[-1]) is None
+    print(f'unchanged frame skipped in {(time.perf_counter() - start) * 1e3:.2f} ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+from bisect import bisect_left, bisect_right
+
+# Discord shows at most 25 choices
+MAX_CHOICES = 25
+
+
+def unique_names(items):
+    # first element of list entries, no duplicates, a single "None" whatever its case
+    names = []
+    seen = set()
+    seen_none = False
+    for item in items:
+        name = item[0] if isinstance(item, list) else item
+        if name.lower() == 'none':
+            if seen_none:
+                continue
+            seen_none = True
+        elif name in seen:
+            continue
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+class AutocompleteIndex:
+    """Catalog names prepared for autocomplete: prefix matches first, then substring matches.
+
+    Prefix matches come from a sorted copy (bisect), substring matches from one lowercase
+    string of every name searched with str.find, so a lookup never loops over the catalog in Python.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        lowered = [name.lower() for name in self.names]
+        self._sorted = sorted(zip(lowered, range(len(self.names))))
+        self._sorted_keys = [key for key, _ in self._sorted]
+        self._haystack = '\n'.join(lowered)
+        # where each name starts in the haystack
+        self._starts = []
+        offset = 0
+        for key in lowered:
+            self._starts.append(offset)
+            offset += len(key) + 1
+
+    def search(self, value, limit=MAX_CHOICES):
+        value = str(value or '').lower()
+        if not value:
+            return self.names[:limit]
+
+        # names starting with the value, alphabetical
+        lo = bisect_left(self._sorted_keys, value)
+        hi = bisect_right(self._sorted_keys, value + '\uffff', lo)
+        found = [index for _, index in self._sorted[lo:min(hi, lo + limit)]]
+        if len(found) >= limit or '\n' in value:
+            return [self.names[index] for index in found]
+
+        # then names containing it, in catalog order
+        seen = set(found)
+        position = self._haystack.find(value)
+        while position != -1 and len(found) < limit:
+            index = bisect_right(self._starts, position) - 1
+            if index not in seen:
+                seen.add(index)
+                found.append(index)
+            # skip to the next name
+            next_start = self._starts[index + 1] if index + 1 < len(self._starts) else len(self._haystack)
+            position = self._haystack.find(value, next_start)
+        return [self.names[index] for index in found]
+
+
+indexes: dict[str, AutocompleteIndex] = {}
+
+
+def rebuild(name, names):
+    indexes[name] = AutocompleteIndex(names)
+
+
+def indexed(name):
+    # autocomplete callback for an option, reads the index current at the time of the keystroke
+    async def autocomplete(ctx):
+        index = indexes.get(name)
+        if index is None:
+            return []
+        return index.search(ctx.value)
+    return autocomplete
@@ -0,0 +1,256 @@
+import asyncio
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from core import jobstate
+from core import settings
+
+
+class Backend:
+    """One Web UI instance and the bookkeeping used to route jobs to it."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.healthy = True
+        self.active_jobs = 0
+        self.jobs_done = 0
+        self.failures = 0
+        self.last_ok = 0.0
+        self.last_check = 0.0
+        # checkpoint loaded by the last job, None until we know
+        self.current_model = None
+        self.model_switches = 0
+        # what we know of the web ui's /options, fetched once and kept in sync with our overrides
+        self.options = None
+        # when the last job got its result back, and the time the backend then sat idle until the next one
+        self.released_at = 0.0
+        self.idle_gap_total = 0.0
+        self.idle_gaps = 0
+
+    def check_health(self, timeout=5):
+        self.last_check = time.time()
+        try:
+            auth = (settings.global_var.api_user, settings.global_var.api_pass) if settings.global_var.api_auth else None
+            response = requests.get(f'{self.url}/sdapi/v1/cmd-flags', auth=auth, timeout=timeout)
+            # 401 still means the API is up, it just wants credentials
+            healthy = response.status_code != 404 and response.status_code < 500
+        except requests.exceptions.RequestException:
+            healthy = False
+
+        if healthy:
+            self.last_ok = self.last_check
+            self.failures = 0
+            if not self.healthy:
+                print(f'Backend {self.url} is back online.')
+        else:
+            self.failures += 1
+            self.current_model = None
+            self.options = None
+            if self.healthy:
+                print(f'Backend {self.url} is unreachable! Its jobs will go to the other backends.')
+        self.healthy = healthy
+        return healthy
+
+
+    def option_changes(self, session, wanted):
+        # the part of wanted that the web ui doesn't already have
+        if self.options is None:
+            try:
+                response = session.get(f'{self.url}/sdapi/v1/options', timeout=30)
+                self.options = response.json() if response.ok else {}
+            except (requests.exceptions.RequestException, ValueError):
+                self.options = {}
+        return {key: value for key, value in wanted.items() if self.options.get(key) != value}
+
+    def remember_options(self, values):
+        if self.options is not None:
+            self.options.update(values)
+
+    def forget_options(self):
+        self.options = None
+
+
+class BackendWorker:
+    """Long-lived worker running the dream jobs of a single backend, one at a time.
+
+    It lives on the bot's event loop: waiting for a job is an await on the queue, the blocking
+    parts (health checks and the cog's dream, which talks to the Web UI with requests) run on
+    the worker's own executor thread. Each job goes queued -> running -> post-processing ->
+    done/failed, see core.jobstate.
+    """
+
+    def __init__(self, pool, backend, event_loop):
+        self.pool = pool
+        self.backend = backend
+        self.event_loop = event_loop
+        self.busy = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'dream-worker-{backend.url}')
+        self.future = None
+
+    def start(self):
+        # the loop may not be running yet at startup, the worker begins with it
+        self.future = asyncio.run_coroutine_threadsafe(self.run(), self.event_loop)
+
+    def is_alive(self):
+        return self.future is not None and not self.future.done()
+
+    async def blocking(self, function, *args):
+        return await self.event_loop.run_in_executor(self.executor, function, *args)
+
+    async def run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                # the worker outlives any single job
+                print(f'Worker for {self.backend.url} hit an error: {e}')
+                traceback.print_exc()
+                await asyncio.sleep(1)
+
+    async def run_once(self):
+        backend = self.backend
+        if not backend.healthy:
+            # stay out of the queue until the backend answers again
+            await asyncio.sleep(self.pool.retry_interval)
+            await self.blocking(backend.check_health)
+            return
+
+        queue_object = await self.pool.queue.get(timeout=self.pool.retry_interval, model=backend.current_model)
+        if queue_object is None:
+            return
+
+        # re-check backends that have been quiet for a while before handing them a job
+        if time.time() - backend.last_ok > self.pool.recheck_interval and not await self.blocking(backend.check_health):
+            self.pool.queue.requeue(queue_object)
+            return
+
+        # identical queued draws ride along in the same request
+        followers = self.pool.queue.take_matching(queue_object, settings.global_var.coalesce_max_batch - 1)
+        if getattr(queue_object, 'coalescible', False):
+            queue_object.coalesced = followers
+        if followers:
+            print(f'Coalesced {len(followers)} queued draw(s) into one batch on {backend.url}')
+
+        model = getattr(queue_object, 'data_model', '')
+        if model:
+            if backend.current_model is not None and model != backend.current_model:
+                backend.model_switches += 1
+            backend.current_model = model
+
+        # time the backend sat idle since it finished its last job, or since this job arrived if it came later
+        if backend.released_at:
+            backend.idle_gap_total += time.monotonic() - max(backend.released_at, queue_object.timeline.since)
+            backend.idle_gaps += 1
+
+        jobs = [queue_object] + followers
+        # which run of each job this is, a failed over job may already be running elsewhere when we finish
+        runs = [jobstate.advance(job, jobstate.RUNNING).runs for job in jobs]
+        queue_object.backend_url = backend.url
+        self.busy = True
+        backend.active_jobs += 1
+        error = None
+        try:
+            await self.blocking(queue_object.cog.dream, self.event_loop, queue_object)
+        except Exception as e:
+            error = e
+            print(f'Worker for {backend.url} failed to run a job: {e}')
+            traceback.print_exc()
+        finally:
+            # the backend was free as soon as the result came back, whatever ran after that
+            backend.released_at = queue_object.timeline.generated_at or time.monotonic()
+            backend.active_jobs -= 1
+            self.busy = False
+
+        # merged jobs that didn't get their image back run again on their own, with the seed the user was shown
+        for follower in followers:
+            if not follower.is_done:
+                follower.coalescible = False
+                follower.set_seed(follower.requested_seed)
+                self.pool.queue.requeue(follower)
+
+        for job, run in zip(jobs, runs):
+            timeline = job.timeline
+            if timeline.runs != run or timeline.state == jobstate.QUEUED:
+                continue
+            if timeline.detached:
+                # the Web UI gave its result, the post-processing stage finishes the job
+                backend.jobs_done += 1
+                continue
+            # the cogs mark post-processing once the Web UI gave a result, a job that never got there failed
+            succeeded = error is None and timeline.state == jobstate.POSTPROCESSING
+            jobstate.advance(job, jobstate.DONE if succeeded else jobstate.FAILED, error)
+            if succeeded:
+                backend.jobs_done += 1
+
+
+class BackendPool:
+    """A worker per configured Web UI. Workers only take jobs while their backend is healthy,
+    so jobs flow to whatever instances are up and free."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.backends: list[Backend] = []
+        self.workers: list[BackendWorker] = []
+        self.retry_interval = 15
+        self.recheck_interval = 60
+        self.max_attempts = 2
+
+    def configure(self, urls):
+        known = {backend.url: backend for backend in self.backends}
+        self.backends = [known.get(url.rstrip('/')) or Backend(url) for url in dict.fromkeys(urls)]
+
+    def start(self, event_loop):
+        running = {worker.backend.url for worker in self.workers}
+        for backend in self.backends:
+            if backend.url not in running:
+                worker = BackendWorker(self, backend, event_loop)
+                self.workers.append(worker)
+                worker.start()
+
+    def get(self, url):
+        for backend in self.backends:
+            if backend.url == url:
+                return backend
+        return None
+
+    def select(self):
+        # for one-off API calls outside the queue: the healthy backend with the least work
+        candidates = [backend for backend in self.backends if backend.healthy] or self.backends
+        if not candidates:
+            return None
+        return min(candidates, key=lambda backend: backend.active_jobs)
+
+    def idle_workers(self):
+        return sum(1 for worker in self.workers if not worker.busy and worker.backend.healthy)
+
+    def failover(self, queue_object):
+        # called by a job that lost its backend, returns True if another backend will retry it
+        backend = self.get(getattr(queue_object, 'backend_url', None))
+        if backend is not None:
+            backend.healthy = False
+            # a restarted web ui may come back with another checkpoint and options
+            backend.current_model = None
+            backend.options = None
+            backend.failures += 1
+            print(f'Backend {backend.url} dropped during a job.')
+        attempts = getattr(queue_object, 'attempts', 0) + 1
+        queue_object.attempts = attempts
+        if attempts >= self.max_attempts or not any(b.healthy for b in self.backends):
+            return False
+        self.queue.requeue(queue_object)
+        return True
+
+    def idle_gap(self):
+        # average seconds a backend waited between two jobs
+        gaps = sum(backend.idle_gaps for backend in self.backends)
+        return sum(backend.idle_gap_total for backend in self.backends) / gaps if gaps else 0.0
+
+    def status(self):
+        output = {}
+        for backend in self.backends:
+            state = 'online' if backend.healthy else 'offline'
+            output[backend.url] = f'{state}, {backend.active_jobs} running, {backend.jobs_done} done, {backend.model_switches} model switches'
+        return output
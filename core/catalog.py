@@ -0,0 +1,331 @@
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+import requests
+
+from core import settings
+
+SNAPSHOT_FILE = 'catalog_snapshot.json'
+# endpoint -> key in the raw catalog
+ENDPOINTS = {
+    'samplers': '/sdapi/v1/samplers',
+    'styles': '/sdapi/v1/prompt-styles',
+    'hypernetworks': '/sdapi/v1/hypernetworks',
+    'upscalers': '/sdapi/v1/upscalers',
+    'schedulers': '/sdapi/v1/schedulers',
+    'sd_models': '/sdapi/v1/sd-models',
+    'config': '/config',
+}
+# /config components we need from the (large) Web UI config
+CONFIG_CHOICES = {'setting_sd_lora': 'loras', 'txt2img_hr_upscaler': 'hires_upscalers'}
+
+_last_raw = {}
+
+
+def _get_json(s, url):
+    return s.get(url, timeout=10).json()
+
+
+def fetch(s, url=None):
+    # every catalog endpoint at once, the raw catalog is what gets saved in the snapshot
+    url = url or settings.global_var.url
+    with ThreadPoolExecutor(max_workers=len(ENDPOINTS), thread_name_prefix='catalog') as executor:
+        futures = {key: executor.submit(_get_json, s, url + endpoint) for key, endpoint in ENDPOINTS.items()}
+        raw = {'url': url}
+        for key, future in futures.items():
+            if key == 'config':
+                continue
+            # the API lists are required, a failure here aborts the refresh like before
+            raw[key] = future.result()
+        try:
+            raw.update(_config_choices(futures['config'].result()))
+        except Exception as e:
+            print(f"Error al obtener configuración de la Web UI: {e}")
+            # keep the LoRAs and high-res upscalers we already had
+            raw['loras'] = _last_raw.get('loras', [])
+            raw['hires_upscalers'] = _last_raw.get('hires_upscalers', [])
+    return raw
+
+
+def _config_choices(old_config):
+    # iterate through config for anything unobtainable from API
+    choices = {'loras': [], 'hires_upscalers': []}
+    try:
+        for c in old_config['components']:
+            try:
+                if c['props'] and c['props']['elem_id'] in CONFIG_CHOICES:
+                    choices[CONFIG_CHOICES[c['props']['elem_id']]] = c['props']['choices']
+            except(Exception,):
+                pass
+    except(Exception,):
+        print("Trouble accessing Web UI config! I can't pull the LoRAs or High-res upscaler lists!")
+    return choices
+
+
+def _scheduler_names(schedulers_data):
+    # schedulers endpoint can vary between backends (AUTOMATIC1111, SD.Next, etc.)
+    # Try to handle multiple JSON shapes so scheduler_names is populated whenever possible.
+    names = []
+    if isinstance(schedulers_data, list):
+        for item in schedulers_data:
+            if isinstance(item, dict):
+                name = item.get('name') or item.get('label') or item.get('id') or item.get('value')
+                if name:
+                    names.append(str(name))
+            elif isinstance(item, str):
+                names.append(item)
+    elif isinstance(schedulers_data, dict):
+        for key, value in schedulers_data.items():
+            if isinstance(value, dict):
+                name = value.get('name') or value.get('label') or key
+            else:
+                name = key
+            if name:
+                names.append(str(name))
+    return names
+
+
+def _basename(model_path):
+    return os.path.normpath(model_path).split(os.sep)[-1]
+
+
+def match_models(model_rows, sd_models):
+    # models.csv rows -> model_info, through basename / model_name indexes instead of a scan per row
+    # model_info[0] = display name (top level)
+    # model_info[1][0] = "title". this is sent to the API
+    # model_info[1][1] = name of the model
+    # model_info[1][2] = shorthash
+    # model_info[1][3] = activator token
+    by_basename = {}
+    by_model_name = {}
+    for position, model in enumerate(sd_models):
+        by_basename.setdefault(_basename(model['filename']), position)
+        by_model_name.setdefault(model['model_name'], position)
+
+    model_info = {}
+    for row in model_rows:
+        norm_csv_path = os.path.normpath(row[1])
+        # the first API model matching either way, same as the old nested loop
+        positions = [p for p in (by_basename.get(norm_csv_path.split(os.sep)[-1]),
+                                 by_model_name.get(norm_csv_path.replace(os.sep, '_'))) if p is not None]
+        if positions:
+            model = sd_models[min(positions)]
+            model_info[row[0]] = model['title'], model['model_name'], model['hash'], row[2]
+    # add "Default" if models.csv is on default, or if no model matches are found
+    if not model_info and model_rows:
+        model_info[model_rows[-1][0]] = '', '', '', ''
+    return model_info
+
+
+class CatalogSnapshot:
+    """One complete, read-only set of Web UI catalogs. Replaced as a whole, never modified."""
+
+    FIELDS = ('sampler_names', 'scheduler_names', 'style_names', 'hyper_names', 'lora_names', 'extra_nets',
+              'upscaler_names', 'hires_upscaler_names', 'model_info')
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            value = fields.get(name, ())
+            if isinstance(value, dict):
+                value = MappingProxyType(dict(value))
+            else:
+                value = tuple(value)
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CatalogSnapshot is read-only, build a new one instead')
+
+    def diff(self, other):
+        # field -> (added, removed) for everything that differs from other
+        changes = {}
+        for name in self.FIELDS:
+            new, old = getattr(self, name), getattr(other, name)
+            if new == old:
+                continue
+            if isinstance(new, MappingProxyType):
+                added = [key for key in new if key not in old or new[key] != old[key]]
+                removed = [key for key in old if key not in new]
+            else:
+                new_set, old_set = set(map(repr, new)), set(map(repr, old))
+                added = [item for item in new if repr(item) not in old_set]
+                removed = [item for item in old if repr(item) not in new_set]
+            changes[name] = (added, removed)
+        return changes
+
+
+current = CatalogSnapshot()
+_listeners = []
+_swap_lock = threading.Lock()
+
+
+def add_listener(listener):
+    # listener(changes) is called after every swap that changed something
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def build(raw):
+    # raw catalog from the Web UI (or the saved snapshot) -> CatalogSnapshot
+    sampler_names = []
+    try:
+        for s1 in raw['samplers']:
+            try:
+                sampler_names.append(s1['name'])
+            except(Exception,):
+                pass
+    except Exception as e:
+        print(f"Error al procesar samplers: {e}")
+
+    style_names = {'None': ''}
+    try:
+        for s2 in raw['styles']:
+            style_names[s2['name']] = s2['prompt'], s2['negative_prompt']
+    except Exception as e:
+        print(f"Error al procesar estilos: {e}")
+
+    hyper_names = []
+    try:
+        for s5 in raw['hypernetworks']:
+            hyper_names.append(s5['name'])
+    except Exception as e:
+        print(f"Error al procesar hypernetworks: {e}")
+
+    upscaler_names = []
+    try:
+        for s6 in raw['upscalers']:
+            upscaler_names.append(s6['name'])
+    except Exception as e:
+        print(f"Error al procesar upscalers: {e}")
+
+    try:
+        scheduler_names = _scheduler_names(raw['schedulers'])
+    except Exception as e:
+        scheduler_names = []
+        print(f"Error al procesar schedulers: {e}")
+
+    model_info = {}
+    try:
+        with open(f'{settings.path}models.csv', encoding='utf-8') as csv_file:
+            model_rows = list(csv.reader(csv_file, delimiter='|'))[1:]
+        model_info = match_models(model_rows, raw['sd_models'])
+    except Exception as e:
+        print(f"Error al procesar modelos: {e}")
+
+    # format some global lists, ensure default "None" options exist
+    if 'None' not in hyper_names:
+        hyper_names.insert(0, 'None')
+    lora_names = [lora for lora in raw.get('loras', []) if lora != '']
+    extra_nets = hyper_names + lora_names
+    lora_names.insert(0, 'None')
+    hires_upscaler_names = ['Disabled'] + list(raw.get('hires_upscalers', []))
+
+    return CatalogSnapshot(sampler_names=sampler_names, scheduler_names=scheduler_names, style_names=style_names,
+                           hyper_names=hyper_names, lora_names=lora_names, extra_nets=extra_nets,
+                           upscaler_names=upscaler_names, hires_upscaler_names=hires_upscaler_names,
+                           model_info=model_info)
+
+
+def swap(snapshot):
+    # make snapshot the current catalog in one assignment, returns what changed
+    global current
+    with _swap_lock:
+        changes = snapshot.diff(current)
+        if not changes:
+            return changes
+        current = snapshot
+        if 'SwinIR_4x' in snapshot.upscaler_names:
+            settings.template['upscaler_1'] = 'SwinIR_4x'
+    for listener in list(_listeners):
+        try:
+            listener(changes)
+        except Exception as e:
+            print(f'Catalog listener {listener} failed: {e}')
+    return changes
+
+
+def apply(raw):
+    global _last_raw
+    _last_raw = raw
+    return swap(build(raw))
+
+
+def save_snapshot(raw):
+    file_path = settings.path + SNAPSHOT_FILE
+    try:
+        with open(file_path + '.tmp', 'w') as f:
+            json.dump(raw, f)
+        os.replace(file_path + '.tmp', file_path)
+    except OSError as e:
+        print(f'Could not save the catalog snapshot: {e}')
+
+
+def load_snapshot(url=None):
+    # the catalog saved by the last run for this Web UI, None if there isn't one
+    file_path = settings.path + SNAPSHOT_FILE
+    if not os.path.isfile(file_path):
+        return None
+    try:
+        with open(file_path, 'r') as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f'Ignoring the catalog snapshot: {e}')
+        return None
+    if raw.get('url') != (url or settings.global_var.url):
+        return None
+    return raw
+
+
+def refresh(s):
+    # fetch, apply and save. Returns the changes, or None when the Web UI couldn't be reached
+    try:
+        raw = fetch(s)
+    except requests.exceptions.ConnectionError as e:
+        print(f"Error de conexión al cargar datos de la Web UI: {e}")
+        print("Algunas funciones pueden no estar disponibles.")
+        return None
+    except requests.exceptions.Timeout as e:
+        print(f"Timeout al cargar datos de la Web UI: {e}")
+        print("Algunas funciones pueden no estar disponibles.")
+        return None
+    except Exception as e:
+        print(f"Error inesperado al cargar datos de la Web UI: {e}")
+        print("Algunas funciones pueden no estar disponibles.")
+        return None
+    changes = apply(raw)
+    if changes:
+        save_snapshot(raw)
+        print('Web UI catalog updated: ' + ', '.join(
+            f'{name} +{len(added)}/-{len(removed)}' for name, (added, removed) in changes.items()))
+    return changes
+
+
+def refresh_in_background(s):
+    thread = threading.Thread(target=refresh, args=(s,), name='catalog-refresh', daemon=True)
+    thread.start()
+    return thread
+
+
+_refresher = None
+
+
+def start_refresher(interval):
+    # re-fetch the catalog every interval seconds, new LoRAs and models show up without a restart
+    global _refresher
+    if interval <= 0 or (_refresher is not None and _refresher.is_alive()):
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            s = settings.authenticate_user()
+            if s is not None:
+                refresh(s)
+
+    _refresher = threading.Thread(target=run, name='catalog-refresher', daemon=True)
+    _refresher.start()
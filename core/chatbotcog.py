@@ -7,6 +7,7 @@ import threading
 from discord.ext import commands
 from discord.ext.commands import Context
 
+from core import ratelimit
 from core.leaderboardcog import LeaderboardCog
 from core.stablecog import StableCog
 
@@ -237,26 +238,26 @@ class LlamaChatCog(commands.Cog):
                     tokens_this_response += 1
                     if len(response) > 1975:
                         if not initial_response_sent:
-                            temp_message = await message.channel.send(response)
+                            temp_message = await ratelimit.governor.send(message.channel, content=response)
                             initial_response_sent = True
                         else:
-                            await temp_message.edit(content=response)
+                            await ratelimit.governor.edit(temp_message, content=response)
                             if tag:
-                                temp_message = await message.channel.send(f"{message.author.mention} ")
+                                temp_message = await ratelimit.governor.send(message.channel, content=f"{message.author.mention} ")
                                 response = f"<@{message.author.id}>\n"
                             else:
-                                temp_message = await message.channel.send("")
+                                temp_message = await ratelimit.governor.send(message.channel, content="")
                                 response = ""
                     elif not initial_response_sent and response:
                         if tag:
-                            temp_message = await message.channel.send(f"{message.author.mention} {response}")
+                            temp_message = await ratelimit.governor.send(message.channel, content=f"{message.author.mention} {response}")
                         else:
-                            temp_message = await message.channel.send(f"{response}")
+                            temp_message = await ratelimit.governor.send(message.channel, content=f"{response}")
                         initial_response_sent = True
                     elif response:
                         current_time = asyncio.get_running_loop().time()
                         if current_time - last_update_time >= 1.25:
-                            await temp_message.edit(content=response)
+                            await ratelimit.governor.edit(temp_message, content=response)
                             last_update_time = current_time
             else:
                 from transformers import TextIteratorStreamer
@@ -272,26 +273,26 @@ class LlamaChatCog(commands.Cog):
                     tokens_this_response += 1
                     if len(response) > 1975:
                         if not initial_response_sent:
-                            temp_message = await message.channel.send(response)
+                            temp_message = await ratelimit.governor.send(message.channel, content=response)
                             initial_response_sent = True
                         else:
-                            await temp_message.edit(content=response)
+                            await ratelimit.governor.edit(temp_message, content=response)
                             if tag:
-                                temp_message = await message.channel.send(f"{message.author.mention} ")
+                                temp_message = await ratelimit.governor.send(message.channel, content=f"{message.author.mention} ")
                                 response = f"<@{message.author.id}>\n"
                             else:
-                                temp_message = await message.channel.send("")
+                                temp_message = await ratelimit.governor.send(message.channel, content="")
                                 response = ""
                     elif not initial_response_sent and response:
                         if tag:
-                            temp_message = await message.channel.send(f"{message.author.mention} {response}")
+                            temp_message = await ratelimit.governor.send(message.channel, content=f"{message.author.mention} {response}")
                         else:
-                            temp_message = await message.channel.send(f"{response}")
+                            temp_message = await ratelimit.governor.send(message.channel, content=f"{response}")
                         initial_response_sent = True
                     elif response:
                         current_time = asyncio.get_running_loop().time()
                         if current_time - last_update_time >= 1.25:
-                            await temp_message.edit(content=response)
+                            await ratelimit.governor.edit(temp_message, content=response)
                             last_update_time = current_time
                 thread.join()
             
@@ -299,9 +300,9 @@ class LlamaChatCog(commands.Cog):
             self.total_tokens_generated += tokens_this_response
 
             if response and temp_message:
-                await temp_message.edit(content=response)
+                await ratelimit.governor.edit(temp_message, content=response)
             elif response:
-                await message.channel.send(response)
+                await ratelimit.governor.send(message.channel, content=response)
 
             elapsed_time = time.time() - start_time
             if elapsed_time > 0:
@@ -1,13 +1,13 @@
 import base64
 import discord
 import re
-import requests
 from urlextract import URLExtract
 
 from core import settings
 from core import queuehandler
 from core import upscalecog
 from core import viewhandler
+from core import webuiclient
 
 
 def extra_net_search(field):
@@ -44,14 +44,9 @@ async def parse_image_info(ctx, image_url, command):
     message = ''
     try:
         # construct a payload
-        image = base64.b64encode(requests.get(image_url, stream=True).content).decode('utf-8')
-        payload = {
-            "image": 'data:image/png;base64,' + image
-        }
+        image = base64.b64encode(await webuiclient.fetch(image_url)).decode('utf-8')
         # send normal payload to webui
-        s = settings.authenticate_user()
-        png_response = s.post(url=f'{settings.global_var.url}/sdapi/v1/png-info', json=payload)
-        png_data = png_response.json().get("info")
+        png_data = await webuiclient.png_info(image)
         png_data_list = png_data.split("\n")
 
         # grab prompt and negative prompt
@@ -256,7 +251,11 @@ async def quick_upscale(self, ctx, message: discord.Message):
     settings.check(channel)
     upscaler_1 = settings.read(channel)['upscaler_1']
 
-    init_image = requests.get(urls[0])
+    try:
+        init_image = await webuiclient.fetch_image(urls[0])
+    except(Exception,):
+        await ctx.respond(content="I couldn't download that image...", ephemeral=True)
+        return
     resize = settings.global_var.quick_upscale_resize
     upscaler_2, upscaler_2_strength = "None", '0.5'
     gfpgan, codeformer = '0.0', '0.0'
@@ -272,13 +271,13 @@ async def quick_upscale(self, ctx, message: discord.Message):
     view = viewhandler.DeleteView(input_tuple)
     user_queue_limit = settings.queue_check(ctx.author)
     upscale_dream = upscalecog.UpscaleCog(self)
-    if queuehandler.GlobalQueue.dream_thread.is_alive():
+    if queuehandler.GlobalQueue.is_busy():
         if user_queue_limit == "Stop":
             await ctx.send_response(
                 content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.",
                 ephemeral=True)
         else:
-            queuehandler.GlobalQueue.queue.append(queuehandler.UpscaleObject(upscale_dream, *input_tuple, view))
+            queuehandler.GlobalQueue.queue.push(queuehandler.UpscaleObject(upscale_dream, *input_tuple, view))
     else:
         await queuehandler.process_dream(upscale_dream, queuehandler.UpscaleObject(upscale_dream, *input_tuple, view))
     if user_queue_limit != "Stop":
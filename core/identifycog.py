@@ -1,17 +1,21 @@
-import base64
 import discord
 import traceback
 import requests
 from asyncio import AbstractEventLoop
 from discord import option
 from discord.ext import commands
-from threading import Thread
 from typing import Optional
 
 from core import ctxmenuhandler
+from core import jobstate
+from core import poststage
 from core import queuehandler
+from core import ratelimit
 from core import viewhandler
 from core import settings
+from core import statscounter
+from core import webuiclient
+from core.inputprefetch import InputError
 from core.queuehandler import GlobalQueue
 from core.leaderboardcog import LeaderboardCog
 
@@ -54,7 +58,7 @@ class IdentifyCog(commands.Cog):
         # url *will* override init image for compatibility, can be changed here
         if init_url:
             try:
-                init_image = requests.get(init_url)
+                init_image = await webuiclient.fetch_image(init_url)
             except(Exception,):
                 await ctx.send_response('URL image not found!\nI have nothing to work with...', ephemeral=True)
                 has_image = False
@@ -80,11 +84,11 @@ class IdentifyCog(commands.Cog):
         # set up the queue if an image was found
         user_queue_limit = settings.queue_check(ctx.author)
         if has_image:
-            if queuehandler.GlobalQueue.dream_thread.is_alive():
+            if queuehandler.GlobalQueue.is_busy():
                 if user_queue_limit == "Stop":
                     await ctx.send_response(content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.", ephemeral=True)
                 else:
-                    queuehandler.GlobalQueue.queue.append(queuehandler.IdentifyObject(self, *input_tuple, view))
+                    queuehandler.GlobalQueue.queue.push(queuehandler.IdentifyObject(self, *input_tuple, view))
             else:
                 await queuehandler.process_dream(self, queuehandler.IdentifyObject(self, *input_tuple, view))
             if user_queue_limit != "Stop":
@@ -93,7 +97,8 @@ class IdentifyCog(commands.Cog):
     # the function to queue Discord posts
     def post(self, event_loop: AbstractEventLoop, post_queue_object: queuehandler.PostObject):
         event_loop.create_task(
-            post_queue_object.ctx.channel.send(
+            ratelimit.governor.send(
+                post_queue_object.ctx.channel,
                 content=post_queue_object.content,
                 embed=post_queue_object.embed,
                 view=post_queue_object.view
@@ -103,60 +108,32 @@ class IdentifyCog(commands.Cog):
             self.post(self.event_loop, self.queue.pop(0))
 
     def dream(self, event_loop: AbstractEventLoop, queue_object: queuehandler.IdentifyObject):
+        backend_url = getattr(queue_object, "backend_url", None) or settings.global_var.url
         try:
-            # construct a payload
-            # Robust fetch of the image (Discord CDN/ephemeral links may require UA and can expire)
+            # construct a payload, the image is usually downloaded, checked and encoded while the previous job rendered
             try:
-                img_resp = requests.get(
-                    queue_object.init_image,
-                    stream=True,
-                    timeout=15,
-                    headers={
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36'
-                    }
-                )
-            except Exception as fetch_err:
+                prepared = GlobalQueue.prefetcher.take(queue_object)
+            except InputError as fetch_err:
                 print(f"[identify] Image fetch failed: url={queue_object.init_image} err={fetch_err}")
                 embed = discord.Embed(
                     title='identify failed',
-                    description=f'Failed to download the image: {fetch_err}',
-                    color=settings.global_var.embed_color
-                )
-                event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
-                return
-
-            if img_resp.status_code != 200:
-                print(f"[identify] Image fetch bad status: {img_resp.status_code} url={queue_object.init_image}")
-                embed = discord.Embed(
-                    title='identify failed',
-                    description=f'Failed to download the image (HTTP {img_resp.status_code}). The URL may have expired. Please resend the image.',
-                    color=settings.global_var.embed_color
-                )
-                event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
-                return
-
-            content_type = img_resp.headers.get('Content-Type', '')
-            content_len = int(img_resp.headers.get('Content-Length') or 0)
-            print(f"[identify] Image fetched: status={img_resp.status_code} content_type={content_type} bytes={content_len or 'unknown'}")
-            if 'image' not in content_type:
-                embed = discord.Embed(
-                    title='identify failed',
-                    description='The provided link did not return a valid image. It may have expired or require authentication.',
+                    description=str(fetch_err),
                     color=settings.global_var.embed_color
                 )
                 event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
                 return
+            print(f"[identify] Image fetched: content_type={prepared.mime} bytes={prepared.size * 3 // 4}")
 
-            image = base64.b64encode(img_resp.content).decode('utf-8')
-            mime = (content_type.split(';')[0] if content_type else 'image/png')
+            image = prepared.b64
+            mime = prepared.mime
             payload = {
                 "image": f'data:{mime};base64,' + image,
                 "model": queue_object.phrasing
             }
             # send normal payload to webui
-            s = settings.authenticate_user()
+            s = settings.authenticate_user(backend_url)
 
-            response = s.post(url=f'{settings.global_var.url}/sdapi/v1/interrogate', json=payload)
+            response = s.post(url=f'{backend_url}/sdapi/v1/interrogate', json=payload)
             print(f"[identify] API response: status={response.status_code}")
             try:
                 response_data = response.json()
@@ -164,6 +141,8 @@ class IdentifyCog(commands.Cog):
                 body_preview = (response.text[:300] + '...') if response and response.text else 'empty'
                 print(f"[identify] Failed to parse JSON. Body preview: {body_preview}")
                 response_data = {"error": f"Invalid API response (HTTP {response.status_code})"}
+            jobstate.add_output(queue_object, None, response_data)
+            jobstate.advance(queue_object, jobstate.POSTPROCESSING)
 
             # post to discord
             def post_dream():
@@ -204,18 +183,23 @@ class IdentifyCog(commands.Cog):
                 queuehandler.process_post(
                     self, queuehandler.PostObject(
                         self, queue_object.ctx, content=f'<@{queue_object.ctx.author.id}>', file='', embed=embed, view=queue_object.view))
-            Thread(target=post_dream, daemon=True).start()
+            poststage.stage.submit([queue_object], post_dream)
 
+        except requests.exceptions.ConnectionError as e:
+            if GlobalQueue.failover(queue_object):
+                return
+            jobstate.advance(queue_object, jobstate.FAILED, e)
+            embed = discord.Embed(title='identify failed', description=f'{e}', color=settings.global_var.embed_color)
+            event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
         except Exception as e:
+            jobstate.advance(queue_object, jobstate.FAILED, e)
             embed = discord.Embed(title='identify failed', description=f'{e}\n{traceback.print_exc()}',
                                   color=settings.global_var.embed_color)
             event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
 
-        # update the leaderboard
+        # update the leaderboard and the stats
         LeaderboardCog.update_leaderboard(queue_object.ctx.author.id, str(queue_object.ctx.author), "Identify_Count")
-
-        # check each queue for any remaining tasks
-        GlobalQueue.process_queue()
+        statscounter.counter.add('identifies')
 
 
 def setup(bot):
@@ -0,0 +1,15 @@
+import json
+
+
+def response_infotexts(response_data, count):
+    # one infotext per returned image from the response's "info" JSON, None when it doesn't line up
+    try:
+        info = response_data.get("info")
+        if isinstance(info, str):
+            info = json.loads(info)
+        infotexts = info.get("infotexts")
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if not isinstance(infotexts, list) or len(infotexts) != count:
+        return None
+    return infotexts
@@ -0,0 +1,135 @@
+import base64
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+from core import jobstate
+
+# queued jobs whose input images are fetched ahead of time
+PREFETCH_DEPTH = 3
+# bytes of encoded input images held for queued jobs, past that the job fetches its own when it starts
+MEMORY_BUDGET = 64 * 1024 * 1024
+FETCH_TIMEOUT = 15
+# Discord CDN / ephemeral links may refuse requests without a browser user agent
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36'
+}
+
+
+class InputError(Exception):
+    """The input image couldn't be downloaded or isn't an image, the message is meant for the user."""
+
+
+class PreparedImage:
+    """A validated input image, base64 encoded and ready for the payload."""
+
+    __slots__ = ('b64', 'mime', 'size')
+
+    def __init__(self, b64, mime):
+        self.b64 = b64
+        self.mime = mime
+        self.size = len(b64)
+
+
+def input_of(job):
+    # the image a queued job sends to the Web UI: an attachment, a RemoteImage, a URL or a file:// path
+    return getattr(job, 'init_image', None)
+
+
+def prepare(image):
+    content = getattr(image, 'content', None)
+    if isinstance(content, bytes):
+        # a RemoteImage was already downloaded when the command ran
+        data = content
+    elif isinstance(image, str) and image.startswith('file://'):
+        with open(image[7:], 'rb') as f:
+            data = f.read()
+    else:
+        url = image if isinstance(image, str) else image.url
+        try:
+            response = requests.get(url, timeout=FETCH_TIMEOUT, headers=HEADERS)
+        except requests.exceptions.RequestException as e:
+            raise InputError(f'Failed to download the image: {e}')
+        if response.status_code != 200:
+            raise InputError(f'Failed to download the image (HTTP {response.status_code}). '
+                             f'The URL may have expired. Please resend the image.')
+        data = response.content
+    try:
+        with Image.open(io.BytesIO(data)) as decoded:
+            mime = Image.MIME.get(decoded.format, 'image/png')
+    except Exception:
+        raise InputError('The provided link did not return a valid image. '
+                         'It may have expired or require authentication.')
+    return PreparedImage(base64.b64encode(data).decode('utf-8'), mime)
+
+
+class InputPrefetcher:
+    """Downloads, validates and encodes the input images of the next queued jobs in the background,
+    so a job's payload is ready the moment its backend frees up.
+
+    Looks at the PREFETCH_DEPTH jobs at the head of the queue whenever a job is pushed or taken.
+    Prepared images are held up to memory_budget bytes; one that doesn't fit is dropped and the job
+    fetches it itself when it runs, like before. A failed prefetch is retried by the job.
+    """
+
+    def __init__(self, queue, depth=PREFETCH_DEPTH, memory_budget=MEMORY_BUDGET):
+        self.queue = queue
+        self.depth = depth
+        self.memory_budget = memory_budget
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='input-prefetch')
+        # reentrant, _forget may run right away from inside kick
+        self._lock = threading.RLock()
+        # id(job) -> (job, future of a PreparedImage or None)
+        self._entries: dict[int, tuple] = {}
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        queue.listeners.append(self.kick)
+
+    def kick(self):
+        jobs = self.queue.peek(self.depth)
+        with self._lock:
+            for key, (job, future) in list(self._entries.items()):
+                # cancelled or failed while waiting, nobody will take it
+                if jobstate.state(job) in jobstate.FINISHED:
+                    del self._entries[key]
+                    future.add_done_callback(self._forget)
+            for job in jobs:
+                image = input_of(job)
+                if image is None or id(job) in self._entries or self.used >= self.memory_budget:
+                    continue
+                self._entries[id(job)] = (job, self._executor.submit(self._prefetch, image))
+
+    def _forget(self, future):
+        if future.exception() is None and future.result() is not None:
+            with self._lock:
+                self.used -= future.result().size
+
+    def _prefetch(self, image):
+        prepared = prepare(image)
+        with self._lock:
+            if self.used + prepared.size > self.memory_budget:
+                return None
+            self.used += prepared.size
+        return prepared
+
+    def take(self, job):
+        # the job's prepared input, waiting for a prefetch in flight or fetching it now
+        with self._lock:
+            entry = self._entries.pop(id(job), None)
+        if entry is not None:
+            try:
+                prepared = entry[1].result()
+            except Exception:
+                prepared = None
+            if prepared is not None:
+                with self._lock:
+                    self.used -= prepared.size
+                    self.hits += 1
+                return prepared
+        with self._lock:
+            self.misses += 1
+        return prepare(input_of(job))
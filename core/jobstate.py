@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+QUEUED = 'queued'
+RUNNING = 'running'
+POSTPROCESSING = 'post-processing'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+# a job stays in these once it reaches them
+FINISHED = (DONE, FAILED, CANCELLED)
+# the stages that are timed, in lifecycle order
+STAGES = (QUEUED, RUNNING, POSTPROCESSING)
+
+
+class JobFailed(Exception):
+    """Raised by awaiting the handle of a job that failed or was cancelled."""
+
+
+class JobTimeline:
+    """Where a dream job is in its lifecycle and how long it spent in each stage.
+
+    A job that fails over to another backend goes back to queued and runs again,
+    the time of every pass through a stage is added up. completion is resolved
+    once the job is finished, from whichever thread finishes it.
+    """
+
+    __slots__ = ('state', 'since', 'spent', 'runs', 'outputs', 'completion', 'detached', 'generated_at')
+
+    def __init__(self):
+        self.state = QUEUED
+        self.since = time.monotonic()
+        self.spent = dict.fromkeys(STAGES, 0.0)
+        self.runs = 0
+        # (image, metadata) pairs recorded by the cog
+        self.outputs = []
+        self.completion = Future()
+        # handed off to the post-processing stage, which finishes it
+        self.detached = False
+        # when the Web UI handed back the result, the backend is free from then on
+        self.generated_at = None
+
+    def advance(self, state):
+        now = time.monotonic()
+        if self.state in self.spent:
+            self.spent[self.state] += now - self.since
+        if state == RUNNING:
+            self.runs += 1
+        elif state == POSTPROCESSING:
+            self.generated_at = now
+        self.state = state
+        self.since = now
+
+    @property
+    def finished(self):
+        return self.state in FINISHED
+
+
+class StageStats:
+    """Stage times and outcomes of the finished jobs, shown in /queue."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outcomes = dict.fromkeys(FINISHED, 0)
+        self.totals = dict.fromkeys(STAGES, 0.0)
+        self.longest = dict.fromkeys(STAGES, 0.0)
+
+    def record(self, timeline):
+        with self._lock:
+            self.outcomes[timeline.state] += 1
+            if timeline.state == CANCELLED:
+                # never ran, its queued time would only skew the averages
+                return
+            for stage, seconds in timeline.spent.items():
+                self.totals[stage] += seconds
+                self.longest[stage] = max(self.longest[stage], seconds)
+
+    def averages(self):
+        with self._lock:
+            finished = self.outcomes[DONE] + self.outcomes[FAILED]
+            return {stage: total / finished if finished else 0.0 for stage, total in self.totals.items()}
+
+
+class JobResult:
+    """What a finished job produced: base64 images with the metadata of each (infotext
+    for draws, the interrogate response for identify) and the time spent per stage."""
+
+    def __init__(self, job, timeline):
+        self.job = job
+        self.images = [image for image, _ in timeline.outputs]
+        self.metadata = [metadata for _, metadata in timeline.outputs]
+        self.timings = dict(timeline.spent)
+
+
+class JobHandle:
+    """Awaitable for a queued job, gives its JobResult or raises JobFailed."""
+
+    __slots__ = ('job', 'future')
+
+    def __init__(self, job):
+        self.job = job
+        self.future = job.timeline.completion
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
+
+    def done(self):
+        return self.future.done()
+
+
+stats = StageStats()
+_lock = threading.Lock()
+
+
+def start(job):
+    # a freshly queued job
+    job.timeline = JobTimeline()
+    return job.timeline
+
+
+def advance(job, state, error=None):
+    # move job to state, finished jobs stay where they are
+    with _lock:
+        timeline = getattr(job, 'timeline', None) or start(job)
+        if timeline.finished or timeline.state == state:
+            return timeline
+        timeline.advance(state)
+    if timeline.finished:
+        stats.record(timeline)
+        if state == DONE:
+            timeline.completion.set_result(JobResult(job, timeline))
+        else:
+            timeline.completion.set_exception(JobFailed(error or f'{type(job).__name__} {state}'))
+    return timeline
+
+
+def detach(job):
+    (getattr(job, 'timeline', None) or start(job)).detached = True
+
+
+def add_output(job, image, metadata=None):
+    # called by the cogs for every image they post
+    timeline = getattr(job, 'timeline', None) or start(job)
+    timeline.outputs.append((image, metadata))
+
+
+def state(job):
+    timeline = getattr(job, 'timeline', None)
+    return timeline.state if timeline is not None else None
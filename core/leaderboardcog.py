@@ -1,7 +1,27 @@
-import csv
-import os
 import discord
+from discord import option
 from discord.ext import commands
+from typing import Optional
+
+from core import leaderboardstore
+
+# /leaderboard choices -> store action and time window
+CATEGORIES = {
+    'Images': "Image_Count",
+    'Identifies': "Identify_Count",
+    'Animations': "Deforum_Count",
+    'Generates': "Generate_Count",
+    'Chats': "Chat_Count",
+}
+PERIODS = {'All time': None, 'Today': "day", 'This week': "week", 'This month': "month"}
+NOUNS = {
+    "Image_Count": ('image', None),
+    "Identify_Count": ('identify', 'identifies'),
+    "Deforum_Count": ('animation', None),
+    "Generate_Count": ('prompt', None),
+    "Chat_Count": ('chat', None),
+}
+
 
 class LeaderboardView(discord.ui.View):
     def __init__(self):
@@ -27,14 +47,6 @@ class LeaderboardCog(commands.Cog):
     async def on_ready(self):
         self.bot.add_view(LeaderboardView())
 
-    @staticmethod
-    def check_and_create_csv():
-        if not os.path.exists("leaderboard.csv"):
-            with open("leaderboard.csv", "w", newline='', encoding="utf-8") as csvfile:
-                fieldnames = ["User_ID", "Username", "Image_Count", "Identify_Count", "Deforum_Count", "Generate_Count", "Chat_Count"]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-
     @staticmethod
     def pluralize(value, singular, plural=None):
         if not plural:
@@ -46,61 +58,45 @@ class LeaderboardCog(commands.Cog):
             return plural
 
     @staticmethod
-    def update_leaderboard(user_id, username, action):
-        leaderboard_data = []
-        
-        #print(f' -- Updating {action} Leaderboard for {username} to ')
-
-        with open("leaderboard.csv", "r", newline='', encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                leaderboard_data.append(row)
-
-        user_exists = False
-        for entry in leaderboard_data:
-            if entry["User_ID"] == str(user_id):
-                entry[action] = str(int(entry[action]) + 1)
-                print(f' -- Updating {action} Leaderboard for {username} to {entry[action]}')
-                entry["Username"] = username
-                user_exists = True
-                break
-
-        if not user_exists:
-            new_entry = {"User_ID": str(user_id), "Username": username, "Image_Count": "0", "Identify_Count": "0", "Deforum_Count": "0", "Generate_Count": "0", "Chat_Count": "0"}
-            new_entry[action] = "1"
-            leaderboard_data.append(new_entry)
-
-        with open("leaderboard.csv", "w", newline='', encoding="utf-8") as csvfile:
-            fieldnames = ["User_ID", "Username", "Image_Count", "Identify_Count", "Deforum_Count", "Generate_Count", "Chat_Count"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for entry in leaderboard_data:
-                writer.writerow(entry)
+    def update_leaderboard(user_id, username, action, amount=1):
+        # buffered in memory, written to the leaderboard database every few seconds
+        leaderboardstore.store().increment(user_id, username, action, amount)
+        print(f' -- Adding {amount} to {action} Leaderboard for {username}')
 
     @commands.slash_command(name='leaderboard', description='Show the Leaderboard')
-    async def show_leaderboard(self, ctx):
+    @option(
+        'period',
+        str,
+        description='Which time window to rank.',
+        required=False,
+        choices=['All time', 'Today', 'This week', 'This month'],
+    )
+    @option(
+        'category',
+        str,
+        description='What to rank users by.',
+        required=False,
+        choices=list(CATEGORIES),
+    )
+    async def show_leaderboard(self, ctx, period: Optional[str] = 'All time', category: Optional[str] = 'Images'):
         print(f'/Leaderboard request from {ctx.author.name}')
 
         try:
-            leaderboard_data = []
-
-            with open("leaderboard.csv", "r", newline='', encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    # Validate data
-                    if 'Username' in row and all(k in row and row[k].isdigit() for k in ['Image_Count', 'Identify_Count', 'Deforum_Count', 'Generate_Count']):
-                        leaderboard_data.append(row)
-                    else:
-                        continue
-
-            # Sort the leaderboard_data by Image_Count
-            leaderboard_data.sort(key=lambda x: int(x["Image_Count"]), reverse=True)
+            action = CATEGORIES.get(category, "Image_Count")
+            window = PERIODS.get(period)
+            # Top 10, sorted by the database
+            leaderboard_data = leaderboardstore.store().top(10, action, window)
 
             # Create the leaderboard embed
-            embed = discord.Embed(title="🏆 Leaderboard 🏆", description="Top 10 Users by Images", color=0x00ff00)
+            title = "🏆 Leaderboard 🏆" if window is None else f"🏆 Leaderboard - {period} 🏆"
+            embed = discord.Embed(title=title, description=f"Top 10 Users by {category}", color=0x00ff00)
             for idx, entry in enumerate(leaderboard_data[:10]):  # Show top 10
-                value=f"{entry['Image_Count']} {self.pluralize(int(entry['Image_Count']), 'image')}, {entry['Identify_Count']} {self.pluralize(int(entry['Identify_Count']), 'identify', 'identifies')}, {entry['Deforum_Count']} {self.pluralize(int(entry['Deforum_Count']), 'animation')}, {entry['Generate_Count']} {self.pluralize(int(entry['Generate_Count']), 'prompt')}, {entry['Chat_Count']} {self.pluralize(int(entry['Chat_Count']), 'chat')}"
-                embed.add_field(name=f"{idx+1}. {entry['Username']}", value=value, inline=False)
+                if window is None:
+                    value=f"{entry['Image_Count']} {self.pluralize(int(entry['Image_Count']), 'image')}, {entry['Identify_Count']} {self.pluralize(int(entry['Identify_Count']), 'identify', 'identifies')}, {entry['Deforum_Count']} {self.pluralize(int(entry['Deforum_Count']), 'animation')}, {entry['Generate_Count']} {self.pluralize(int(entry['Generate_Count']), 'prompt')}, {entry['Chat_Count']} {self.pluralize(int(entry['Chat_Count']), 'chat')}"
+                else:
+                    singular, plural = NOUNS[action]
+                    value = f"{entry[action]} {self.pluralize(int(entry[action]), singular, plural)}"
+                embed.add_field(name=f"{idx+1}. {entry['Username'] or entry['User_ID']}", value=value, inline=False)
 
             await ctx.send_response(content=f'<@{ctx.author.id}>', embed=embed, view=LeaderboardView())
 
@@ -108,7 +104,5 @@ class LeaderboardCog(commands.Cog):
             await ctx.send_response(f"An error occurred!")
             print(f"An error occurred: {e}")
 
-LeaderboardCog.check_and_create_csv()
-
 def setup(bot):
     bot.add_cog(LeaderboardCog(bot))
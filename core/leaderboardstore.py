@@ -0,0 +1,193 @@
+import atexit
+import csv
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+ACTIONS = ("Image_Count", "Identify_Count", "Deforum_Count", "Generate_Count", "Chat_Count")
+# seconds between two writes of the buffered increments
+FLUSH_INTERVAL = 10
+# rolled up windows and how many of each are kept, older buckets are compacted away
+PERIODS = ("day", "week", "month")
+KEEP_BUCKETS = {"day": 35, "week": 15, "month": 13}
+COMPACT_INTERVAL = 3600
+
+
+def bucket_of(period, day):
+    # bucket label of a date: 2024-05-31, 2024-W22, 2024-05
+    if period == "day":
+        return day.isoformat()
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f'{year}-W{week:02d}'
+    return f'{day.year}-{day.month:02d}'
+
+
+def oldest_bucket(period, today):
+    # oldest bucket label still kept for the period
+    if period == "day":
+        return bucket_of(period, today - timedelta(days=KEEP_BUCKETS["day"] - 1))
+    if period == "week":
+        return bucket_of(period, today - timedelta(weeks=KEEP_BUCKETS["week"] - 1))
+    months = today.year * 12 + today.month - 1 - (KEEP_BUCKETS["month"] - 1)
+    return f'{months // 12}-{months % 12 + 1:02d}'
+
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+
+class LeaderboardStore:
+    """Leaderboard counters in SQLite: lifetime totals, one row per user, and per day/week/month
+    buckets so a windowed leaderboard only reads its top rows.
+
+    Increments are added up in memory per user and action and written in one transaction
+    every FLUSH_INTERVAL seconds and at exit, so counting an image never touches the disk.
+    """
+
+    def __init__(self, db_path, flush_interval=FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        columns = ', '.join(f'{action} INTEGER NOT NULL DEFAULT 0' for action in ACTIONS)
+        self._conn.execute(f'CREATE TABLE IF NOT EXISTS leaderboard (User_ID TEXT PRIMARY KEY, Username TEXT, {columns})')
+        # per user counts of one action in one day/week/month
+        self._conn.execute('CREATE TABLE IF NOT EXISTS leaderboard_buckets ('
+                           'period TEXT NOT NULL, bucket TEXT NOT NULL, action TEXT NOT NULL, User_ID TEXT NOT NULL, '
+                           'count INTEGER NOT NULL, PRIMARY KEY (period, bucket, action, User_ID))')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS leaderboard_buckets_top '
+                           'ON leaderboard_buckets (period, bucket, action, count DESC)')
+        self._conn.commit()
+        self._last_compact = 0.0
+        self._lock = threading.Lock()
+        # (user id, action, UTC day) -> amount not written yet, user id -> latest username
+        self._pending: dict[tuple, int] = {}
+        self._usernames: dict[str, str] = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_loop, name='leaderboard-store', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def increment(self, user_id, username, action, amount=1):
+        if action not in ACTIONS:
+            raise ValueError(f'Unknown leaderboard action {action}')
+        key = (str(user_id), action, _today())
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + amount
+            self._usernames[str(user_id)] = username
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            usernames, self._usernames = self._usernames, {}
+            try:
+                with self._conn:
+                    self._conn.executemany('INSERT INTO leaderboard (User_ID, Username) VALUES (?, ?) '
+                                           'ON CONFLICT (User_ID) DO UPDATE SET Username = excluded.Username',
+                                           list(usernames.items()))
+                    for (user_id, action, day), amount in pending.items():
+                        self._conn.execute(f'UPDATE leaderboard SET {action} = {action} + ? WHERE User_ID = ?',
+                                           (amount, user_id))
+                        self._conn.executemany('INSERT INTO leaderboard_buckets (period, bucket, action, User_ID, count) '
+                                               'VALUES (?, ?, ?, ?, ?) ON CONFLICT (period, bucket, action, User_ID) '
+                                               'DO UPDATE SET count = count + excluded.count',
+                                               [(period, bucket_of(period, day), action, user_id, amount)
+                                                for period in PERIODS])
+            except sqlite3.Error:
+                # keep the increments for the next try
+                for key, amount in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + amount
+                for user_id, username in usernames.items():
+                    self._usernames.setdefault(user_id, username)
+                raise
+            return len(pending)
+
+    def _flush_loop(self):
+        while not self._closed:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                if time.monotonic() - self._last_compact >= COMPACT_INTERVAL:
+                    self.compact()
+            except sqlite3.Error as e:
+                print(f'Could not save the leaderboard, will retry: {e}')
+
+    def compact(self, today=None):
+        # drop the buckets that fell out of their window, the lifetime totals keep everything
+        today = today or _today()
+        removed = 0
+        with self._lock, self._conn:
+            for period in PERIODS:
+                removed += self._conn.execute('DELETE FROM leaderboard_buckets WHERE period = ? AND bucket < ?',
+                                              (period, oldest_bucket(period, today))).rowcount
+        self._last_compact = time.monotonic()
+        return removed
+
+    def top(self, k=10, action="Image_Count", period=None):
+        # the k users with the most of action, lifetime or in the current day/week/month,
+        # as dicts with the CSV column names
+        if action not in ACTIONS:
+            raise ValueError(f'Unknown leaderboard action {action}')
+        self.flush()
+        with self._lock:
+            if period is None:
+                cursor = self._conn.execute(f'SELECT User_ID, Username, {", ".join(ACTIONS)} FROM leaderboard '
+                                            f'ORDER BY {action} DESC LIMIT ?', (k,))
+            else:
+                cursor = self._conn.execute(f'SELECT b.User_ID, l.Username, b.count AS {action} '
+                                            'FROM leaderboard_buckets b LEFT JOIN leaderboard l ON l.User_ID = b.User_ID '
+                                            'WHERE b.period = ? AND b.bucket = ? AND b.action = ? '
+                                            'ORDER BY b.count DESC LIMIT ?',
+                                            (period, bucket_of(period, _today()), action, k))
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def migrate_csv(self, csv_path):
+        # one-shot import of the old leaderboard.csv, renamed to .migrated afterwards
+        if not os.path.isfile(csv_path):
+            return 0
+        rows = []
+        with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                if not row.get('User_ID'):
+                    continue
+                counts = []
+                for action in ACTIONS:
+                    try:
+                        counts.append(int(row.get(action) or 0))
+                    except ValueError:
+                        counts.append(0)
+                rows.append((row['User_ID'], row.get('Username', ''), *counts))
+        with self._lock, self._conn:
+            self._conn.executemany(f'INSERT OR REPLACE INTO leaderboard (User_ID, Username, {", ".join(ACTIONS)}) '
+                                   f'VALUES ({", ".join("?" * (len(ACTIONS) + 2))})', rows)
+        os.replace(csv_path, csv_path + '.migrated')
+        print(f'Moved {len(rows)} leaderboard entries into {self.db_path}.')
+        return len(rows)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    # opened on first use, importing the old leaderboard.csv if there is one
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LeaderboardStore('resources/leaderboard.db')
+            _store.migrate_csv('leaderboard.csv')
+        return _store
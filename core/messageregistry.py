@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict
+
+from discord.utils import time_snowflake, utcnow
+
+# bot messages remembered across all channels, the oldest are forgotten first
+MAX_MESSAGES = 5000
+# ids long enough to be Discord user ids
+_ID_PATTERN = re.compile(r'\d{15,}')
+
+PROGRESS = 'progress'
+PONG = 'pong'
+OUTPUT = 'output'
+
+
+class TrackedMessage:
+    __slots__ = ('message_id', 'channel_id', 'kind', 'owner_ids', 'owner_name')
+
+    def __init__(self, message_id, channel_id, kind, owner_ids=(), owner_name=None):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.kind = kind
+        # user ids written in the content and the embed footer ("name#0000"), what ❌ deletion checks
+        self.owner_ids = set(owner_ids)
+        self.owner_name = owner_name
+
+    def owned_by(self, user_id, user_name):
+        return str(user_id) in self.owner_ids or (self.owner_name is not None and self.owner_name == user_name)
+
+    def to_json(self):
+        return [self.message_id, self.channel_id, self.kind, sorted(self.owner_ids), self.owner_name]
+
+
+class MessageRegistry:
+    """Bot message ids per channel and kind, and the last message seen in each channel.
+
+    Filled from gateway events and the bot's own sends, so the hot paths never have to
+    read the channel history or fetch a message to know what it is.
+    """
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        self._messages: OrderedDict[int, TrackedMessage] = OrderedDict()
+        self._by_channel: dict[tuple, list[int]] = {}
+        self._last: dict[int, int] = {}
+        # every bot message newer than this snowflake is known
+        self.complete_since = time_snowflake(utcnow())
+        self.dirty = False
+        self._autosave_task = None
+
+    def start_autosave(self, interval=60):
+        # on_ready fires again after reconnects, only start once
+        if self._autosave_task is None or self._autosave_task.done():
+            self._autosave_task = asyncio.get_running_loop().create_task(self.autosave(interval))
+
+    def track(self, message, kind, owner_ids=(), owner_name=None):
+        entry = self._messages.get(message.id)
+        if entry is None:
+            entry = TrackedMessage(message.id, message.channel.id, kind, owner_ids, owner_name)
+            self._messages[message.id] = entry
+            self._by_channel.setdefault((entry.channel_id, kind), []).append(message.id)
+            self._evict()
+        else:
+            entry.owner_ids.update(owner_ids)
+            entry.owner_name = entry.owner_name or owner_name
+            if entry.kind != kind:
+                self._unindex(entry)
+                entry.kind = kind
+                self._by_channel.setdefault((entry.channel_id, kind), []).append(message.id)
+        self.dirty = True
+        return entry
+
+    def observe(self, message, bot_user):
+        # called for every message the gateway delivers
+        self._last[message.channel.id] = message.id
+        if message.author != bot_user:
+            return
+        owner_ids = ()
+        if 'Queue' not in message.content:
+            owner_ids = _ID_PATTERN.findall(message.content)
+        owner_name = None
+        kind = OUTPUT
+        if message.embeds:
+            embed = message.embeds[0]
+            owner_name = embed.footer.text if embed.footer else None
+            title = embed.title or ''
+            if title.startswith('**Pong!** -'):
+                kind = PONG
+            elif title.endswith('Running Job Progression ────'):
+                kind = PROGRESS
+        existing = self._messages.get(message.id)
+        self.track(message, existing.kind if existing else kind, owner_ids, owner_name)
+
+    def get(self, message_id):
+        return self._messages.get(message_id)
+
+    def known(self, message_id):
+        # True when the message would be in the registry if the bot had posted it
+        return message_id in self._messages or message_id > self.complete_since
+
+    def ids(self, channel_id, kind):
+        return list(self._by_channel.get((channel_id, kind), ()))
+
+    def is_last(self, channel_id, message_id):
+        # unknown channels count as "at the bottom", nothing to move
+        last = self._last.get(channel_id)
+        return last is None or last == message_id
+
+    def forget(self, message_id):
+        entry = self._messages.pop(message_id, None)
+        if entry is not None:
+            self._unindex(entry)
+            self.dirty = True
+        return entry
+
+    def deleted(self, channel_id, message_id):
+        # raw delete event, the previous message of the channel is not known anymore
+        self.forget(message_id)
+        if self._last.get(channel_id) == message_id:
+            del self._last[channel_id]
+
+    def _unindex(self, entry):
+        ids = self._by_channel.get((entry.channel_id, entry.kind))
+        if ids is not None:
+            try:
+                ids.remove(entry.message_id)
+            except ValueError:
+                pass
+            if not ids:
+                del self._by_channel[(entry.channel_id, entry.kind)]
+
+    def _evict(self):
+        while len(self._messages) > MAX_MESSAGES:
+            message_id, entry = self._messages.popitem(last=False)
+            self._unindex(entry)
+            self.complete_since = max(self.complete_since, message_id)
+
+    def load(self):
+        if not self.file_path or not os.path.isfile(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f'Could not read {self.file_path}, starting with an empty message registry: {e}')
+            return
+        for message_id, channel_id, kind, owner_ids, owner_name in data.get('messages', []):
+            entry = TrackedMessage(message_id, channel_id, kind, owner_ids, owner_name)
+            self._messages[message_id] = entry
+            self._by_channel.setdefault((channel_id, kind), []).append(message_id)
+        self._evict()
+
+    def save(self):
+        if not self.file_path or not self.dirty:
+            return
+        data = {'messages': [entry.to_json() for entry in self._messages.values()]}
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.file_path)
+        self.dirty = False
+
+    async def autosave(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.save()
+            except OSError as e:
+                print(f'Could not save the message registry: {e}')
+
+
+# same folder as the channel settings (settings.path), not imported to avoid an import cycle
+registry = MessageRegistry('resources/tracked_messages.json')
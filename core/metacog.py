@@ -1,5 +1,6 @@
+import aiohttp
+import asyncio
 import discord
-import requests
 import random
 from PIL import Image
 from io import BytesIO
@@ -9,6 +10,7 @@ from discord.ext import commands
 from discord.ui import Button, View
 
 from core import settings
+from core import webuiclient
 from core.stablecog import StableCog
 
 
@@ -175,9 +177,8 @@ class MetaCog(commands.Cog):
 
         if init_url:
             try:
-                response = requests.get(init_url)
-                image_data = BytesIO(response.content)
-            except requests.RequestException:
+                image_data = BytesIO(await webuiclient.fetch(init_url))
+            except (aiohttp.ClientError, asyncio.TimeoutError, webuiclient.WebUIError):
                 await ctx.respond("🚫 Couldn't fetch image from the URL.", ephemeral=True)
                 return
         elif init_image:
@@ -0,0 +1,64 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from core import jobstate
+
+# threads decoding, encoding, saving and posting finished images
+POST_WORKERS = 2
+# jobs waiting for or in post-processing at once, a backend worker handing off more waits for a slot
+MAX_PENDING = 4
+
+
+class PostStage:
+    """CPU stage after generation: the backend worker hands off the images and takes its next job
+    while they are decoded, saved and posted here.
+
+    Buffering is bounded: submit blocks while max_pending hand-offs are in flight, so a slow
+    Discord or disk holds the GPU back instead of piling up images in memory. Handed off jobs
+    are finished (done/failed) by the stage once their post-processing ran.
+    """
+
+    def __init__(self, workers=POST_WORKERS, max_pending=MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='post-stage')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.waited = 0
+
+    def submit(self, jobs, function, *args):
+        for job in jobs:
+            jobstate.detach(job)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waited += 1
+            self._slots.acquire()
+        with self._lock:
+            self.pending += 1
+        try:
+            return self._executor.submit(self._run, jobs, function, args)
+        except RuntimeError:
+            # shutting down, nothing will run it
+            self._release()
+            raise
+
+    def _run(self, jobs, function, args):
+        error = None
+        try:
+            function(*args)
+        except Exception as e:
+            error = e
+            print(f'Post-processing failed: {e}')
+            traceback.print_exc()
+        finally:
+            self._release()
+        for job in jobs:
+            jobstate.advance(job, jobstate.DONE if error is None else jobstate.FAILED, error)
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+
+stage = PostStage()
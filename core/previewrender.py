@@ -0,0 +1,58 @@
+import asyncio
+import base64
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# previews are only looked at for a second or two, keep them small and cheap to upload
+MAX_BYTES = 256 * 1024
+MAX_SIDE = 768
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='preview')
+
+
+def render_preview(image_b64, max_bytes=MAX_BYTES, max_side=MAX_SIDE):
+    # base64 preview from the web ui -> JPEG bytes under max_bytes
+    image = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+    # Always convert to RGB to support PNGs with alpha channel
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    quality = 85
+    while True:
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality)
+        if buffer.tell() <= max_bytes:
+            return buffer.getvalue()
+        if quality > 45:
+            quality -= 15
+        else:
+            # still too big, shrink the picture itself
+            image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.BILINEAR)
+
+
+class PreviewRenderer:
+    """Renders the previews of one progress message in a worker thread, skipping unchanged frames."""
+
+    def __init__(self, max_bytes=MAX_BYTES, max_side=MAX_SIDE):
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.last_hash = None
+        self.last_bytes = None
+
+    async def render(self, image_b64):
+        # ready to send bytes, or None when the frame is the same as last time
+        frame_hash = hashlib.blake2b(image_b64.encode(), digest_size=16).digest()
+        if frame_hash == self.last_hash:
+            return None
+        loop = asyncio.get_running_loop()
+        self.last_bytes = await loop.run_in_executor(_executor, render_preview, image_b64, self.max_bytes, self.max_side)
+        self.last_hash = frame_hash
+        return self.last_bytes
+
+    def reset(self):
+        # the message holding the last frame is gone, the next frame has to be sent again
+        self.last_hash = None
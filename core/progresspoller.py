@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import aiohttp
+
+from core import settings
+from core import webuiclient
+
+# poll interval bounds in seconds, the interval follows the backend's eta in between
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 3.0
+
+
+class ProgressSnapshot:
+    """One parsed /sdapi/v1/progress answer."""
+
+    def __init__(self, data):
+        state = data.get('state') or {}
+        self.progress = data.get('progress') or 0
+        self.eta_relative = data.get('eta_relative') or 0
+        self.current_image = data.get('current_image')
+        self.textinfo = data.get('textinfo')
+        self.job = state.get('job') or ''
+        self.job_count = state.get('job_count') or 0
+        self.sampling_step = state.get('sampling_step') or 0
+        self.sampling_steps = state.get('sampling_steps') or 0
+        self.taken_at = time.time()
+
+    @property
+    def active(self):
+        return self.job != ''
+
+
+class Subscription:
+    """Receives the latest snapshot of a poller. Slow readers skip snapshots instead of queueing them."""
+
+    def __init__(self, poller):
+        self.poller = poller
+        self.latest = None
+        self._event = asyncio.Event()
+
+    def publish(self, snapshot):
+        self.latest = snapshot
+        self._event.set()
+
+    async def next(self, timeout=None):
+        # the next snapshot newer than the last one returned, None on timeout
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        return self.latest
+
+    def close(self):
+        self.poller.unsubscribe(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+
+class ProgressPoller:
+    """Polls one backend's progress while anyone is subscribed and fans the snapshots out."""
+
+    def __init__(self, url):
+        self.url = url
+        self.latest = None
+        self.interval = MAX_INTERVAL
+        self._subscribers: set[Subscription] = set()
+        self._task = None
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        self._subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    def _next_interval(self, snapshot):
+        # idle backends are polled slowly, short jobs more often so their progress is not missed
+        if not snapshot.active:
+            return MAX_INTERVAL
+        return min(MAX_INTERVAL, max(MIN_INTERVAL, snapshot.eta_relative / 20))
+
+    async def _run(self):
+        while self._subscribers:
+            try:
+                snapshot = ProgressSnapshot(await webuiclient.progress(self.url))
+            except (aiohttp.ClientError, asyncio.TimeoutError, webuiclient.WebUIError, ValueError):
+                await asyncio.sleep(MAX_INTERVAL)
+                continue
+            self.latest = snapshot
+            for subscription in list(self._subscribers):
+                subscription.publish(snapshot)
+            self.interval = self._next_interval(snapshot)
+            await asyncio.sleep(self.interval)
+
+
+pollers: dict[str, ProgressPoller] = {}
+
+
+def subscribe(url=None):
+    # must be called from the event loop
+    url = (url or settings.global_var.url).rstrip('/')
+    poller = pollers.get(url)
+    if poller is None:
+        poller = pollers[url] = ProgressPoller(url)
+    return poller.subscribe()
@@ -0,0 +1,100 @@
+import re
+
+# <lora:name:multi> / <hypernet:name:multi> tags, group 1 is the network name
+EXTRA_NET_TAG = re.compile(r'<(?:lora|hypernet):([^:]*):?.*?>')
+
+
+def _any_of(words):
+    # one pattern matching any of the words, None when there are none
+    if not words:
+        return None
+    # longest first so a word is never shadowed by its own prefix
+    return re.compile('|'.join(re.escape(word) for word in sorted(set(words), key=len, reverse=True)))
+
+
+def _names(choices):
+    # the web ui's /config choices are either names or [name, ...] lists
+    return (x[0] if isinstance(x, list) else x for x in choices)
+
+
+class PromptPipeline:
+    """Ban/ignore lists and extra network names prepared once per config or catalog load.
+
+    Gives the same results as the plain loops it replaces: the ban and ignore words are
+    lowercased up front and a single pattern tells whether any of them is in the prompt,
+    the per word loop only runs when one is. Network names are looked up in sets.
+    """
+
+    def __init__(self, ban_words=(), ignore_words=(), negative_prefixes=(), hyper_names=(), lora_names=()):
+        self.ban_words = [str(x.lower()) for x in ban_words]
+        self.ignore_words = [str(y.lower()) for y in ignore_words]
+        self.negative_prefixes = [str(z.lower()) for z in negative_prefixes]
+        self._ban_pattern = _any_of(self.ban_words)
+        self._ignore_pattern = _any_of(self.ignore_words)
+        self.hyper_names = frozenset(_names(hyper_names))
+        self.lora_names = frozenset(_names(lora_names))
+
+    def banned_word(self, prompt):
+        # first banned word of the list found in the prompt, None if there is none
+        if self._ban_pattern is None:
+            return None
+        lowered = prompt.lower()
+        if self._ban_pattern.search(lowered) is None:
+            return None
+        for x in self.ban_words:
+            if x in lowered:
+                return x
+
+    def remove_ignored(self, prompt):
+        if self._ignore_pattern is None or self._ignore_pattern.search(prompt.lower()) is None:
+            return prompt
+        lowered = prompt.lower()
+        for y in self.ignore_words:
+            if y in lowered:
+                prompt = prompt.replace(y, "")
+                lowered = prompt.lower()
+        return prompt
+
+    def prompt_mod(self, prompt, negative_prompt, prompt_prefix):
+        clean_negative_prompt = negative_prompt
+        # if any banned words are in prompt, return immediately
+        x = self.banned_word(prompt)
+        if x is not None:
+            return "Stop", x
+        # otherwise mod the prompt/negative prompt
+        if self.ignore_words or self.negative_prefixes or prompt_prefix:
+            prompt = self.remove_ignored(prompt)
+            prompt = ' '.join(prompt.split())
+            if prompt == '':
+                prompt = ' '
+            for z in self.negative_prefixes:
+                if z in negative_prompt.lower():
+                    clean_negative_prompt = clean_negative_prompt.replace(z, "")
+                else:
+                    negative_prompt = f"{z} {negative_prompt}"
+            # add prompt_prefix to the prompt
+            if prompt_prefix and not prompt.lower().startswith(prompt_prefix):
+                prompt = f"{prompt_prefix}, {prompt}"
+            return "Mod", prompt.strip(), negative_prompt.strip(), clean_negative_prompt.strip()
+        return "None"
+
+    def add_extra_net(self, prompt, extra_net, net_multi):
+        if extra_net in self.hyper_names and f'<hypernet:{extra_net}' not in prompt:
+            prompt += f' <hypernet:{extra_net}:{str(net_multi)}>'
+        if extra_net in self.lora_names and f'<lora:{extra_net}' not in prompt:
+            prompt += f' <lora:{extra_net}:{str(net_multi)}>'
+        return prompt
+
+    @staticmethod
+    def extra_net_dedup(prompt):
+        # ensures that if the same extra_net is found n+1 times in prompt
+        # then occurrences n > 1 are removed
+        clean_prompt = prompt
+        found = set()
+        for m in EXTRA_NET_TAG.finditer(prompt):
+            name = m.group(1)
+            if name in found:
+                clean_prompt = clean_prompt.replace(m.group(0), '')
+            else:
+                found.add(name)
+        return clean_prompt
@@ -1,4 +1,3 @@
-import aiohttp
 import asyncio
 import discord
 import re
@@ -6,12 +5,19 @@ import time
 from discord.ui import View, Button
 from threading import Thread
 
-from PIL import Image
 import io
-import base64
-import contextlib
 
+from core import jobstate
+from core import messageregistry
+from core import poststage
+from core import progresspoller
+from core import ratelimit
 from core import settings
+from core import webuiclient
+from core.backendpool import BackendPool
+from core.inputprefetch import InputPrefetcher
+from core.previewrender import PreviewRenderer
+from core.scheduler import JobScheduler, PRIORITY_NORMAL, PRIORITY_LOW
 
 
 # the queue object for txt2image and img2img
@@ -33,6 +39,8 @@ class DrawObject:
         self.sampler = sampler
         self.scheduler = scheduler
         self.seed = seed
+        # the seed the user was shown when the job was queued, self.seed changes if the job is merged into a batch
+        self.requested_seed = seed
         self.strength = strength
         self.init_image = init_image
         self.batch = batch
@@ -47,6 +55,28 @@ class DrawObject:
         self.view = view
         self.user_id = ctx.author.id
         self.is_done = False
+        # set by whoever queues the job when the seed was randomized, so it may be merged into a batch
+        self.coalescible = False
+        # jobs merged into this one by the worker, their images come out of the same request
+        self.coalesced = []
+
+    def set_seed(self, seed):
+        # the job's seed and the one its buttons re-roll with
+        self.seed = seed
+        job_tuple = list(self.view.input_tuple)
+        job_tuple[10] = seed
+        self.view.input_tuple = tuple(job_tuple)
+
+
+# draws sharing this key can be generated by one txt2img call, only the seeds differ
+def coalesce_key(job):
+    if not isinstance(job, DrawObject) or not job.coalescible:
+        return None
+    if job.init_image is not None or list(job.batch) != [1, 1] or job.adetailer == 'Details++':
+        return None
+    return (job.prompt, job.negative_prompt, job.data_model, job.width, job.height, job.steps,
+            str(job.guidance_scale), str(job.distilled_cfg_scale), job.sampler, job.scheduler,
+            job.styles, job.highres_fix, str(job.strength), job.clip_skip, job.adetailer)
 
 
 # the queue object for Deforum command
@@ -118,9 +148,10 @@ class PostObject:
 
 # view that holds the interrupt button for progress
 class ProgressView(View):
-    def __init__(self, user_id):
+    def __init__(self, user_id, backend_url=None):
         super().__init__(timeout=None)
         self.user_id = user_id
+        self.backend_url = backend_url or settings.global_var.url
 
     async def user_is_authorized(self, interaction):
         if str(interaction.user.id) == str(self.user_id):
@@ -138,8 +169,7 @@ class ProgressView(View):
             if not await self.user_is_authorized(interaction):
                 await interaction.response.send_message("You are not authorized to interrupt this job.", ephemeral=True)
                 return
-            s = settings.authenticate_user()
-            s.post(url=f'{settings.global_var.url}/sdapi/v1/interrupt')
+            await webuiclient.interrupt(self.backend_url)
             await interaction.response.edit_message(view=self)
         except Exception as e:
             await interaction.response.send_message("An error occurred: " + str(e), ephemeral=True)
@@ -153,8 +183,7 @@ class ProgressView(View):
             if not await self.user_is_authorized(interaction):
                 await interaction.response.send_message("You are not authorized to skip this job.", ephemeral=True)
                 return
-            s = settings.authenticate_user()
-            s.post(url=f'{settings.global_var.url}/sdapi/v1/skip')
+            await webuiclient.skip(self.backend_url)
             await interaction.response.edit_message(view=self)
         except Exception as e:
             await interaction.response.send_message("An error occurred: " + str(e), ephemeral=True)
@@ -169,22 +198,23 @@ class ProgressView(View):
             return
 
         # delete Draws jobs from user
-        GlobalQueue.queue = [
-            job for job in GlobalQueue.queue
-            if not (isinstance(job, DrawObject) and job.user_id == self.user_id)
-        ]
+        GlobalQueue.queue.cancel_user(self.user_id, DrawObject)
 
         await interaction.response.send_message("All pending draw jobs from you have been cancelled.", ephemeral=True)
 
 
-# any command that needs to wait on processing should use the dream thread
+# any command that needs to wait on processing goes through the queue, the backend workers pick jobs from it
 class GlobalQueue:
-    # progression lock and prioritys
-    progress_lock = asyncio.Lock()
+    # progression locks, one per channel and backend so jobs running side by side each show their progress
+    progress_locks: dict[tuple, asyncio.Lock] = {}
+    # live progress message id -> the job it follows
+    progress_jobs: dict[int, object] = {}
 
-    dream_thread = Thread()
     post_event_loop = asyncio.get_event_loop()
-    queue: list[DrawObject | UpscaleObject | IdentifyObject| DeforumObject] = []
+    queue = JobScheduler(key=coalesce_key)
+    pool = BackendPool(queue)
+    # init images of the next queued jobs, fetched while the current ones render
+    prefetcher = InputPrefetcher(queue)
 
     # new generate Queue
     generate_queue: list[GenerateObject] = []
@@ -194,11 +224,41 @@ class GlobalQueue:
     event_loop = asyncio.get_event_loop()
     post_queue: list[PostObject] = []
 
+    def start_workers():
+        GlobalQueue.queue.affinity_window = settings.global_var.model_affinity_window
+        GlobalQueue.pool.configure([settings.global_var.url] + settings.global_var.backend_urls)
+        GlobalQueue.pool.start(GlobalQueue.event_loop)
+
+    def is_busy():
+        # True when a new job would have to wait in the queue
+        return bool(GlobalQueue.queue) or GlobalQueue.pool.idle_workers() == 0
+
+    def failover(queue_object):
+        return GlobalQueue.pool.failover(queue_object)
+
     def get_queue_sizes():
         output = {}
         # Ajout d'un espace réservé pour "Queue Sizes" pour qu'il agisse comme un titre.
         output["General Queue Size"] = len(GlobalQueue.queue)
         output["Generate Queue Size"] = len(GlobalQueue.generate_queue)
+        output["Model switches avoided"] = GlobalQueue.queue.switches_avoided
+        outcomes = jobstate.stats.outcomes
+        stage_times = jobstate.stats.averages()
+        output["Jobs done/failed/cancelled"] = (f"{outcomes[jobstate.DONE]}/{outcomes[jobstate.FAILED]}/"
+                                                f"{outcomes[jobstate.CANCELLED]}")
+        output["Avg queued/running/post-processing"] = "/".join(
+            f"{stage_times[stage]:.1f}s" for stage in jobstate.STAGES)
+        output["Avg backend idle between jobs"] = f"{GlobalQueue.pool.idle_gap():.2f}s"
+        output["Post-processing pending"] = poststage.stage.pending
+        prefetcher = GlobalQueue.prefetcher
+        output["Input prefetch hits/misses"] = f"{prefetcher.hits}/{prefetcher.misses} ({prefetcher.used // 1024} KiB held)"
+        rate_stats = ratelimit.governor.stats()
+        output["Discord edits merged/dropped"] = f"{rate_stats['edits_merged']}/{rate_stats['edits_dropped']}"
+        output["Discord rate limits hit"] = rate_stats['rate_limited']
+        output["Settings cache hits/misses"] = f"{settings.settings_cache_stats['hits']}/{settings.settings_cache_stats['misses']}"
+        if len(GlobalQueue.pool.backends) > 1:
+            backends_info = [f"\n{url}: {state}" for url, state in GlobalQueue.pool.status().items()]
+            output["\n**Backends**"] = "".join(backends_info)
 
         # Mapping des types d'objets à leurs noms d'affichage
         display_names = {
@@ -210,7 +270,7 @@ class GlobalQueue:
 
         if GlobalQueue.queue:
             general_queue_info = []
-            for index, item in enumerate(GlobalQueue.queue[:5], start=1):
+            for index, item in enumerate(GlobalQueue.queue.peek(5), start=1):
                 item_info = f"\n{index}. {display_names.get(item.__class__.__name__, item.__class__.__name__)}"
                 if isinstance(item, DrawObject):
                     item_info += f" - Prompt: {item.prompt[:100] + '...' if len(item.prompt) > 100 else item.prompt}"
@@ -251,17 +311,30 @@ class GlobalQueue:
         return f"`[{''.join(bar)}]`"
 
     @staticmethod
-    async def handle_rate_limit(exception: discord.HTTPException, default_sleep=2):
-        if exception.status == 429:
-            #retry_after = float(exception.headers.get("Retry-After", default_sleep))
-            #await asyncio.sleep(retry_after)
-            ...
-            return True
-        return False
+    async def delete_tracked(channel, message_id):
+        # delete by id, no need to fetch the message first
+        messageregistry.registry.forget(message_id)
+        GlobalQueue.progress_jobs.pop(message_id, None)
+        try:
+            await channel.get_partial_message(message_id).delete()
+        except discord.NotFound:
+            pass
+
+    @staticmethod
+    def progress_lock(queue_object):
+        key = (queue_object.ctx.channel.id, getattr(queue_object, "backend_url", None) or settings.global_var.url)
+        return GlobalQueue.progress_locks.setdefault(key, asyncio.Lock())
+
+    @staticmethod
+    def progress_at_bottom(channel_id, message_id):
+        # live progress messages of other backends may sit below this one, together they are at the bottom
+        registry = messageregistry.registry
+        live = [msg_id for msg_id in registry.ids(channel_id, messageregistry.PROGRESS) if msg_id in GlobalQueue.progress_jobs]
+        return registry.is_last(channel_id, message_id) or any(registry.is_last(channel_id, msg_id) for msg_id in live)
 
     @staticmethod
     async def update_progress_message(queue_object):
-        async with GlobalQueue.progress_lock:
+        async with GlobalQueue.progress_lock(queue_object):
             ctx = getattr(queue_object, "ctx", None)
             #prompt = getattr(queue_object, "prompt", None)
 
@@ -282,158 +355,135 @@ class GlobalQueue:
             else:
                 short_prompt = prompt[:125] + "..." if len(prompt) > 125 else prompt
 
-            # check for an existing progression message, if yes delete the previous one
-            async for old_msg in ctx.channel.history(limit=25):
-                if old_msg.embeds:
-                    if old_msg.embeds[0].title == "        ──── Running Job Progression ────":
-                        await old_msg.delete()
+            # check for an existing progression message, if yes delete the previous one.
+            # Progress messages of jobs still running on other backends stay
+            for old_msg_id in messageregistry.registry.ids(ctx.channel.id, messageregistry.PROGRESS):
+                old_job = GlobalQueue.progress_jobs.get(old_msg_id)
+                if old_job is None or getattr(old_job, "is_done", True):
+                    await GlobalQueue.delete_tracked(ctx.channel, old_msg_id)
 
             # send first message to discord, Initialization
             embed = discord.Embed(title="Initialization...", color=discord.Color.blue())
-            view = ProgressView(queue_object.user_id)
-
-            progress_msg = await ctx.send(embed=embed, view=view)
-
-            # Progress loop
-            while not queue_object.is_done:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get("http://127.0.0.1:7860/sdapi/v1/progress?skip_current_image=false") as response:
-
-                        # Handle potential rate limit by Discord
-                        try:
-                            await progress_msg.edit(embed=embed, view=view)
-                        except discord.HTTPException as e:
-                            if await GlobalQueue.handle_rate_limit(e):
-                                continue
-
-                        data = await response.json()
-                        try:
-                            progress = round(data["progress"] * 100)
-                            job = data['state']['job']
-
-                            # Parsing the 'job' string to get the current and total number of batches
-                            match = re.search(r'Batch (\d+) out of (\d+)', job)
-                            if match:
-                                current_batch, total_batches = map(int, match.groups())
-                            else:
-                                current_batch, total_batches = 1, 1
-
-                            progress_bar = GlobalQueue.create_progress_bar(progress, total_batches=total_batches)
-                            eta_relative = round(data["eta_relative"])
-                            if prompt:
-                                short_prompt = prompt[:125] + "..." if len(prompt) > 125 else prompt
-                            else:
-                                short_prompt = "No prompt"
-                            sampling_step = data['state']['sampling_step']
-                            sampling_steps = data['state']['sampling_steps']
-                            queue_size = len(GlobalQueue.queue)
-
-                            image_file = None
-                            if data["current_image"] and data["current_image"].strip():
-                                try:
-                                    image_data = base64.b64decode(data["current_image"])
-                                    if not image_data:
-                                        #print("Error: image_data is empty after base64 decoding.")
-                                        image_file = None
-                                        await asyncio.sleep(2)
+            backend_url = getattr(queue_object, "backend_url", None) or settings.global_var.url
+            view = ProgressView(queue_object.user_id, backend_url)
+
+            progress_msg = await ratelimit.governor.send(ctx.channel, embed=embed, view=view)
+            messageregistry.registry.track(progress_msg, messageregistry.PROGRESS)
+            GlobalQueue.progress_jobs[progress_msg.id] = queue_object
+
+            # Progress loop, fed by the backend's shared progress poller
+            renderer = PreviewRenderer()
+            async with progresspoller.subscribe(backend_url) as subscription:
+                while not queue_object.is_done:
+                    snapshot = await subscription.next(timeout=5)
+                    if snapshot is None:
+                        continue
+                    try:
+                        progress = round(snapshot.progress * 100)
+                        job = snapshot.job
+
+                        # Parsing the 'job' string to get the current and total number of batches
+                        match = re.search(r'Batch (\d+) out of (\d+)', job)
+                        if match:
+                            current_batch, total_batches = map(int, match.groups())
+                        else:
+                            current_batch, total_batches = 1, 1
+
+                        progress_bar = GlobalQueue.create_progress_bar(progress, total_batches=total_batches)
+                        eta_relative = round(snapshot.eta_relative)
+                        if prompt:
+                            short_prompt = prompt[:125] + "..." if len(prompt) > 125 else prompt
+                        else:
+                            short_prompt = "No prompt"
+                        sampling_step = snapshot.sampling_step
+                        sampling_steps = snapshot.sampling_steps
+                        queue_size = len(GlobalQueue.queue)
+
+                        image_file = None
+                        if snapshot.current_image and snapshot.current_image.strip():
+                            try:
+                                # decoded and shrunk in a worker thread, None when the frame didn't change
+                                preview = await renderer.render(snapshot.current_image)
+                                if preview:
+                                    # ----------- SEED FIX -----------
+                                    if hasattr(queue_object, "seed"):
+                                        filename = f"{queue_object.seed}.jpeg"
+                                    elif hasattr(queue_object, "deforum_settings") and "seed" in queue_object.deforum_settings:
+                                        filename = f"{queue_object.deforum_settings['seed']}.jpeg"
                                     else:
-                                        image = Image.open(io.BytesIO(image_data))
-                                        #print("Preview image successfully decoded and opened (format:", image.format, ")")
-
-                                        # Always convert to RGB to support PNGs with alpha channel
-                                        if image.mode in ("RGBA", "P"):
-                                            image = image.convert("RGB")
-
-                                        new_width = int(image.width * 1.5)
-                                        new_height = int(image.height * 1.5)
-                                        image = image.resize((new_width, new_height), Image.LANCZOS)
-
-                                        with contextlib.ExitStack() as stack:
-                                            buffer = stack.enter_context(io.BytesIO())
-                                            image.save(buffer, 'JPEG')
-                                            buffer.seek(0)
-                                            # ----------- SEED FIX -----------
-                                            if hasattr(queue_object, "seed"):
-                                                filename = f"{queue_object.seed}.jpeg"
-                                            elif hasattr(queue_object, "deforum_settings") and "seed" in queue_object.deforum_settings:
-                                                filename = f"{queue_object.deforum_settings['seed']}.jpeg"
-                                            else:
-                                                filename = "preview.jpeg"
-                                            image_file = discord.File(fp=buffer, filename=filename)
-                                        #print("Preview image prepared for Discord")
-                                except Exception as e:
-                                    #print("Error while processing preview image:", repr(e))
-                                    image_file = None
-                            else:
-                                #print("No preview image found (current_image is empty)")
-                                await asyncio.sleep(2)
-
-                            # Adjust job output to the running task
-                            if job == "scripts_txt2img":
-                                job = "Batch 1 out of 1"
-                            elif job.startswith("task"):
-                                job = "Job running locally by the owner"
-                            elif job == "(unknown)":
-                                job = "Ultimate Upscale"
-                            elif job == "scripts_img2img":
-                                job = "Prepare img2img script"
-
-                            # Check recent messages and ensure the progress message is at the bottom
-                            latest_message = await ctx.channel.history(limit=1).flatten()
-                            latest_message = latest_message[0] if latest_message else None
-                            if latest_message and latest_message.id != progress_msg.id:
-                                await progress_msg.delete()
-                                progress_msg = await ctx.send(embed=embed, view=view)
-
-                            # Message update with fields
-                            embed = discord.Embed(
-                                title="──── Running Job Progression ────",
-                                color=discord.Color.random()
-                            )
-
-                            # Clear existing fields
-                            embed.clear_fields()
-
-                            # Add fields to the embed
-                            embed.add_field(name="**Prompt**", value=short_prompt, inline=False)
-                            embed.add_field(name="📊 Progress", value=f"{progress_bar} {progress}%", inline=False)
-                            embed.add_field(name="⏳ Remaining", value=f"{eta_relative} sec", inline=True)
-                            embed.add_field(name="🔍 Current Step", value=f"{sampling_step}/{sampling_steps} - {job}", inline=True)
-                            embed.add_field(name="👥 Queued Jobs", value=str(queue_size), inline=True)
-
-                            # Set the image in the embed
-                            embed.set_image(url=f"attachment://{queue_object.seed}.jpeg")
-
-                            # Edit the progress message
-                            await progress_msg.edit(embed=embed, file=image_file, view=view)
-
-                            # Wait to avoid being rate limited by Discord
-                            if isinstance(queue_object, DrawObject):
-                                await asyncio.sleep(2)
-                            elif isinstance(queue_object, DeforumObject):
-                                await asyncio.sleep(2)
-                            else:
-                                await asyncio.sleep(2)
-
-                        except Exception as e:
-                            pass
+                                        filename = "preview.jpeg"
+                                    image_file = discord.File(fp=io.BytesIO(preview), filename=filename)
+                            except Exception as e:
+                                #print("Error while processing preview image:", repr(e))
+                                image_file = None
+                        else:
+                            #print("No preview image found (current_image is empty)")
+                            await asyncio.sleep(2)
+
+                        # Adjust job output to the running task
+                        if job == "scripts_txt2img":
+                            job = "Batch 1 out of 1"
+                        elif job.startswith("task"):
+                            job = "Job running locally by the owner"
+                        elif job == "(unknown)":
+                            job = "Ultimate Upscale"
+                        elif job == "scripts_img2img":
+                            job = "Prepare img2img script"
+
+                        # Ensure the progress message is at the bottom, the last message id comes from gateway events
+                        if not GlobalQueue.progress_at_bottom(ctx.channel.id, progress_msg.id):
+                            await GlobalQueue.delete_tracked(ctx.channel, progress_msg.id)
+                            progress_msg = await ratelimit.governor.send(ctx.channel, embed=embed, view=view)
+                            messageregistry.registry.track(progress_msg, messageregistry.PROGRESS)
+                            GlobalQueue.progress_jobs[progress_msg.id] = queue_object
+                            renderer.reset()
+
+                        # Message update with fields
+                        embed = discord.Embed(
+                            title="──── Running Job Progression ────",
+                            color=discord.Color.random()
+                        )
+
+                        # Clear existing fields
+                        embed.clear_fields()
+
+                        # Add fields to the embed
+                        embed.add_field(name="**Prompt**", value=short_prompt, inline=False)
+                        embed.add_field(name="📊 Progress", value=f"{progress_bar} {progress}%", inline=False)
+                        embed.add_field(name="⏳ Remaining", value=f"{eta_relative} sec", inline=True)
+                        embed.add_field(name="🔍 Current Step", value=f"{sampling_step}/{sampling_steps} - {job}", inline=True)
+                        embed.add_field(name="👥 Queued Jobs", value=str(queue_size), inline=True)
+
+                        # Set the image in the embed
+                        embed.set_image(url=f"attachment://{queue_object.seed}.jpeg")
+
+                        # Edit the progress message, an unchanged preview stays attached from the last edit.
+                        # The governor paces edits per channel and waits out 429s
+                        if image_file is not None:
+                            await ratelimit.governor.edit(progress_msg, embed=embed, file=image_file, attachments=[], view=view)
+                        else:
+                            await ratelimit.governor.edit(progress_msg, embed=embed, view=view)
+
+                        # Wait to avoid being rate limited by Discord
+                        if isinstance(queue_object, DrawObject):
+                            await asyncio.sleep(2)
+                        elif isinstance(queue_object, DeforumObject):
+                            await asyncio.sleep(2)
+                        else:
+                            await asyncio.sleep(2)
+
+                    except Exception as e:
+                        pass
 
             # Done, delete the progress message
-            await progress_msg.delete()
-
-
-    def process_queue():
-        def start(target_queue: list[DrawObject | UpscaleObject | IdentifyObject | GenerateObject | DeforumObject]):
-            queue_object = target_queue.pop(0)
-            queue_object.cog.dream(GlobalQueue.event_loop, queue_object)
-
-        if GlobalQueue.queue:
-            start(GlobalQueue.queue)
+            await GlobalQueue.delete_tracked(ctx.channel, progress_msg.id)
 
 
-async def process_dream(self, queue_object: DrawObject | UpscaleObject | IdentifyObject | DeforumObject):
-    GlobalQueue.dream_thread = Thread(target=self.dream, args=(GlobalQueue.event_loop, queue_object))
-    GlobalQueue.dream_thread.start()
+async def process_dream(self, queue_object: DrawObject | UpscaleObject | IdentifyObject | DeforumObject,
+                        priority=PRIORITY_NORMAL):
+    # an idle backend worker picks it up right away. Await the returned handle for the images
+    GlobalQueue.queue.push(queue_object, priority)
+    return jobstate.JobHandle(queue_object)
 
 async def process_generate(generate_cog, queue_object: GenerateObject):
     GlobalQueue.generate_thread = Thread(target=generate_cog.dream, args=(
@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import discord
+
+# (burst, seconds to refill the burst) per channel and route, close to Discord's own per channel limits
+ROUTE_LIMITS = {
+    'send': (5, 5.0),
+    'edit': (5, 5.0),
+}
+# every request the bot makes, whatever the channel
+GLOBAL_LIMIT = (50, 1.0)
+MAX_RETRIES = 3
+
+
+class TokenBucket:
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds):
+        # Discord told us to back off, nobody gets a token until then
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+def _has_files(kwargs):
+    return kwargs.get('file') is not None or bool(kwargs.get('files'))
+
+
+class _PendingEdit:
+    def __init__(self, fields):
+        self.fields = fields
+        self.future = asyncio.get_running_loop().create_future()
+
+    def merge(self, fields):
+        # newest state wins, but keep an attachment the newer edit doesn't replace
+        if not _has_files(fields):
+            kept = {key: self.fields[key] for key in ('file', 'files', 'attachments') if key in self.fields}
+            fields = {**fields, **kept}
+        self.fields = fields
+
+
+class RateGovernor:
+    """Paces the bot's sends and edits per channel and route.
+
+    Edits to the same message that pile up while waiting for a token are merged, so only the
+    latest state goes out. 429 answers block the bucket for the Retry-After time before retrying.
+    """
+
+    def __init__(self):
+        self._buckets: dict[tuple, TokenBucket] = {}
+        self._global = TokenBucket(*GLOBAL_LIMIT)
+        self._pending_edits: dict[int, _PendingEdit] = {}
+        self.sent = 0
+        self.edits_sent = 0
+        self.edits_merged = 0
+        self.edits_dropped = 0
+        self.rate_limited = 0
+
+    def _bucket(self, channel_id, route):
+        key = (channel_id, route)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*ROUTE_LIMITS[route])
+        return bucket
+
+    async def _acquire(self, bucket):
+        await bucket.acquire()
+        await self._global.acquire()
+
+    @staticmethod
+    def _retry_after(exception):
+        try:
+            return float(exception.response.headers.get('Retry-After', 1))
+        except (AttributeError, TypeError, ValueError):
+            return 1.0
+
+    async def _call(self, bucket, func, **kwargs):
+        for attempt in range(MAX_RETRIES):
+            try:
+                return await func(**kwargs)
+            except discord.HTTPException as e:
+                # a file can't be read twice, let those fail like before
+                if e.status != 429 or attempt == MAX_RETRIES - 1 or _has_files(kwargs):
+                    raise
+                self.rate_limited += 1
+                bucket.block(self._retry_after(e))
+                await self._acquire(bucket)
+
+    async def send(self, channel, **kwargs):
+        bucket = self._bucket(channel.id, 'send')
+        await self._acquire(bucket)
+        message = await self._call(bucket, channel.send, **kwargs)
+        self.sent += 1
+        return message
+
+    async def edit(self, message, **fields):
+        pending = self._pending_edits.get(message.id)
+        if pending is not None:
+            # an edit for this message is already waiting, it will carry these fields instead
+            pending.merge(fields)
+            self.edits_merged += 1
+            return await asyncio.shield(pending.future)
+
+        pending = self._pending_edits[message.id] = _PendingEdit(fields)
+        bucket = self._bucket(message.channel.id, 'edit')
+        try:
+            try:
+                await self._acquire(bucket)
+            finally:
+                # from here on, new edits wait for the next token
+                del self._pending_edits[message.id]
+            result = await self._call(bucket, message.edit, **pending.fields)
+        except BaseException as e:
+            # message deleted, Discord error or cancelled: the merged edits go down with it
+            self.edits_dropped += 1
+            if isinstance(e, asyncio.CancelledError):
+                pending.future.cancel()
+            else:
+                pending.future.set_exception(e)
+                pending.future.exception()
+            raise
+        self.edits_sent += 1
+        pending.future.set_result(result)
+        return result
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'edits_sent': self.edits_sent,
+            'edits_merged': self.edits_merged,
+            'edits_dropped': self.edits_dropped,
+            'rate_limited': self.rate_limited,
+        }
+
+
+governor = RateGovernor()
@@ -0,0 +1,283 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+from core import jobstate
+
+# lower value = served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+def job_model(job):
+    # '' for jobs that run on whatever checkpoint is loaded (upscale, identify, default model)
+    return getattr(job, 'data_model', '') or ''
+
+
+def job_user_id(job):
+    # DrawObject/DeforumObject carry user_id, the other queue objects only have ctx
+    user_id = getattr(job, 'user_id', None)
+    if user_id is None:
+        try:
+            user_id = job.ctx.author.id
+        except AttributeError:
+            user_id = job.ctx.user.id
+    return user_id
+
+
+def _release(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Entry:
+    __slots__ = ('priority', 'seq', 'job', 'user_id', 'key', 'model', 'queued_at', 'active')
+
+    def __init__(self, priority, seq, job, user_id, key=None):
+        self.priority = priority
+        self.seq = seq
+        self.job = job
+        self.user_id = user_id
+        self.key = key
+        self.model = job_model(job)
+        self.queued_at = time.time()
+        self.active = True
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class JobScheduler:
+    """Priority queue for the dream jobs (draw, upscale, identify, deforum).
+
+    Jobs are ordered by priority, then by arrival. Every push returns a handle that can be
+    used to cancel the job in O(1); cancelled entries are dropped lazily when they reach the
+    top of the heap. A per-user index keeps the queue limit check O(1).
+
+    When a key function is given, jobs that return the same (non-None) key are indexed
+    together so a worker can take them along with the job it is about to run.
+
+    Workers pass the checkpoint their backend has loaded when asking for a job. Within the
+    best priority level, jobs for that checkpoint (or jobs that don't need one) are served
+    before the oldest job, unless the oldest job has already waited affinity_window seconds.
+    """
+
+    def __init__(self, key=None, affinity_window=60):
+        self._key = key
+        self.affinity_window = affinity_window
+        self.switches_avoided = 0
+        self._model_heaps: dict[str, list[_Entry]] = {}
+        self._heap: list[_Entry] = []
+        self._entries: dict[int, _Entry] = {}
+        self._user_jobs: dict[int, set[int]] = {}
+        self._keyed: dict[object, set[int]] = {}
+        self._counter = itertools.count()
+        self._stale = 0
+        self._lock = threading.RLock()
+        # (event loop, future) of the workers waiting for a job
+        self._waiters: list[tuple] = []
+        # called without arguments whenever a job is pushed or taken
+        self.listeners = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def __iter__(self):
+        # ordered snapshot, mostly for display purposes
+        with self._lock:
+            entries = sorted(self._entries.values())
+        return iter([entry.job for entry in entries])
+
+    def push(self, job, priority=PRIORITY_NORMAL):
+        with self._lock:
+            handle = next(self._counter)
+            self._insert(_Entry(priority, handle, job, job_user_id(job), self._job_key(job)))
+            job.job_handle = handle
+            job.job_priority = priority
+            jobstate.start(job)
+        self._notify()
+        return handle
+
+    def requeue(self, job):
+        # put a job back at its original place, e.g. when its backend went down before it could run
+        with self._lock:
+            jobstate.advance(job, jobstate.QUEUED)
+            self._insert(_Entry(job.job_priority, job.job_handle, job, job_user_id(job), self._job_key(job)))
+        self._notify()
+
+    async def get(self, timeout=None, model=None):
+        # pop for the backend workers, waits on the event loop and returns None on timeout
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            job = self.pop(model)
+            if job is not None:
+                self._notify()
+                return job
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        job = self.pop(model)
+        if job is not None:
+            self._notify()
+        return job
+
+    def _notify(self):
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f'Queue listener {listener} failed: {e}')
+
+    def pop(self, model=None):
+        with self._lock:
+            while self._heap and not self._heap[0].active:
+                heapq.heappop(self._heap)
+                self._stale -= 1
+            if not self._heap:
+                return None
+
+            head = self._heap[0]
+            if model and head.model not in (model, '') and self.affinity_window > 0 \
+                    and time.time() - head.queued_at < self.affinity_window:
+                entry = self._affine_entry(model, head.priority)
+                if entry is not None:
+                    if entry.model:
+                        self.switches_avoided += 1
+                    # still sitting in the main heap, dropped from there lazily
+                    self._discard(entry)
+                    self._trim(entry.model)
+                    return entry.job
+
+            heapq.heappop(self._heap)
+            self._forget(head)
+            self._trim(head.model)
+            return head.job
+
+    def peek(self, count=1):
+        with self._lock:
+            return [entry.job for entry in heapq.nsmallest(count, self._entries.values())]
+
+    def cancel(self, handle):
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return False
+            self._discard(entry)
+            jobstate.advance(entry.job, jobstate.CANCELLED)
+            return True
+
+    def cancel_user(self, user_id, job_type=None):
+        with self._lock:
+            cancelled = 0
+            for handle in list(self._user_jobs.get(user_id, ())):
+                entry = self._entries[handle]
+                if job_type is None or isinstance(entry.job, job_type):
+                    self._discard(entry)
+                    jobstate.advance(entry.job, jobstate.CANCELLED)
+                    cancelled += 1
+            return cancelled
+
+    def take_matching(self, job, limit):
+        # remove and return up to limit queued jobs sharing job's key and priority, oldest first
+        key = self._job_key(job)
+        if key is None or limit < 1:
+            return []
+        with self._lock:
+            handles = self._keyed.get(key)
+            if not handles:
+                return []
+            priority = getattr(job, 'job_priority', PRIORITY_NORMAL)
+            entries = sorted(entry for entry in (self._entries[handle] for handle in handles)
+                             if entry.priority == priority)[:limit]
+            for entry in entries:
+                self._discard(entry)
+            return [entry.job for entry in entries]
+
+    def user_count(self, user_id):
+        return len(self._user_jobs.get(user_id, ()))
+
+    def _affine_entry(self, model, priority):
+        # oldest job at this priority that needs no checkpoint switch
+        best = None
+        for name in (model, ''):
+            heap = self._trim(name)
+            if heap and heap[0].priority == priority and (best is None or heap[0] < best):
+                best = heap[0]
+        return best
+
+    def _trim(self, model):
+        # drop finished entries from the top of a model heap, forget the heap once it is empty
+        heap = self._model_heaps.get(model)
+        while heap and not heap[0].active:
+            heapq.heappop(heap)
+        if heap is not None and not heap:
+            del self._model_heaps[model]
+            return None
+        return heap
+
+    def _job_key(self, job):
+        if self._key is None:
+            return None
+        return self._key(job)
+
+    def _insert(self, entry):
+        heapq.heappush(self._heap, entry)
+        heapq.heappush(self._model_heaps.setdefault(entry.model, []), entry)
+        self._entries[entry.seq] = entry
+        self._user_jobs.setdefault(entry.user_id, set()).add(entry.seq)
+        if entry.key is not None:
+            self._keyed.setdefault(entry.key, set()).add(entry.seq)
+        self._wake()
+
+    def _wake(self):
+        # every waiting worker gets a look, the ones that find nothing wait again.
+        # Jobs may be pushed from other threads (a failover inside a running job)
+        waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_release, future)
+            except RuntimeError:
+                # the loop is closed, nobody is waiting anymore
+                pass
+
+    def _discard(self, entry):
+        # the heap slot stays behind until it is popped, unless too many of them pile up
+        self._forget(entry)
+        self._stale += 1
+        if self._stale > 64 and self._stale > len(self._heap) // 2:
+            self._heap = [e for e in self._heap if e.active]
+            heapq.heapify(self._heap)
+            self._stale = 0
+            self._model_heaps = {}
+            for e in self._heap:
+                self._model_heaps.setdefault(e.model, []).append(e)
+            for heap in self._model_heaps.values():
+                heapq.heapify(heap)
+
+    def _forget(self, entry):
+        entry.active = False
+        del self._entries[entry.seq]
+        handles = self._user_jobs.get(entry.user_id)
+        if handles is not None:
+            handles.discard(entry.seq)
+            if not handles:
+                del self._user_jobs[entry.user_id]
+        if entry.key is not None:
+            handles = self._keyed.get(entry.key)
+            if handles is not None:
+                handles.discard(entry.seq)
+                if not handles:
+                    del self._keyed[entry.key]
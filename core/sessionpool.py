@@ -0,0 +1,83 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core import settings
+
+
+class WebUISession(requests.Session):
+    """Keep-alive session for one Web UI. Logs in once and logs in again when a request comes back 401."""
+
+    def __init__(self, url, pool_size):
+        super().__init__()
+        self.url = url
+        self.logged_in = False
+        self._login_lock = threading.Lock()
+        self._local = threading.local()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        if settings.global_var.api_auth:
+            self.auth = (settings.global_var.api_user, settings.global_var.api_pass)
+        self.hooks['response'].append(self._reauth_hook)
+
+    def login(self):
+        with self._login_lock:
+            self._local.logging_in = True
+            try:
+                # do a check to see if --gradio-auth is set
+                if settings.global_var.gradio_auth is None:
+                    r = self.get(self.url + '/sdapi/v1/cmd-flags', timeout=10)
+                    settings.global_var.gradio_auth = r.status_code == 401
+
+                if settings.global_var.gradio_auth:
+                    login_payload = {
+                        'username': settings.global_var.username,
+                        'password': settings.global_var.password
+                    }
+                    self.post(self.url + '/login', data=login_payload, timeout=10)
+                else:
+                    self.post(self.url + '/login', timeout=10)
+                self.logged_in = True
+            finally:
+                self._local.logging_in = False
+
+    def _reauth_hook(self, response, *args, **kwargs):
+        # the login expired (web ui restarted, cookie dropped), log in and send the request once more
+        if response.status_code != 401 or getattr(self._local, 'logging_in', False) \
+                or getattr(response.request, '_aiya_retried', False):
+            return response
+        try:
+            self.login()
+        except requests.exceptions.RequestException:
+            return response
+        request = response.request.copy()
+        request._aiya_retried = True
+        self.cookies.update(response.cookies)
+        # prepare_cookies leaves an existing Cookie header alone, drop the stale one first
+        request.headers.pop('Cookie', None)
+        request.prepare_cookies(self.cookies)
+        return self.send(request, **kwargs)
+
+
+class SessionPool:
+    """One shared WebUISession per backend URL."""
+
+    def __init__(self):
+        self._sessions: dict[str, WebUISession] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        url = url.rstrip('/')
+        with self._lock:
+            session = self._sessions.get(url)
+            if session is None:
+                session = WebUISession(url, settings.global_var.session_pool_size)
+                self._sessions[url] = session
+        if not session.logged_in:
+            session.login()
+        return session
+
+
+sessions = SessionPool()
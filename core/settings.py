@@ -1,15 +1,20 @@
 import csv
 import discord
-import json
 import os
 import random
-import re
 import requests
+import threading
 import time
 import tomlkit
 from typing import Optional
 
+from core import autocomplete
+from core import catalog
 from core import queuehandler
+from core import sessionpool
+from core import settingsstore
+from core import statscounter
+from core.promptpipeline import PromptPipeline
 
 self = discord.Bot()
 dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -22,6 +27,10 @@ default_config = """# This is the config file. It's advisable to restart if any
 # The URL address to the AUTOMATIC1111 Web UI
 url = "http://127.0.0.1:7860"
 
+# Extra Web UI instances to spread jobs across, one worker per URL (example, ["http://127.0.0.1:7861"])
+# Leave empty to only use the URL above
+backend_urls = []
+
 # Credentials when using --share and --gradio-auth
 user = ""
 pass = ""
@@ -30,6 +39,9 @@ pass = ""
 apiuser = ""
 apipass = ""
 
+# Keep-alive connections kept open to each Web UI
+session_pool_size = 8
+
 # Whether or not to save outputs to disk ("True"/"False")
 save_outputs = "True"
 
@@ -39,6 +51,15 @@ dir = "outputs"
 # The limit of tasks a user can have waiting in queue (at least 1)
 queue_limit = 99
 
+# Queued draws with the same prompt and settings are merged into one batch of up to this many images (1 = off)
+coalesce_max_batch = 4
+
+# Seconds a job may be passed over so workers can keep serving the checkpoint already loaded (0 = strict order)
+model_affinity_window = 60
+
+# Seconds between two background refreshes of the model/LoRA/style lists from the Web UI (0 = only at startup)
+catalog_refresh_interval = 600
+
 # Whether or not buttons keep generating in batches ("True"/"False")
 batch_buttons = "True"
 
@@ -89,9 +110,15 @@ upscaler_1 = "ESRGAN_4x"
 """
 
 
+def _catalog_field(name):
+    # read through to the current catalog snapshot, swapped as a whole by core.catalog
+    return property(lambda self: getattr(catalog.current, name))
+
+
 # initialize global variables here
 class GlobalVar:
     url = ""
+    backend_urls = []
     dir = ""
     wait_message = []
     wait_message_prompt = []
@@ -108,21 +135,25 @@ class GlobalVar:
     api_auth = False
     api_user: Optional[str] = None
     api_pass: Optional[str] = None
-    model_info = {}
+    session_pool_size = 8
+    model_info = _catalog_field('model_info')
     size_range = range(192, 2048, 1)
     size_range_exceed = 2048
-    sampler_names = []
-    scheduler_names = []
-    style_names = {}
+    sampler_names = _catalog_field('sampler_names')
+    scheduler_names = _catalog_field('scheduler_names')
+    style_names = _catalog_field('style_names')
     embeddings_1 = []
     embeddings_2 = []
-    hyper_names = []
-    lora_names = []
-    extra_nets = []
-    upscaler_names = []
-    hires_upscaler_names = []
+    hyper_names = _catalog_field('hyper_names')
+    lora_names = _catalog_field('lora_names')
+    extra_nets = _catalog_field('extra_nets')
+    upscaler_names = _catalog_field('upscaler_names')
+    hires_upscaler_names = _catalog_field('hires_upscaler_names')
     save_outputs = "True"
     queue_limit = 1
+    coalesce_max_batch = 4
+    model_affinity_window = 60
+    catalog_refresh_interval = 600
     batch_buttons = "False"
     restrict_buttons = "True"
     quick_upscale_resize = 2.0
@@ -131,6 +162,7 @@ class GlobalVar:
     display_ignored_words = "False"
     negative_prompt_prefix = []
     prompt_prefix = ""
+    prompt_pipeline = PromptPipeline()
 
 
 global_var = GlobalVar()
@@ -157,37 +189,30 @@ def batch_format(batch_string):
     return count, size, values_given
 
 
+def build_prompt_pipeline():
+    # call again whenever the ban/ignore lists or the extra network catalog change
+    global_var.prompt_pipeline = PromptPipeline(global_var.prompt_ban_list, global_var.prompt_ignore_list,
+                                                global_var.negative_prompt_prefix, global_var.hyper_names,
+                                                global_var.lora_names)
+
+
+def build_autocomplete_indexes():
+    # call again whenever the catalogs are refreshed
+    autocomplete.rebuild('models', global_var.model_info)
+    autocomplete.rebuild('samplers', global_var.sampler_names)
+    autocomplete.rebuild('schedulers', global_var.scheduler_names)
+    autocomplete.rebuild('styles', global_var.style_names)
+    autocomplete.rebuild('hypernets', global_var.hyper_names)
+    autocomplete.rebuild('loras', autocomplete.unique_names(global_var.lora_names))
+    autocomplete.rebuild('extra_nets', autocomplete.unique_names(global_var.extra_nets))
+    autocomplete.rebuild('upscalers', global_var.upscaler_names)
+    autocomplete.rebuild('hires_upscalers', [hires[0] if isinstance(hires, list) else hires
+                                             for hires in global_var.hires_upscaler_names])
+
+
 def prompt_mod(prompt, negative_prompt):
-    clean_negative_prompt = negative_prompt
-    prompt_prefix = global_var.prompt_prefix
-    #print(f'Prompt modification. Prompt_prefix = {prompt_prefix}')    
-    # if any banned words are in prompt, return immediately
-    if global_var.prompt_ban_list:
-        for x in global_var.prompt_ban_list:
-            x = str(x.lower())
-            if x in prompt.lower():
-                return "Stop", x    
-    # otherwise mod the prompt/negative prompt
-    if global_var.prompt_ignore_list or global_var.negative_prompt_prefix or global_var.prompt_prefix:
-        for y in global_var.prompt_ignore_list:
-            y = str(y.lower())
-            if y in prompt.lower():
-                prompt = prompt.replace(y, "")        
-        prompt = ' '.join(prompt.split())
-        if prompt == '':
-            prompt = ' '        
-        for z in global_var.negative_prompt_prefix:
-            z = str(z.lower())
-            if z in negative_prompt.lower():
-                clean_negative_prompt = clean_negative_prompt.replace(z, "")
-            else:
-                negative_prompt = f"{z} {negative_prompt}"        
-        # add prompt_prefix to the prompt
-        if prompt_prefix and not prompt.lower().startswith(prompt_prefix):
-            prompt = f"{prompt_prefix}, {prompt}"
-            #print(f'Prompt après modification. Prompt = {prompt}')        
-        return "Mod", prompt.strip(), negative_prompt.strip(), clean_negative_prompt.strip()    
-    return "None"
+    #print(f'Prompt modification. Prompt_prefix = {global_var.prompt_prefix}')
+    return global_var.prompt_pipeline.prompt_mod(prompt, negative_prompt, global_var.prompt_prefix)
 
 
 def extra_net_check(prompt, extra_net, net_multi):
@@ -203,35 +228,21 @@ def extra_net_check(prompt, extra_net, net_multi):
             net_multi = 0.85
     # figure out what extra_net was used
     if extra_net is not None and extra_net != 'None':
-        for network in global_var.hyper_names:
-            if extra_net == network and f'<hypernet:{extra_net}' not in prompt:
-                prompt += f' <hypernet:{extra_net}:{str(net_multi)}>'
-        for network in global_var.lora_names:
-            if extra_net == network and f'<lora:{extra_net}' not in prompt:
-                prompt += f' <lora:{extra_net}:{str(net_multi)}>'
+        prompt = global_var.prompt_pipeline.add_extra_net(prompt, extra_net, net_multi)
     return prompt, extra_net, net_multi
 
 
 def extra_net_dedup(prompt):
-    # ensures that if the same extra_net is found n+1 times in prompt
-    # then occurrences n > 1 are removed
-    cleanStr = prompt
-    found = []
-    for m in list(re.finditer(f'<(?:lora|hypernet):([^:]*):?.*?>', prompt)):
-        lora = m.group(1)
-        if lora in found:
-            cleanStr = cleanStr.replace(m.group(0), '')
-        else:
-            found.append(lora)
-    return cleanStr
+    return PromptPipeline.extra_net_dedup(prompt)
 
 
 def extra_net_defaults(prompt, channel):
     check(channel)
-    hypernet = read(channel)['hypernet']
-    hyper_multi = read(channel)['hyper_multi']
-    lora = read(channel)['lora']
-    lora_multi = read(channel)['lora_multi']
+    channel_settings = read(channel)
+    hypernet = channel_settings['hypernet']
+    hyper_multi = channel_settings['hyper_multi']
+    lora = channel_settings['lora']
+    lora_multi = channel_settings['lora_multi']
     # append channel default hypernet or lora to the prompt
     if hypernet != 'None' and hypernet not in prompt:
         prompt += f' <hypernet:{hypernet}:{hyper_multi}>'
@@ -252,20 +263,14 @@ def fuzzy_get_id_name(ctx):
 
 
 def queue_check(author_compare):
-    user_queue = 0
-    for queue_object in queuehandler.GlobalQueue.queue:
-        if queue_object.ctx.author.id == author_compare.id:
-            user_queue += 1
-            if user_queue >= global_var.queue_limit:
-                return "Stop"
+    user_queue = queuehandler.GlobalQueue.queue.user_count(author_compare.id)
+    if user_queue and user_queue >= global_var.queue_limit:
+        return "Stop"
 
 
-def stats_count(number):
-    with open(f'{path}stats.txt', 'r') as f:
-        data = list(map(float, f.readlines()))
-    data[0] += number
-    with open(f'{path}stats.txt', 'w') as f:
-        f.write('\n'.join(str(int(x)) for x in data))
+def stats_count(number, model=None):
+    # in memory, saved to stats.json in the background
+    statscounter.counter.add('images', number, model)
 
 
 def messages():
@@ -295,7 +300,7 @@ def check(channel_id):
         read(str(channel_id))
     except FileNotFoundError:
         build(str(channel_id))
-        print(f'This is a new channel!? Creating default settings file for this channel ({channel_id}).')
+        print(f'This is a new channel!? Saving default settings for this channel ({channel_id}).')
         # if models.csv has the blank "Default" data, update default settings
         with open(f'{path}models.csv', 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f, delimiter='|')
@@ -307,11 +312,13 @@ def check(channel_id):
 
 def config_auth(config):
     global_var.url = config['url']
+    global_var.backend_urls = [str(x).rstrip("/") for x in config['backend_urls']]
     global_var.dir = config['dir']
     global_var.username = config['user']
     global_var.password = config['pass']
     global_var.api_user = config['apiuser']
     global_var.api_pass = config['apipass']
+    global_var.session_pool_size = max(1, int(config['session_pool_size']))
 
 
 def generate_template(template_pop, config):
@@ -339,75 +346,95 @@ def generate_template(template_pop, config):
     return template_pop
 
 
+# channel id -> (overrides saved for the channel, template merged with them)
+_settings_cache = {}
+_settings_lock = threading.Lock()
+settings_cache_stats = {'hits': 0, 'misses': 0}
+_store = None
+
+
+def settings_store():
+    # opened on first use, moving any old per channel JSON files into it
+    global _store
+    with _settings_lock:
+        if _store is None:
+            _store = settingsstore.SettingsStore(f'{path}settings.db')
+            _store.migrate_json(path)
+        return _store
+
+
+def _cache_settings(channel_id, overrides):
+    settings = dict(template)
+    settings.update(overrides)
+    _settings_cache[channel_id] = (overrides, settings)
+    return settings
+
+
+def clear_settings_cache():
+    # the template changed, every merged copy is stale
+    with _settings_lock:
+        _settings_cache.clear()
+
+
 def build(channel_id):
-    settings = json.dumps(template, indent=1)
-    with open(path + channel_id + '.json', 'w') as configfile:
-        configfile.write(settings)
+    store = settings_store()
+    with _settings_lock:
+        store.put(channel_id, dict(template))
+        _cache_settings(channel_id, dict(template))
+
+
+def _load(channel_id):
+    # cached overrides and merged settings, the store is only read on a miss.
+    # Called with _settings_lock held, after settings_store() opened the store
+    cached = _settings_cache.get(channel_id)
+    if cached is not None:
+        settings_cache_stats['hits'] += 1
+        return cached
+
+    settings_cache_stats['misses'] += 1
+    overrides = _store.get(channel_id)
+    if overrides is None:
+        # check() relies on this for new channels
+        raise FileNotFoundError(f'No settings saved for channel {channel_id}')
+    _cache_settings(channel_id, overrides)
+    return _settings_cache[channel_id]
 
 
 def read(channel_id):
-    with open(path + channel_id + '.json', 'r') as configfile:
-        settings = dict(template)
-        settings.update(json.load(configfile))
-
-        # update deprecated 'count' to 'batch'
-        if 'count' in settings or 'max_count' in settings:
-            try:
-                settings['batch'] = str(settings.pop('count'))
-                settings['max_batch'] = str(settings.pop('max_count'))
-            except(Exception,):
-                pass
-            with open(path + channel_id + '.json', 'w') as configfile2:
-                json.dump(settings, configfile2, indent=1)
-        
-        global_var.prompt_prefix = settings.get('prompt_prefix', "").strip()  # Assurez-vous qu'il est chargé comme une chaîne propre
+    settings_store()
+    with _settings_lock:
+        settings = dict(_load(channel_id)[1])
+
+    global_var.prompt_prefix = settings.get('prompt_prefix', "").strip()  # Assurez-vous qu'il est chargé comme une chaîne propre
 
     return settings
 
 
 def update(channel_id: str, sett: str, value):
-    with open(path + channel_id + '.json', 'r') as configfile:
-        settings = json.load(configfile)
-    settings[sett] = value
-    with open(path + channel_id + '.json', 'w') as configfile:
-        json.dump(settings, configfile, indent=1)
-
+    store = settings_store()
+    with _settings_lock:
+        overrides = dict(_load(channel_id)[0])
+        overrides[sett] = value
+        store.put(channel_id, {sett: value})
+        _cache_settings(channel_id, overrides)
 
-def authenticate_user():
-    s = requests.Session()
-    if global_var.api_auth:
-        s.auth = (global_var.api_user, global_var.api_pass)
 
+def authenticate_user(url=None):
+    # shared keep-alive session for the backend, logged in once
+    url = url or global_var.url
     try:
-        # do a check to see if --gradio-auth is set
-        if global_var.gradio_auth is None:
-            r = s.get(global_var.url + '/sdapi/v1/cmd-flags', timeout=10)
-            if r.status_code == 401:
-                global_var.gradio_auth = True
-            else:
-                global_var.gradio_auth = False
-
-        if global_var.gradio_auth:
-            login_payload = {
-                'username': global_var.username,
-                'password': global_var.password
-            }
-            s.post(global_var.url + '/login', data=login_payload, timeout=10)
-        else:
-            s.post(global_var.url + '/login', timeout=10)
+        return sessionpool.sessions.get(url)
     except requests.exceptions.ConnectionError as e:
-        print(f"Error de conexión al intentar autenticarse con {global_var.url}: {e}")
+        print(f"Error de conexión al intentar autenticarse con {url}: {e}")
         print("Asegúrate de que la Web UI de Stable Diffusion esté ejecutándose en la URL configurada.")
         return None
     except requests.exceptions.Timeout as e:
-        print(f"Timeout al intentar autenticarse con {global_var.url}: {e}")
+        print(f"Timeout al intentar autenticarse con {url}: {e}")
         print("La Web UI de Stable Diffusion no responde. Verifica que esté ejecutándose.")
         return None
     except Exception as e:
         print(f"Error inesperado durante la autenticación: {e}")
         return None
-    
-    return s
 
 
 def get_env_var_with_default(var: str, default: str) -> str:
@@ -488,16 +515,6 @@ def startup_check():
             print(f'Waiting for Web UI at {global_var.url}...')
             time.sleep(20)
 
-def check_webui_running(global_var):
-    try:
-        response = requests.get(global_var.url + '/sdapi/v1/cmd-flags')
-        if response.status_code == 404:
-            print('API is unreachable! Please check the WebUI manually.')
-            return True
-    except Exception as e:
-        print(f'An exception occurred while checking if the WebUI is online:\ns{str(e)}')
-    return False
-
 def files_check():
     # load random messages for aiya to say
     with open(f'{path}messages.csv', encoding='UTF-8') as csv_file:
@@ -524,13 +541,9 @@ def files_check():
             global_var.wait_message_deforum_end.append(row[0])
     global_var.wait_message_deforum_end_count = len(global_var.wait_message_deforum_end) - 1
 
-    # creating files if they don't exist
-    if os.path.isfile(f'{path}stats.txt'):
-        pass
-    else:
-        print(f'Uh oh, stats.txt missing. Creating a new one.')
-        with open(f'{path}stats.txt', 'w') as f:
-            f.write('0')
+    # generation stats, carried over from stats.txt the first time
+    statscounter.counter.load()
+    statscounter.counter.start()
 
     header = ['display_name', 'model_full_name', 'activator_token']
     unset_model = ['Default', '', '']
@@ -572,10 +585,10 @@ def files_check():
         print(f"The folder for DIR doesn't exist! Creating folder at {global_var.dir}.")
         os.mkdir(global_var.dir)
 
-    populate_global_vars()
+    populate_global_vars(use_snapshot=True)
 
 
-def populate_global_vars():
+def populate_global_vars(use_snapshot=False):
     # update global vars with stuff from config
     with open(f'{path}config.toml', 'r') as fileObj:
         content = fileObj.read()
@@ -587,6 +600,9 @@ def populate_global_vars():
 
     global_var.save_outputs = config['save_outputs']
     global_var.queue_limit = config['queue_limit']
+    global_var.coalesce_max_batch = max(1, int(config['coalesce_max_batch']))
+    global_var.model_affinity_window = config['model_affinity_window']
+    global_var.catalog_refresh_interval = config['catalog_refresh_interval']
     global_var.batch_buttons = config['batch_buttons']
     global_var.restrict_buttons = config['restrict_buttons']
     global_var.quick_upscale_resize = config['quick_upscale_resize']
@@ -601,6 +617,16 @@ def populate_global_vars():
         global_var.size_range_exceed = [x for x in global_var.size_range]
         global_var.size_range = []
 
+    # the template and the ban/ignore lists may have changed above
+    catalog_changed()
+    catalog.add_listener(_on_catalog_swap)
+
+    # start from the last run's catalog right away, and check it against the Web UI in the background
+    snapshot = catalog.load_snapshot() if use_snapshot else None
+    if snapshot is not None:
+        catalog.apply(snapshot)
+        print('Loaded the model/LoRA/style lists from the last run, refreshing them in the background.')
+
     # create persistent session since we'll need to do a few API calls
     s = authenticate_user()
     
@@ -609,139 +635,21 @@ def populate_global_vars():
         print("Para usar todas las funciones, asegúrate de que la Web UI de Stable Diffusion esté ejecutándose.")
         return
 
-    # load many values from Web UI into global variables
-    try:
-        r1 = s.get(global_var.url + "/sdapi/v1/samplers", timeout=10)
-        r2 = s.get(global_var.url + "/sdapi/v1/prompt-styles", timeout=10)
-        #r3 = s.get(global_var.url + "/sdapi/v1/face-restorers")
-        #r4 = s.get(global_var.url + "/sdapi/v1/embeddings")
-        r5 = s.get(global_var.url + "/sdapi/v1/hypernetworks", timeout=10)
-        r6 = s.get(global_var.url + "/sdapi/v1/upscalers", timeout=10)
-        r7 = s.get(global_var.url + "/sdapi/v1/schedulers", timeout=10)
-        r = s.get(global_var.url + "/sdapi/v1/sd-models", timeout=10)
-    except requests.exceptions.ConnectionError as e:
-        print(f"Error de conexión al cargar datos de la Web UI: {e}")
-        print("Algunas funciones pueden no estar disponibles.")
-        return
-    except requests.exceptions.Timeout as e:
-        print(f"Timeout al cargar datos de la Web UI: {e}")
-        print("Algunas funciones pueden no estar disponibles.")
-        return
-    except Exception as e:
-        print(f"Error inesperado al cargar datos de la Web UI: {e}")
-        print("Algunas funciones pueden no estar disponibles.")
-        return
-    try:
-        for s1 in r1.json():
-            try:
-                global_var.sampler_names.append(s1['name'])
-            except(Exception,):
-                pass
-    except Exception as e:
-        print(f"Error al procesar samplers: {e}")
-    
-    global_var.style_names['None'] = ''
-    try:
-        for s2 in r2.json():
-            global_var.style_names[s2['name']] = s2['prompt'], s2['negative_prompt']
-    except Exception as e:
-        print(f"Error al procesar estilos: {e}")
-    
-    #for s4, shape in r4.json()['loaded'].items():
-    #    if shape['shape'] == 768:
-    #        global_var.embeddings_1.append(s4)
-    #    if shape['shape'] == 1024:
-    #        global_var.embeddings_2.append(s4)
-    #for s4, shape in r4.json()['skipped'].items():
-    #    if shape['shape'] == 768:
-    #        global_var.embeddings_1.append(s4)
-    #    if shape['shape'] == 1024:
-    #        global_var.embeddings_2.append(s4)
-    
-    try:
-        for s5 in r5.json():
-            global_var.hyper_names.append(s5['name'])
-    except Exception as e:
-        print(f"Error al procesar hypernetworks: {e}")
-    
-    try:
-        for s6 in r6.json():
-            global_var.upscaler_names.append(s6['name'])
-    except Exception as e:
-        print(f"Error al procesar upscalers: {e}")
-    
-    # schedulers endpoint can vary between backends (AUTOMATIC1111, SD.Next, etc.)
-    # Try to handle multiple JSON shapes so scheduler_names is populated whenever possible.
-    try:
-        schedulers_data = r7.json()
-        if isinstance(schedulers_data, list):
-            for item in schedulers_data:
-                if isinstance(item, dict):
-                    name = item.get('name') or item.get('label') or item.get('id') or item.get('value')
-                    if name:
-                        global_var.scheduler_names.append(str(name))
-                elif isinstance(item, str):
-                    global_var.scheduler_names.append(item)
-        elif isinstance(schedulers_data, dict):
-            for key, value in schedulers_data.items():
-                if isinstance(value, dict):
-                    name = value.get('name') or value.get('label') or key
-                else:
-                    name = key
-                if name:
-                    global_var.scheduler_names.append(str(name))
-    except Exception as e:
-        print(f"Error al procesar schedulers: {e}")
-    if 'SwinIR_4x' in global_var.upscaler_names:
-        template['upscaler_1'] = 'SwinIR_4x'
-
-    # create nested dict for models based on display_name in models.csv
-    # model_info[0] = display name (top level)
-    # model_info[1][0] = "title". this is sent to the API
-    # model_info[1][1] = name of the model
-    # model_info[1][2] = shorthash
-    # model_info[1][3] = activator token
-    try:
-        with open(f'{path}models.csv', encoding='utf-8') as csv_file:
-            model_data = list(csv.reader(csv_file, delimiter='|'))
-            for row in model_data[1:]:
-                for model in r.json():
-                    norm_csv_path = os.path.normpath(row[1])
-                    norm_api_path = os.path.normpath(model['filename'])
-                    if norm_csv_path.split(os.sep)[-1] == norm_api_path.split(os.sep)[-1] \
-                            or norm_csv_path.replace(os.sep, '_') == model['model_name']:
-                        global_var.model_info[row[0]] = model['title'], model['model_name'], model['hash'], row[2]
-                        break
-        # add "Default" if models.csv is on default, or if no model matches are found
-        if not global_var.model_info:
-            global_var.model_info[row[0]] = '', '', '', ''
-    except Exception as e:
-        print(f"Error al procesar modelos: {e}")
+    # load many values from Web UI into global variables, all endpoints at once
+    if snapshot is not None:
+        catalog.refresh_in_background(s)
+    else:
+        catalog.refresh(s)
+    # and keep checking it, new models and LoRAs show up without a restart
+    catalog.start_refresher(global_var.catalog_refresh_interval)
 
-    # iterate through config for anything unobtainable from API
-    try:
-        config_url = s.get(global_var.url + "/config", timeout=10)
-        old_config = config_url.json()
-    except Exception as e:
-        print(f"Error al obtener configuración de la Web UI: {e}")
-        old_config = {'components': []}
-    try:
-        for c in old_config['components']:
-            try:
-                if c['props']:
-                    if c['props']['elem_id'] == 'setting_sd_lora':
-                        global_var.lora_names = c['props']['choices']
-                    if c['props']['elem_id'] == 'txt2img_hr_upscaler':
-                        global_var.hires_upscaler_names = c['props']['choices']
-            except(Exception,):
-                pass
-    except(Exception,):
-        print("Trouble accessing Web UI config! I can't pull the LoRAs or High-res upscaler lists!")
-    # format some global lists, ensure default "None" options exist
-    if 'None' not in global_var.hyper_names:
-        global_var.hyper_names.insert(0, 'None')
-    if '' in global_var.lora_names:
-        global_var.lora_names.remove('')
-    global_var.extra_nets = global_var.hyper_names + global_var.lora_names
-    global_var.lora_names.insert(0, 'None')
-    global_var.hires_upscaler_names.insert(0, 'Disabled')
+
+def _on_catalog_swap(changes):
+    catalog_changed()
+
+
+def catalog_changed():
+    # the template, the lists behind the prompt pipeline and the catalogs may have changed
+    clear_settings_cache()
+    build_prompt_pipeline()
+    build_autocomplete_indexes()
@@ -3,6 +3,7 @@ from discord import option
 from discord.ext import commands
 from typing import Optional
 
+from core import autocomplete
 from core import settings
 
 
@@ -41,41 +42,10 @@ class SettingsCog(commands.Cog):
         ]
 
     def lora_autocomplete(self: discord.AutocompleteContext):
-        unique_loras = []
-        seen_none = False
-
-        for lora in settings.global_var.lora_names:
-            # Extraire la première valeur si c'est une liste
-            lora_name = lora[0] if isinstance(lora, list) else lora
-
-            # Vérifier si c'est 'None' et s'assurer qu'il n'est pas ajouté deux fois
-            if lora_name.lower() == "none":
-                if not seen_none:
-                    unique_loras.append(lora_name)
-                    seen_none = True
-            elif lora_name not in unique_loras:
-                unique_loras.append(lora_name)
-        
-        return unique_loras
+        return autocomplete.unique_names(settings.global_var.lora_names)
 
     def extra_net_autocomplete(self: discord.AutocompleteContext):
-        # Extraire la première valeur si c'est une liste, sinon conserver tel quel
-        unique_nets = []
-        seen_none = False
-
-        for network in settings.global_var.extra_nets:
-            # Extraire la première valeur si c'est une liste
-            net = network[0] if isinstance(network, list) else network
-
-            # Vérifier si c'est 'None' et s'assurer qu'il n'est pas ajouté deux fois
-            if net.lower() == "none":
-                if not seen_none:
-                    unique_nets.append(net)
-                    seen_none = True
-            elif net not in unique_nets:
-                unique_nets.append(net)
-        
-        return unique_nets
+        return autocomplete.unique_names(settings.global_var.extra_nets)
 
     def upscaler_autocomplete(self: discord.AutocompleteContext):
         return [
@@ -123,7 +93,7 @@ class SettingsCog(commands.Cog):
         str,
         description='Set default data model for image generation',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(model_autocomplete),
+        autocomplete=autocomplete.indexed('models'),
     )
     @option(
         'steps',
@@ -166,7 +136,7 @@ class SettingsCog(commands.Cog):
         str,
         description='Set default sampler for the channel',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(sampler_autocomplete),
+        autocomplete=autocomplete.indexed('samplers'),
     )
 
     @option(
@@ -174,35 +144,35 @@ class SettingsCog(commands.Cog):
         str,
         description='Set default scheduler for the channel',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(scheduler_autocomplete),
+        autocomplete=autocomplete.indexed('schedulers'),
     )
     @option(
         'styles',
         str,
         description='Apply a predefined style to the generation.',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(style_autocomplete),
+        autocomplete=autocomplete.indexed('styles'),
     )
     @option(
         'hypernet',
         str,
         description='Set default hypernetwork model for the channel',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(hyper_autocomplete),
+        autocomplete=autocomplete.indexed('hypernets'),
     )
     @option(
         'lora',
         str,
         description='Set default LoRA for the channel',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(lora_autocomplete),
+        autocomplete=autocomplete.indexed('loras'),
     )
     @option(
         'highres_fix',
         str,
         description='Set default highres fix model for the channel',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(hires_autocomplete),
+        autocomplete=autocomplete.indexed('hires_upscalers'),
     )
     @option(
         'clip_skip',
@@ -233,7 +203,7 @@ class SettingsCog(commands.Cog):
         str,
         description='Set default upscaler model for the channel.',
         required=True,
-        autocomplete=discord.utils.basic_autocomplete(upscaler_autocomplete),
+        autocomplete=autocomplete.indexed('upscalers'),
     )
     @option(
         'refresh',
@@ -313,15 +283,7 @@ class SettingsCog(commands.Cog):
 
         # run function to update global variables
         if refresh:
-            settings.global_var.model_info.clear()
-            settings.global_var.sampler_names.clear()
-            settings.global_var.scheduler_names.clear()
-            settings.global_var.style_names.clear()
-            settings.global_var.embeddings_1.clear()
-            settings.global_var.embeddings_2.clear()
-            settings.global_var.hyper_names.clear()
-            settings.global_var.lora_names.clear()
-            settings.global_var.upscaler_names.clear()
+            # the lists are rebuilt and swapped in, the old ones stay usable until then
             settings.populate_global_vars()
             embed.add_field(name=f'Refreshed!', value=f'Updated global lists', inline=False)
 
@@ -0,0 +1,136 @@
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# seconds between two commits of queued writes
+FLUSH_INTERVAL = 0.5
+
+_CHANNEL_FILE = re.compile(r'^(\d+)\.json$')
+# deprecated keys and the keys that replaced them
+LEGACY_KEYS = {'count': 'batch', 'max_count': 'max_batch'}
+
+
+class SettingsStore:
+    """Per channel settings in one SQLite database, one row per (channel, key).
+
+    Writes are queued and committed together by a background thread, reads see queued
+    writes right away. WAL mode lets the dream threads read while a batch is committed.
+    """
+
+    def __init__(self, db_path, flush_interval=FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS channel_settings ('
+                           'channel_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                           'PRIMARY KEY (channel_id, key))')
+        self._conn.commit()
+        self._rename_legacy_keys()
+        self._lock = threading.Lock()
+        self._pending: dict[str, dict] = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_loop, name='settings-store', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _rename_legacy_keys(self):
+        # rows saved under a deprecated key, a value saved under the new key wins
+        rows = self._conn.execute('SELECT channel_id, key, value FROM channel_settings WHERE key IN (%s)'
+                                  % ', '.join('?' * len(LEGACY_KEYS)), tuple(LEGACY_KEYS)).fetchall()
+        if not rows:
+            return
+        with self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO channel_settings (channel_id, key, value) VALUES (?, ?, ?)',
+                                   [(channel_id, LEGACY_KEYS[key], json.dumps(str(json.loads(value))))
+                                    for channel_id, key, value in rows])
+            self._conn.execute('DELETE FROM channel_settings WHERE key IN (%s)'
+                               % ', '.join('?' * len(LEGACY_KEYS)), tuple(LEGACY_KEYS))
+
+    def get(self, channel_id):
+        # the channel's saved settings, None for a channel that was never built
+        with self._lock:
+            rows = self._conn.execute('SELECT key, value FROM channel_settings WHERE channel_id = ?',
+                                      (channel_id,)).fetchall()
+            values = {key: json.loads(value) for key, value in rows}
+            pending = self._pending.get(channel_id)
+        if pending:
+            values.update(pending)
+        elif not rows:
+            return None
+        return values
+
+    def put(self, channel_id, values: dict):
+        with self._lock:
+            self._pending.setdefault(channel_id, {}).update(values)
+        self._wake.set()
+
+    def channels(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT DISTINCT channel_id FROM channel_settings').fetchall()
+            return sorted({row[0] for row in rows} | set(self._pending))
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return 0
+            rows = [(channel_id, key, json.dumps(value))
+                    for channel_id, values in self._pending.items() for key, value in values.items()]
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO channel_settings (channel_id, key, value) '
+                                       'VALUES (?, ?, ?)', rows)
+            self._pending.clear()
+            return len(rows)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f'Could not save channel settings, will retry: {e}')
+                self._wake.set()
+            # let more writes pile up into the next batch
+            time.sleep(self.flush_interval)
+
+    def migrate_json(self, folder):
+        # one-shot import of the old resources/<channel>.json files, renamed to .json.migrated afterwards
+        migrated = []
+        for name in os.listdir(folder):
+            match = _CHANNEL_FILE.match(name)
+            if not match:
+                continue
+            file_path = os.path.join(folder, name)
+            try:
+                with open(file_path, 'r') as configfile:
+                    values = json.load(configfile)
+            except (OSError, ValueError) as e:
+                print(f'Skipping {file_path} while migrating channel settings: {e}')
+                continue
+            # update deprecated 'count' to 'batch'
+            for key, new_key in LEGACY_KEYS.items():
+                if key in values:
+                    values[new_key] = str(values.pop(key))
+            self.put(match.group(1), values)
+            migrated.append(file_path)
+        if migrated:
+            self.flush()
+            for file_path in migrated:
+                os.replace(file_path, file_path + '.migrated')
+            print(f'Moved the settings of {len(migrated)} channels into {self.db_path}.')
+        return len(migrated)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self.flush()
+        self._conn.close()
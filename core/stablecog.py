@@ -17,13 +17,21 @@ from PIL import Image, PngImagePlugin
 from discord import option, OptionChoice
 from discord.ext import commands
 from typing import Optional
+from core import autocomplete
+from core import jobstate
+from core import poststage
 from core import queuehandler
 from core import viewhandler
 from core import settings
+from core import progresspoller
+from core import ratelimit
 from core import settingscog
+from core import webuiclient
 #from . import constants
 from core.queuehandler import GlobalQueue
 from core.leaderboardcog import LeaderboardCog
+from core.infotexts import response_infotexts
+from core.previewrender import PreviewRenderer
 from core.color_correction_sharpening import apply_color_correction
 #from core.persistence import save_message, load_all, delete_message
 
@@ -347,7 +355,7 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
         str,
         description='Select the data model for image generation.',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(settingscog.SettingsCog.model_autocomplete),
+        autocomplete=autocomplete.indexed('models'),
     )
     @option(
         'steps',
@@ -396,14 +404,14 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
         str,
         description='The sampling method to use for generation.',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(settingscog.SettingsCog.sampler_autocomplete),
+        autocomplete=autocomplete.indexed('samplers'),
     )
     @option(
         'scheduler',
         str,
         description='The schedule type to use for generation.',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(settingscog.SettingsCog.scheduler_autocomplete),
+        autocomplete=autocomplete.indexed('schedulers'),
     )
     @option(
         'seed',
@@ -416,7 +424,7 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
         str,
         description='Apply a predefined style to the generation.',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(settingscog.SettingsCog.style_autocomplete),
+        autocomplete=autocomplete.indexed('styles'),
     )
     @option(
         'random_style',
@@ -430,7 +438,7 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
         str,
         description='Apply an extra network to influence the output. To set multiplier, add :# (# = 0.0 - 1.0)',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(settingscog.SettingsCog.extra_net_autocomplete),
+        autocomplete=autocomplete.indexed('extra_nets'),
     )
     @option(
         'adetailer',
@@ -456,7 +464,7 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
         str,
         description='Tries to fix issues from generating high-res images. Recommended: 4x-UltraMix_Balanced.',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(settingscog.SettingsCog.hires_autocomplete),
+        autocomplete=autocomplete.indexed('hires_upscalers'),
     )
 
     @option(
@@ -661,13 +669,15 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
         else:
             print(f'/Draw request -- {ctx.author.name} -- Prompt: {prompt} -- Using model: {data_model}')
 
-        if seed == -1:
+        # a seed picked by us can be changed later, e.g. when the job gets merged into a batch
+        random_seed = seed == -1
+        if random_seed:
             seed = random.randint(0, 0xFFFFFFFF)
 
         # url *will* override init image for compatibility, can be changed here
         if init_url:
             try:
-                init_image = requests.get(init_url)
+                init_image = await webuiclient.fetch_image(init_url)
             except(Exception,):
                 await ctx.send_response('URL image not found!\nI will do my best without it!')
 
@@ -778,20 +788,25 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
             init_image, batch, styles, highres_fix, clip_skip, extra_net, epoch_time, adetailer, scheduler, distilled_cfg_scale)# poseref, ipadapter
 
         view = viewhandler.DrawView(input_tuple)
-        # setup the queue
+        # setup the queue, job_handle resolves with the images once the job is done
+        job_handle = None
         user_queue_limit = settings.queue_check(ctx.author)
-        if queuehandler.GlobalQueue.dream_thread.is_alive():
+        if queuehandler.GlobalQueue.is_busy():
             if user_queue_limit == "Stop":
                 await ctx.send_response(content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.", ephemeral=True)
             else:
-                queuehandler.GlobalQueue.queue.append(queuehandler.DrawObject(self, *input_tuple, view))
+                # infinite mode jobs yield to interactive requests
+                priority = queuehandler.PRIORITY_LOW if getattr(ctx, "_infinite_job", False) else queuehandler.PRIORITY_NORMAL
+                draw_object = queuehandler.DrawObject(self, *input_tuple, view)
+                draw_object.coalescible = random_seed
+                job_handle = await queuehandler.process_dream(self, draw_object, priority)
         else:
-            await queuehandler.process_dream(self, queuehandler.DrawObject(self, *input_tuple, view))
+            job_handle = await queuehandler.process_dream(self, queuehandler.DrawObject(self, *input_tuple, view))
 
         message_to_send = f'<@{ctx.author.id}>, {settings.messages()}\nQueue: ``{len(queuehandler.GlobalQueue.queue)}`` - ``{simple_prompt}``\nSteps: ``{steps}``{reply_adds}'
 
         # check if webui is online
-        webui_is_offline = settings.check_webui_running(settings.global_var)
+        webui_is_offline = await webuiclient.is_offline()
         if webui_is_offline:
             message_to_send += "\nNote: The model is currently offline. Your request won't be lost, it will be processed when it's back online !"
 
@@ -826,6 +841,7 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                 await ctx.respond(message_to_send)
             else:
                 await ctx.followup.send(message_to_send)
+        return job_handle
 
     @commands.slash_command(name='stopdraw', description='Stop infinite random generation')
     @commands.guild_only()
@@ -839,31 +855,44 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
 
     # === MODIF : helper pour la boucle infinie
     async def _infinite_loop(self, ctx: discord.ApplicationContext, **opts):
+        # the next prompt is written while the current job draws, the next job is queued the moment it ends
+        next_prompt = None
         try:
+            next_prompt = asyncio.ensure_future(self._infinite_prompt())
             while ctx.author.id in infinite_flags:
-                start_prompt = self.get_random_word('resources/random_prompts.csv')
-                generated_prompt = await self.generate_prompt_async(start_prompt)
+                generated_prompt = await next_prompt
                 async with infinite_enqueue_lock:
                     ctx._infinite_job = True
-                    await self.dream_handler(
+                    job_handle = await self.dream_handler(
                         ctx,
                         prompt=generated_prompt,
                         random_prompt=None,
                         **opts
                     )
                     delattr(ctx, "_infinite_job")
+                next_prompt = asyncio.ensure_future(self._infinite_prompt())
 
-                while queuehandler.GlobalQueue.dream_thread.is_alive():
+                if job_handle is None:
+                    # not queued (queue limit), try again in a moment
                     await asyncio.sleep(3)
-                print("Infinite job done, next one will start soon\n")
-
-                await asyncio.sleep(1)
+                    continue
+                try:
+                    await job_handle
+                    print("Infinite job done, starting the next one\n")
+                except jobstate.JobFailed as e:
+                    print(f"[InfiniteLoop] job failed for {ctx.author.id} : {e}")
 
         except Exception as e:
             print(f"[InfiniteLoop] erreur pour {ctx.author.id} : {e}")
         finally:
             # s’assure qu’on enlève le flag si erreur ou fin
             infinite_flags.discard(ctx.author.id)
+            if next_prompt is not None:
+                next_prompt.cancel()
+
+    async def _infinite_prompt(self):
+        start_prompt = self.get_random_word('resources/random_prompts.csv')
+        return await self.generate_prompt_async(start_prompt)
 
 
     # the function to queue Discord posts
@@ -874,7 +903,8 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
             if embed is not None and not isinstance(embed, (discord.Embed, list)):
                 embed = None
             try:
-                await post_queue_object.ctx.channel.send(
+                await ratelimit.governor.send(
+                    post_queue_object.ctx.channel,
                     content=post_queue_object.content,
                     file=post_queue_object.file,
                     embed=embed,
@@ -894,12 +924,14 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                         except Exception:
                             file_size_mb = None
                     mb = f"{file_size_mb:.2f}" if file_size_mb is not None else "unknown"
-                    await post_queue_object.ctx.channel.send(
-                        f"❌ Failed to send image: file size is {mb} MB, but it exceeds the server's allowed file size limit."
+                    await ratelimit.governor.send(
+                        post_queue_object.ctx.channel,
+                        content=f"❌ Failed to send image: file size is {mb} MB, but it exceeds the server's allowed file size limit."
                     )
                 else:
-                    await post_queue_object.ctx.channel.send(
-                        f"❌ An error occurred while sending the image: {str(e)}"
+                    await ratelimit.governor.send(
+                        post_queue_object.ctx.channel,
+                        content=f"❌ An error occurred while sending the image: {str(e)}"
                     )
 
         event_loop.create_task(send_message())
@@ -910,6 +942,8 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
     # generate the image
     def dream(self, event_loop: queuehandler.GlobalQueue.event_loop, queue_object: queuehandler.DrawObject):
     
+        backend_url = getattr(queue_object, "backend_url", None) or settings.global_var.url
+
         # start progression message
         run_coroutine_threadsafe(GlobalQueue.update_progress_message(queue_object), event_loop)
 
@@ -922,134 +956,109 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
             live_preview = settings.read(channel)['live_preview']
             
             status_message_task = None
-            status_thread = None
 
             if live_preview:
                 # Crear mensaje de estado inicial para live preview
-                status_message_task = event_loop.create_task(queue_object.ctx.channel.send(
+                status_message_task = run_coroutine_threadsafe(queue_object.ctx.channel.send(
                     f'**Author**: {user_id} ({user_name})\n'
                     f'**Prompt**: `{queue_object.prompt}`\n**Progress**: initialization...'
                     f'\n0/{queue_object.steps} iterations, 0.00 it/s'
-                    f'\n**ETA**: initialization...'))
-
-                # Función para actualizar progreso en tiempo real
-                def update_progress_worker():
-                    import threading
-                    import contextlib
-                    
-                    async def update_progress():
-                        tries = 0
-                        any_job = False
-                        tries_since_no_progress = 0
-                        last_file = None
-                        
-                        # Crear una nueva sesión para el thread
-                        session = settings.authenticate_user()
-                        
-                        # Pequeña pausa para asegurar que el mensaje se haya creado
-                        time.sleep(0.5)
-                        
+                    f'\n**ETA**: initialization...'), event_loop)
+
+                # Función para actualizar progreso en tiempo real, alimentada por el poller compartido del backend
+                async def update_progress():
+                    tries = 0
+                    any_job = False
+                    tries_since_no_progress = 0
+                    last_file = None
+                    renderer = PreviewRenderer()
+                    status_message = await asyncio.wrap_future(status_message_task)
+
+                    async with progresspoller.subscribe(backend_url) as subscription:
                         while not queue_object.is_done:
-                            try:
-                                progress_data = session.get(url=f'{settings.global_var.url}/sdapi/v1/progress').json()
-                                job_name = progress_data.get('state', {}).get('job', '')
-                                
-                                if job_name != '':
-                                    any_job = True
-                                    tries_since_no_progress = 0
-                                else:
-                                    if any_job:
-                                        if tries_since_no_progress >= 2:
-                                            break
-                                        tries_since_no_progress += 1
-                                    else:
-                                        if tries > 10:
-                                            break
-                                        tries += 1
-                                    
-                                    time.sleep(settings.global_var.preview_update_interval)
-                                    continue
-
-                                # Procesar imagen de preview si está disponible
-                                file = None
-                                if progress_data.get("current_image") is not None:
-                                    image = Image.open(io.BytesIO(base64.b64decode(progress_data["current_image"])))
-                                    
-                                    with contextlib.ExitStack() as stack:
-                                        buffer = stack.enter_context(io.BytesIO())
-                                        image.save(buffer, 'PNG')
-                                        buffer.seek(0)
-                                        filename = f'{queue_object.seed}.png'
-                                        if hasattr(queue_object, 'spoiler') and queue_object.spoiler:
-                                            filename = f'SPOILER_{queue_object.seed}.png'
-                                        fp = buffer
-                                        file = discord.File(fp, filename)
-                                        last_file = {
-                                            'name': filename,
-                                            'buffer': fp
-                                        }
-                                elif last_file is not None:
-                                    last_file['buffer'].seek(0)
-                                    file = discord.File(last_file['buffer'], last_file['name'])
-
-                                # Calcular iteraciones por segundo
-                                ips = '?'
-                                if progress_data.get("eta_relative", 0) != 0:
-                                    current_step = progress_data.get("state", {}).get("sampling_step", 0)
-                                    remaining_steps = queue_object.steps - current_step
-                                    ips = round(remaining_steps / progress_data["eta_relative"], 2)
-
-                                # Crear vista de progreso
-                                view = viewhandler.ProgressView()
-
-                                files = []
-                                if file is not None:
-                                    files = [file]
-
-                                # Actualizar mensaje de progreso
-                                try:
-                                    await status_message_task.result().edit(
-                                        content=f'**Author**: {user_id} ({user_name})\n'
-                                                f'**Prompt**: `{queue_object.prompt}`\n**Progress**: {round(progress_data.get("progress", 0) * 100, 2)}% '
-                                                f'\n{progress_data.get("state", {}).get("sampling_step", 0)}/{queue_object.steps} iterations, '
-                                                f'~{ips} it/s'
-                                                f'\n**ETA**: {round(progress_data.get("eta_relative", 0), 2)} seconds',
-                                        files=files, view=view)
-                                except Exception as edit_error:
-                                    print(f"Error editing progress message: {edit_error}")
-                                    break
-                                
-                                time.sleep(settings.global_var.preview_update_interval)
-                                
-                            except Exception as e:
-                                print('Error en update_progress:', str(e))
+                            progress_data = await subscription.next(timeout=10)
+                            if progress_data is None:
                                 if tries_since_no_progress >= 3:
                                     break
                                 tries_since_no_progress += 1
-                                time.sleep(settings.global_var.preview_update_interval)
-                    
-                    # Ejecutar la función de actualización de progreso
-                    event_loop.create_task(update_progress())
-
-                # Iniciar thread para actualización de progreso
-                status_thread = threading.Thread(target=update_progress_worker, daemon=True)
-                status_thread.start()
+                                continue
+
+                            if progress_data.active:
+                                any_job = True
+                                tries_since_no_progress = 0
+                            else:
+                                if any_job:
+                                    if tries_since_no_progress >= 2:
+                                        break
+                                    tries_since_no_progress += 1
+                                else:
+                                    if tries > 10:
+                                        break
+                                    tries += 1
+                                continue
+
+                            # Procesar imagen de preview si está disponible
+                            file = None
+                            preview = None
+                            if progress_data.current_image is not None:
+                                # rendered in a worker thread, None when the frame didn't change
+                                preview = await renderer.render(progress_data.current_image)
+                            if preview:
+                                filename = f'{queue_object.seed}.jpeg'
+                                if hasattr(queue_object, 'spoiler') and queue_object.spoiler:
+                                    filename = f'SPOILER_{queue_object.seed}.jpeg'
+                                last_file = {
+                                    'name': filename,
+                                    'bytes': preview
+                                }
+                                file = discord.File(io.BytesIO(preview), filename)
+                            elif last_file is not None:
+                                file = discord.File(io.BytesIO(last_file['bytes']), last_file['name'])
+
+                            # Calcular iteraciones por segundo
+                            ips = '?'
+                            if progress_data.eta_relative != 0:
+                                remaining_steps = queue_object.steps - progress_data.sampling_step
+                                ips = round(remaining_steps / progress_data.eta_relative, 2)
+
+                            # Crear vista de progreso
+                            view = viewhandler.ProgressView()
+
+                            files = []
+                            if file is not None:
+                                files = [file]
+
+                            # Actualizar mensaje de progreso
+                            try:
+                                await ratelimit.governor.edit(
+                                    status_message,
+                                    content=f'**Author**: {user_id} ({user_name})\n'
+                                            f'**Prompt**: `{queue_object.prompt}`\n**Progress**: {round(progress_data.progress * 100, 2)}% '
+                                            f'\n{progress_data.sampling_step}/{queue_object.steps} iterations, '
+                                            f'~{ips} it/s'
+                                            f'\n**ETA**: {round(progress_data.eta_relative, 2)} seconds',
+                                    files=files, view=view)
+                            except Exception as edit_error:
+                                print(f"Error editing progress message: {edit_error}")
+                                break
+
+                            await asyncio.sleep(settings.global_var.preview_update_interval)
+
+                run_coroutine_threadsafe(update_progress(), event_loop)
 
             # send normal payload to webui and only send model payload if one is defined
-            s = settings.authenticate_user()
+            s = settings.authenticate_user(backend_url)
             
             # Verificar que la sesión se haya creado correctamente
             if s is None:
+                # another backend may still be able to take the job
+                if GlobalQueue.failover(queue_object):
+                    return
                 error_msg = "❌ No se pudo conectar con la Web UI de Stable Diffusion. Verifica que esté ejecutándose."
                 event_loop.create_task(queue_object.ctx.channel.send(error_msg))
                 queue_object.is_done = True
                 return
 
-            # construct a payload for data model, then the normal payload
-            model_payload = {
-                "sd_model_checkpoint": queue_object.data_model
-            }
-
             #style_to_use = queue_object.styles
             #if "zavyyumexl" in queue_object.data_model.lower():
             #    style_to_use = "Yume Style"
@@ -1077,12 +1086,19 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                 ]
             }
 
+            # merged jobs come out of the same request, the web ui seeds image i with seed + i
+            if queue_object.coalesced:
+                for index, job in enumerate(queue_object.coalesced, start=1):
+                    job.set_seed(queue_object.seed + index)
+                payload["batch_size"] = len(queue_object.coalesced) + 1
+
 
 
 
             # update payload if init_img or init_url is used
             if queue_object.init_image is not None:
-                image = base64.b64encode(requests.get(queue_object.init_image.url, stream=True).content).decode('utf-8')
+                # usually downloaded and encoded while the previous job rendered
+                image = GlobalQueue.prefetcher.take(queue_object).b64
                 img_payload = {
                     "init_images": [
                         'data:image/png;base64,' + image
@@ -1117,8 +1133,15 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                 }
                 payload.update(highres_payload)
 
-            # add any options that would go into the override_settings
-            override_settings = {"CLIP_stop_at_last_layers": queue_object.clip_skip}
+            # checkpoint, backend options and CLIP skip ride along with the request instead of separate
+            # /options calls. They stay set afterwards, so only what the backend doesn't have yet is sent
+            sticky_settings = build_backend_options(queue_object, get_sd_backend())
+            sticky_settings.setdefault("img2img_extra_noise", 0.015 if "flux" in queue_object.data_model.lower() else 0.045)
+            if queue_object.data_model != '':
+                sticky_settings["sd_model_checkpoint"] = queue_object.data_model
+            sticky_settings["CLIP_stop_at_last_layers"] = queue_object.clip_skip
+            backend = GlobalQueue.pool.get(backend_url)
+            override_settings = backend.option_changes(s, sticky_settings) if backend is not None else sticky_settings
 
             alwayson_scripts_settings = {}
             
@@ -1221,7 +1244,8 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
 
             # update payload with override_settings
             override_payload = {
-                "override_settings": override_settings
+                "override_settings": override_settings,
+                "override_settings_restore_afterwards": False
             }
             payload.update(override_payload)
 
@@ -1231,74 +1255,12 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
             }
             payload.update(alwayson_scripts_payload)
 
-            if queue_object.data_model != '':
-                try:
-                    s.post(url=f'{settings.global_var.url}/sdapi/v1/options', json=model_payload)
-                except requests.exceptions.ConnectionError:
-                    print("Connection error. No response from API. (StableCog l.756)")
-                    error_msg = "❌ Error de conexión con la Web UI. Verifica que esté ejecutándose."
-                    event_loop.create_task(queue_object.ctx.channel.send(error_msg))
-                    queue_object.is_done = True
-                    return
-                except Exception as e:
-                    print(f"Error al configurar el modelo: {e}")
-                    error_msg = f"❌ Error al configurar el modelo: {e}"
-                    event_loop.create_task(queue_object.ctx.channel.send(error_msg))
-                    queue_object.is_done = True
-                    return
-
-            is_flux = "flux" in queue_object.data_model.lower()
-
-            # Gérer le preset
-            forge_preset = "flux" if is_flux else "sdxl"
-
-            # Gérer le storage dtype
-            if "nf4" in queue_object.data_model.lower():
-                forge_unet_storage_dtype = "bnb-fp4 (fp16 LoRA)"
-            else:
-                forge_unet_storage_dtype = "Automatic (fp16 LoRA)"
-
-            # Modules à charger
-            modules_dir = "C:\\Users\\wizz\\stable-diffusion\\stable-diffusion-webui-forge\\models\\text_encoder\\"
-            modules_to_load = [
-                modules_dir + "ViT-L-14-REG-GATED-balanced-ckpt12.safetensors"
-            ]
-            if is_flux:
-                modules_to_load += [
-                    modules_dir + "t5xxl_fp16.safetensors",
-                    modules_dir + "flux_vae.safetensors"
-                ]
-            else:
-                modules_to_load += [
-                    modules_dir + "sdxl_vae.safetensors"
-                ]
-
-            # Construire le payload options complet
-            forge_options_payload = {
-                "forge_preset": forge_preset,
-                "forge_additional_modules": modules_to_load,
-                "forge_unet_storage_dtype": forge_unet_storage_dtype,
-                "img2img_extra_noise": 0.015 if is_flux else 0.045
-            }
-
-            # Envoi la configuration à /options
-            try:
-                s.post(url=f'{settings.global_var.url}/sdapi/v1/options', json=forge_options_payload)
-            except requests.exceptions.ConnectionError:
-                print("Connection error. No response from API pour forge options.")
-                error_msg = "❌ Error de conexión al configurar Forge. Verifica que la Web UI esté ejecutándose."
-                event_loop.create_task(queue_object.ctx.channel.send(error_msg))
-                queue_object.is_done = True
-                return
-            except Exception as e:
-                print(f"Error al configurar Forge: {e}")
-                # Continuar sin configuración de Forge si hay error
-                pass
-
             if queue_object.init_image is not None:
                 try:
-                    response = s.post(url=f'{settings.global_var.url}/sdapi/v1/img2img', json=payload)
+                    response = s.post(url=f'{backend_url}/sdapi/v1/img2img', json=payload)
                 except requests.exceptions.ConnectionError:
+                    if GlobalQueue.failover(queue_object):
+                        return
                     error_msg = "❌ Error de conexión con la Web UI durante img2img. Verifica que esté ejecutándose."
                     event_loop.create_task(queue_object.ctx.channel.send(error_msg))
                     queue_object.is_done = True
@@ -1310,8 +1272,10 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                     return
             else:
                 try:
-                    response = s.post(url=f'{settings.global_var.url}/sdapi/v1/txt2img', json=payload)
+                    response = s.post(url=f'{backend_url}/sdapi/v1/txt2img', json=payload)
                 except requests.exceptions.ConnectionError:
+                    if GlobalQueue.failover(queue_object):
+                        return
                     error_msg = "❌ Error de conexión con la Web UI durante txt2img. Verifica que esté ejecutándose."
                     event_loop.create_task(queue_object.ctx.channel.send(error_msg))
                     queue_object.is_done = True
@@ -1322,6 +1286,13 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                     queue_object.is_done = True
                     return
 
+            # keep the options cache in step with what the backend now has
+            if backend is not None:
+                if response.ok:
+                    backend.remember_options(override_settings)
+                else:
+                    backend.forget_options()
+
             try:
                 response_data = response.json()
             except Exception as e:
@@ -1343,39 +1314,11 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                 queue_object.width = int(queue_object.width * custom_scale)
                 queue_object.height = int(queue_object.height * custom_scale)
 
-                # update the Extra Noise setting
-                response = requests.get(url=f'{settings.global_var.url}/sdapi/v1/options')
-
-                is_flux = "flux" in queue_object.data_model.lower()
-
-                # Adapt noise values to model type
-                if is_flux:
-                    default_extra_noise = 0.015
-                    default_initial_noise = 1
-                else:
-                    default_extra_noise = 0.045
-                    default_initial_noise = 1
-
-                if response.ok:
-                    current_options = response.json()
-                    original_extra_noise = current_options.get("img2img_extra_noise", default_extra_noise)
-                    original_initial_noise = current_options.get("initial_noise_multiplier", default_initial_noise)
-                    print(f"Original Extra Noise to restore after Details++: {original_extra_noise}")
-                    print(f"Original Initial Noise to restore after Details++: {original_initial_noise}")
-                else:
-                    print("Error retrieving options")
-
-                if is_flux:
-                    option_payload = {"img2img_extra_noise": 0, "initial_noise_multiplier": 1.02}
+                # Details++ noise settings only apply to the upscale passes, the web ui restores them after each request
+                if "flux" in queue_object.data_model.lower():
+                    noise_settings = {"img2img_extra_noise": 0, "initial_noise_multiplier": 1.02}
                 else:
-                    option_payload = {"img2img_extra_noise": 0, "initial_noise_multiplier": 1.11}
-
-                response = s.post(url=f'{settings.global_var.url}/sdapi/v1/options', json=option_payload)
-                if response.ok:
-                    print("Options updated successfully for Details++")
-                else:
-                    print("Error updating options")
-
+                    noise_settings = {"img2img_extra_noise": 0, "initial_noise_multiplier": 1.11}
 
                 for index, generated_image_base64 in enumerate(generated_images):
                     original_image = Image.open(io.BytesIO(base64.b64decode(generated_image_base64)))
@@ -1420,7 +1363,9 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                         ],
                         "init_images": [
                             generated_image_base64
-                        ]
+                        ],
+                        "override_settings": noise_settings,
+                        "override_settings_restore_afterwards": True
                     }
 
                     soft_inpainting_payload = {
@@ -1513,7 +1458,7 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                         #upscale_payload["alwayson_scripts"] = combined_alwayson_scripts_payload
 
                     # Send payload to img2img
-                    upscale_response = s.post(url=f'{settings.global_var.url}/sdapi/v1/img2img', json=upscale_payload)
+                    upscale_response = s.post(url=f'{backend_url}/sdapi/v1/img2img', json=upscale_payload)
                     if upscale_response.ok:
                         upscale_response_data = upscale_response.json()
                         upscaled_images = upscale_response_data.get("images")
@@ -1529,122 +1474,36 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
 
                 response_data["images"] = upscaled_images_data
 
-                # restore the original extra noise
-                restore_payload = {
-                    "img2img_extra_noise": original_extra_noise,
-                    "initial_noise_multiplier": original_initial_noise
-                }
-                response = requests.post(url=f'{settings.global_var.url}/sdapi/v1/options', json=restore_payload)
-                if response.ok:
-                    print(f"Options restored successfully to {original_extra_noise} & {original_initial_noise}")
-                else:
-                    print("Error restoring options")
-
             end_time = time.time()
 
-            # create safe/sanitized filename
-            keep_chars = (' ', '.', '_')
-            file_name = "".join(c for c in queue_object.simple_prompt if c.isalnum() or c in keep_chars).rstrip()
-            epoch_time = queue_object.epoch_time
-
-            # save local copy of image and prepare PIL images
+            # a coalesced batch holds one image per merged job, in the order of their seeds
             image_data = response_data['images']
-            if not image_data or len(image_data) == 0:
+            batch_jobs = [queue_object] + queue_object.coalesced
+            if len(image_data) < len(batch_jobs):
+                # merged jobs left without an image are requeued by the worker, with their own seed
+                print(f'Got {len(image_data)} image(s) for {len(batch_jobs)} merged draws, requeueing the rest')
+                batch_jobs = batch_jobs[:len(image_data)]
+            if not image_data:
                 print("[dream] No images generated in response_data['images']")
-                # Optionally: send a Discord error message
-                event_loop.create_task(queue_object.ctx.channel.send(
-                    "❌ Image generation failed (no image was returned by the model)."
-                ))
+                jobstate.advance(queue_object, jobstate.FAILED, 'the Web UI returned no image')
                 queue_object.is_done = True
-                return
-            
-            count = 0
-            image_count = len(image_data)
-            batch = False
-
-            # setup batch params
-            if queue_object.batch[0] > 1 or queue_object.batch[1] > 1:
-                batch = True
-                grids = []
-                images = []
-                aspect_ratio = queue_object.width / queue_object.height
-                num_grids = math.ceil(image_count / 25)
-                grid_count = 25 if num_grids > 1 else image_count
-                last_grid_count = image_count % 25
-                if num_grids > 1 and image_count % 25 == 0:
-                    last_grid_count = 25
-
-                if aspect_ratio <= 1:
-                    grid_cols = int(math.ceil(math.sqrt(grid_count)))
-                    grid_rows = math.ceil(grid_count / grid_cols)
-                    if last_grid_count > 0:
-                        last_grid_cols = int(math.ceil(math.sqrt(last_grid_count)))
-                        last_grid_rows = math.ceil(last_grid_count / last_grid_cols)
-                else:
-                    grid_rows = int(math.ceil(math.sqrt(grid_count)))
-                    grid_cols = math.ceil(grid_count / grid_rows)
-                    if last_grid_count > 0:
-                        last_grid_rows = int(math.ceil(math.sqrt(last_grid_count)))
-                        last_grid_cols = math.ceil(last_grid_count / last_grid_rows)
-
-                for i in range(num_grids):
-                    if i == num_grids:
-                        continue
-                    
-                    if i < num_grids - 1 or last_grid_count == 0:
-                        width = grid_cols * queue_object.width
-                        height = grid_rows * queue_object.height
-                    else: 
-                        width = last_grid_cols * queue_object.width
-                        height = last_grid_rows * queue_object.height
-                    image = Image.new('RGB', (width, height))
-                    grids.append(image)
-
-            for i in image_data:
-                count += 1
-                image = Image.open(io.BytesIO(base64.b64decode(i)))
-
-                # grab png info
-                png_payload = {
-                    "image": "data:image/png;base64," + i
-                }
-                png_response = s.post(url=f'{settings.global_var.url}/sdapi/v1/png-info', json=png_payload)
-
-                metadata = PngImagePlugin.PngInfo()
-                metadata.add_text("parameters", png_response.json().get("info"))
-                str_parameters = png_response.json().get("info")
-
-                file_path = f'{settings.global_var.dir}/{epoch_time}-{queue_object.seed}-{count}.png'
-
-                # if we are using a batch we need to save the files to disk
-                if settings.global_var.save_outputs == 'True' or batch == True:
-                    image.save(file_path, pnginfo=metadata)
-                    print(f'Saved image: {file_path}')
-
-                if batch == True:
-                    image_data = (image, file_path, str_parameters)
-                    images.append(image_data)
-
-                settings.stats_count(1)
-
-                # increment epoch_time for view when using batch
-                if count != len(image_data):
-                    new_epoch = list(queue_object.view.input_tuple)
-                    new_epoch[18] = int(time.time())
-                    new_tuple = tuple(new_epoch)
-                    queue_object.view.input_tuple = new_tuple
-
-                #if queue_object.poseref is not None or queue_object.ipadapter is not None:
-                #    break
-
-            # progression flag, job done
-            queue_object.is_done = True
+                run_coroutine_threadsafe(queue_object.ctx.channel.send(
+                    "❌ Image generation failed (no image was returned by the model)."), event_loop)
+            else:
+                # the images are in: decoding, saving and posting run on the post-processing stage
+                # while the worker hands the backend its next job
+                for job in batch_jobs:
+                    jobstate.advance(job, jobstate.POSTPROCESSING)
+                    job.is_done = True
+                infotexts = response_infotexts(response_data, len(image_data))
+                poststage.stage.submit(batch_jobs, self.finish_dream, event_loop, batch_jobs, image_data, infotexts,
+                                       start_time, end_time)
 
             # Eliminar mensaje de progreso si live_preview está habilitado
             if live_preview and status_message_task is not None:
                 def delete_progress_message():
                     try:
-                        event_loop.create_task(status_message_task.result().delete())
+                        run_coroutine_threadsafe(status_message_task.result().delete(), event_loop)
                     except Exception as e:
                         print(f"Error deleting progress message: {e}")
                 
@@ -1652,87 +1511,204 @@ class StableCog(commands.Cog, name='Stable Diffusion', description='Create image
                 delete_thread = threading.Thread(target=delete_progress_message, daemon=True)
                 delete_thread.start()
 
-            # update the leaderboard
-            batch_total = queue_object.batch[0] * queue_object.batch[1]
-            for _ in range(batch_total):
-                LeaderboardCog.update_leaderboard(queue_object.ctx.author.id, str(queue_object.ctx.author), "Image_Count")
+        except KeyError as e:
+            jobstate.advance(queue_object, jobstate.FAILED, e)
+            embed = discord.Embed(title='txt2img failed', description=f'An invalid parameter was found!\nKey causing the error: {e}',
+                                color=settings.global_var.embed_color)
+            event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
+        except Exception as e:
+            jobstate.advance(queue_object, jobstate.FAILED, e)
+            embed = discord.Embed(title='txt2img failed', description=f'{e}\n{traceback.print_exc()}',
+                                  color=settings.global_var.embed_color)
+            event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
 
-            # set up discord message
-            content = f'> for {queue_object.ctx.author.name}'
-            noun_descriptor = "drawing" if image_count == 1 else f'{image_count} drawings'
-            draw_time = '{0:.3f}'.format(end_time - start_time)
-            model_name = queue_object.data_model.split('.safetensors')[0]
-            message = f'my {noun_descriptor} of ``{queue_object.simple_prompt}`` with ``{model_name}`` took me ``{draw_time}`` seconds!'
+    # post-processing stage of a draw and of the draws merged into it
+    def finish_dream(self, event_loop, batch_jobs, image_data, infotexts, start_time, end_time):
+        try:
+            if len(batch_jobs) > 1:
+                job_infotexts = infotexts[-len(batch_jobs):] if infotexts else [None] * len(batch_jobs)
+                for job, job_image, job_infotext in zip(batch_jobs, image_data[-len(batch_jobs):], job_infotexts):
+                    self.post_dream(event_loop, job, [job_image], [job_infotext] if job_infotext is not None else None,
+                                    start_time, end_time)
+            else:
+                self.post_dream(event_loop, batch_jobs[0], image_data, infotexts, start_time, end_time)
+        except Exception as e:
+            for job in batch_jobs:
+                jobstate.advance(job, jobstate.FAILED, e)
+            embed = discord.Embed(title='txt2img failed', description=f'{e}\n{traceback.print_exc()}',
+                                  color=settings.global_var.embed_color)
+            run_coroutine_threadsafe(batch_jobs[0].ctx.channel.send(embed=embed), event_loop)
+
+    # save, count and post the images of one draw job
+    def post_dream(self, event_loop: queuehandler.GlobalQueue.event_loop, queue_object: queuehandler.DrawObject, image_data, infotexts, start_time, end_time):
+        # create safe/sanitized filename
+        keep_chars = (' ', '.', '_')
+        file_name = "".join(c for c in queue_object.simple_prompt if c.isalnum() or c in keep_chars).rstrip()
+        epoch_time = queue_object.epoch_time
+
+        # save local copy of image and prepare PIL images
+        if not image_data or len(image_data) == 0:
+            print("[dream] No images generated in response_data['images']")
+            # Optionally: send a Discord error message
+            event_loop.create_task(queue_object.ctx.channel.send(
+                "❌ Image generation failed (no image was returned by the model)."
+            ))
+            queue_object.is_done = True
+            return
+        
+        count = 0
+        image_count = len(image_data)
+        batch = False
+
+        # setup batch params
+        if queue_object.batch[0] > 1 or queue_object.batch[1] > 1:
+            batch = True
+            grids = []
+            images = []
+            aspect_ratio = queue_object.width / queue_object.height
+            num_grids = math.ceil(image_count / 25)
+            grid_count = 25 if num_grids > 1 else image_count
+            last_grid_count = image_count % 25
+            if num_grids > 1 and image_count % 25 == 0:
+                last_grid_count = 25
+
+            if aspect_ratio <= 1:
+                grid_cols = int(math.ceil(math.sqrt(grid_count)))
+                grid_rows = math.ceil(grid_count / grid_cols)
+                if last_grid_count > 0:
+                    last_grid_cols = int(math.ceil(math.sqrt(last_grid_count)))
+                    last_grid_rows = math.ceil(last_grid_count / last_grid_cols)
+            else:
+                grid_rows = int(math.ceil(math.sqrt(grid_count)))
+                grid_cols = math.ceil(grid_count / grid_rows)
+                if last_grid_count > 0:
+                    last_grid_rows = int(math.ceil(math.sqrt(last_grid_count)))
+                    last_grid_cols = math.ceil(last_grid_count / last_grid_rows)
+
+            for i in range(num_grids):
+                if i == num_grids:
+                    continue
+                
+                if i < num_grids - 1 or last_grid_count == 0:
+                    width = grid_cols * queue_object.width
+                    height = grid_rows * queue_object.height
+                else: 
+                    width = last_grid_cols * queue_object.width
+                    height = last_grid_rows * queue_object.height
+                image = Image.new('RGB', (width, height))
+                grids.append(image)
+
+        for i in image_data:
+            count += 1
+            image = Image.open(io.BytesIO(base64.b64decode(i)))
+
+            # the parameters come with the txt2img/img2img response, or from the PNG's own tEXt chunk
+            if infotexts:
+                str_parameters = infotexts[count - 1]
+            else:
+                str_parameters = image.info.get("parameters", "")
 
-            view = queue_object.view
+            metadata = PngImagePlugin.PngInfo()
+            metadata.add_text("parameters", str_parameters)
+            jobstate.add_output(queue_object, i, str_parameters)
 
-            if batch == True:
-                current_grid = 0
-                grid_index = 0
-                for grid_image in images:
-                    if grid_index >= grid_count:
-                        grid_index = 0
-                        current_grid += 1
-
-                    if current_grid < num_grids - 1 or last_grid_count == 0:
-                        grid_y, grid_x = divmod(grid_index, grid_cols)
-                        grid_x *= queue_object.width
-                        grid_y *= queue_object.height
-                    else:
-                        grid_y, grid_x = divmod(grid_index, last_grid_cols)
-                        grid_x *= queue_object.width
-                        grid_y *= queue_object.height
+            file_path = f'{settings.global_var.dir}/{epoch_time}-{queue_object.seed}-{count}.png'
 
-                    grids[current_grid].paste(grid_image[0], (grid_x, grid_y))
-                    grid_index += 1
+            # if we are using a batch we need to save the files to disk
+            if settings.global_var.save_outputs == 'True' or batch == True:
+                image.save(file_path, pnginfo=metadata)
+                print(f'Saved image: {file_path}')
 
-                
-                current_grid = 0
-                for grid in grids:
-                    if current_grid < num_grids -1 or last_grid_count == 0:
-                        id_start = current_grid * grid_count + 1
-                        id_end = id_start + grid_count - 1
-                    else:
-                        id_start = current_grid * grid_count + 1
-                        id_end = id_start + last_grid_count - 1
-                    filename=f'{queue_object.seed}-{current_grid}.png'
-                    file = add_metadata_to_image(grid,images[current_grid * 25][2], filename)
-                    if current_grid == 0:
-                        content = f'<@{queue_object.ctx.author.id}>, {message}\n Batch ID: {epoch_time}-{queue_object.seed}\n Image IDs: {id_start}-{id_end}'
-                    else:
-                        content = f'> for {queue_object.ctx.author.name}, use /info or context menu to retrieve.\n Batch ID: {epoch_time}-{queue_object.seed}\n Image IDs: {id_start}-{id_end}'
-                        view = None
-                        
+            if batch == True:
+                image_data = (image, file_path, str_parameters)
+                images.append(image_data)
+
+            settings.stats_count(1, queue_object.data_model)
+
+            # increment epoch_time for view when using batch
+            if count != len(image_data):
+                new_epoch = list(queue_object.view.input_tuple)
+                new_epoch[18] = int(time.time())
+                new_tuple = tuple(new_epoch)
+                queue_object.view.input_tuple = new_tuple
+
+            #if queue_object.poseref is not None or queue_object.ipadapter is not None:
+            #    break
+
+        # progression flag, job done
+        queue_object.is_done = True
+
+        # update the leaderboard
+        batch_total = queue_object.batch[0] * queue_object.batch[1]
+        LeaderboardCog.update_leaderboard(queue_object.ctx.author.id, str(queue_object.ctx.author), "Image_Count", batch_total)
+
+        # set up discord message
+        content = f'> for {queue_object.ctx.author.name}'
+        noun_descriptor = "drawing" if image_count == 1 else f'{image_count} drawings'
+        draw_time = '{0:.3f}'.format(end_time - start_time)
+        model_name = queue_object.data_model.split('.safetensors')[0]
+        message = f'my {noun_descriptor} of ``{queue_object.simple_prompt}`` with ``{model_name}`` took me ``{draw_time}`` seconds!'
+        # merged into a batch, the seed shown when it was queued isn't the one that drew it
+        if queue_object.seed != getattr(queue_object, 'requested_seed', queue_object.seed):
+            message += f'\nSeed: ``{queue_object.seed}`` (merged into a batch, replaces ``{queue_object.requested_seed}``)'
+
+        view = queue_object.view
+
+        if batch == True:
+            current_grid = 0
+            grid_index = 0
+            for grid_image in images:
+                if grid_index >= grid_count:
+                    grid_index = 0
                     current_grid += 1
-                    # post discord message
-                    queuehandler.process_post(
-                        self, queuehandler.PostObject(
-                            self, queue_object.ctx, content=content, file=file, embed='', view=view))
 
-            else:
-                content = f'<@{queue_object.ctx.author.id}>, {message}'
-                # Apply adaptive color correction + sharpening if Details++ is selected
-                if getattr(queue_object, "adetailer", None) == 'Details++':
-                    # Resize first (optionnel selon workflow)
-                    image = image.resize((int(queue_object.width * 0.75), int(queue_object.height * 0.75)))
-                    image = apply_color_correction(image)
-                filename = f'{queue_object.seed}-{count}.png'
-                file = add_metadata_to_image(image, str_parameters, filename)
+                if current_grid < num_grids - 1 or last_grid_count == 0:
+                    grid_y, grid_x = divmod(grid_index, grid_cols)
+                    grid_x *= queue_object.width
+                    grid_y *= queue_object.height
+                else:
+                    grid_y, grid_x = divmod(grid_index, last_grid_cols)
+                    grid_x *= queue_object.width
+                    grid_y *= queue_object.height
+
+                grids[current_grid].paste(grid_image[0], (grid_x, grid_y))
+                grid_index += 1
+
+            
+            current_grid = 0
+            for grid in grids:
+                if current_grid < num_grids -1 or last_grid_count == 0:
+                    id_start = current_grid * grid_count + 1
+                    id_end = id_start + grid_count - 1
+                else:
+                    id_start = current_grid * grid_count + 1
+                    id_end = id_start + last_grid_count - 1
+                filename=f'{queue_object.seed}-{current_grid}.png'
+                file = add_metadata_to_image(grid,images[current_grid * 25][2], filename)
+                if current_grid == 0:
+                    content = f'<@{queue_object.ctx.author.id}>, {message}\n Batch ID: {epoch_time}-{queue_object.seed}\n Image IDs: {id_start}-{id_end}'
+                else:
+                    content = f'> for {queue_object.ctx.author.name}, use /info or context menu to retrieve.\n Batch ID: {epoch_time}-{queue_object.seed}\n Image IDs: {id_start}-{id_end}'
+                    view = None
+                    
+                current_grid += 1
+                # post discord message
                 queuehandler.process_post(
                     self, queuehandler.PostObject(
                         self, queue_object.ctx, content=content, file=file, embed='', view=view))
 
-        except KeyError as e:
-            embed = discord.Embed(title='txt2img failed', description=f'An invalid parameter was found!\nKey causing the error: {e}',
-                                color=settings.global_var.embed_color)
-            event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
-        except Exception as e:
-            embed = discord.Embed(title='txt2img failed', description=f'{e}\n{traceback.print_exc()}',
-                                  color=settings.global_var.embed_color)
-            event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
-        
-        # check each queue for any remaining tasks
-        GlobalQueue.process_queue()
+        else:
+            content = f'<@{queue_object.ctx.author.id}>, {message}'
+            # Apply adaptive color correction + sharpening if Details++ is selected
+            if getattr(queue_object, "adetailer", None) == 'Details++':
+                # Resize first (optionnel selon workflow)
+                image = image.resize((int(queue_object.width * 0.75), int(queue_object.height * 0.75)))
+                image = apply_color_correction(image)
+            filename = f'{queue_object.seed}-{count}.png'
+            file = add_metadata_to_image(image, str_parameters, filename)
+            queuehandler.process_post(
+                self, queuehandler.PostObject(
+                    self, queue_object.ctx, content=content, file=file, embed='', view=view))
 
 
 def setup(bot):
@@ -0,0 +1,94 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# seconds between two saves of the counters
+FLUSH_INTERVAL = 30
+KINDS = ('images', 'upscales', 'identifies')
+
+
+class StatsCounter:
+    """Generation totals kept in memory, saved to a JSON file every FLUSH_INTERVAL seconds and at exit.
+
+    Counting is a locked addition, /stats reads the in-memory values. The file is written to a
+    temp file and renamed over the old one, so a crash never leaves it half written.
+    """
+
+    def __init__(self, file_path, legacy_path=None, flush_interval=FLUSH_INTERVAL):
+        self.file_path = file_path
+        self.legacy_path = legacy_path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._counts = {kind: 0 for kind in KINDS}
+        self._models: dict[str, int] = {}
+        self._dirty = False
+        self._thread = None
+
+    def load(self):
+        with self._lock:
+            if os.path.isfile(self.file_path):
+                with open(self.file_path, 'r') as f:
+                    data = json.load(f)
+                for kind in KINDS:
+                    self._counts[kind] = int(data.get(kind, 0))
+                self._models = {name: int(count) for name, count in data.get('models', {}).items()}
+            elif self.legacy_path and os.path.isfile(self.legacy_path):
+                # the old stats.txt only had the image total on its first line
+                with open(self.legacy_path, 'r') as f:
+                    lines = f.readlines()
+                self._counts['images'] = int(float(lines[0])) if lines else 0
+                self._dirty = True
+        self.flush()
+
+    def start(self):
+        # periodic saves, only started once
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name='stats-counter', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def add(self, kind, number=1, model=None):
+        with self._lock:
+            self._counts[kind] += number
+            if model:
+                self._models[model] = self._models.get(model, 0) + number
+            self._dirty = True
+
+    def get(self, kind):
+        return self._counts[kind]
+
+    def models(self):
+        with self._lock:
+            return dict(self._models)
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                data = dict(self._counts, models=dict(self._models))
+                self._dirty = False
+            tmp_path = self.file_path + '.tmp'
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f, indent=1)
+                os.replace(tmp_path, self.file_path)
+            except OSError:
+                with self._lock:
+                    self._dirty = True
+                raise
+            return True
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f'Could not save the generation stats, will retry: {e}')
+
+
+counter = StatsCounter('resources/stats.json', legacy_path='resources/stats.txt')
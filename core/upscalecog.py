@@ -9,14 +9,18 @@ from discord import option
 from discord.ext import commands
 from os.path import splitext, basename
 from PIL import Image
-from threading import Thread
 from typing import Optional
 from urllib.parse import urlparse
 
+from core import autocomplete
+from core import jobstate
+from core import poststage
 from core import queuehandler
+from core import ratelimit
 from core import viewhandler
 from core import settings
-from core import settingscog
+from core import statscounter
+from core import webuiclient
 from core.queuehandler import GlobalQueue
 
 
@@ -54,14 +58,14 @@ class UpscaleCog(commands.Cog):
         str,
         description='The upscaler model to use.',
         required=True,
-        autocomplete=discord.utils.basic_autocomplete(settingscog.SettingsCog.upscaler_autocomplete),
+        autocomplete=autocomplete.indexed('upscalers'),
     )
     @option(
         'upscaler_2',
         str,
         description='The 2nd upscaler model to use.',
         required=False,
-        autocomplete=discord.utils.basic_autocomplete(settingscog.SettingsCog.upscaler_autocomplete),
+        autocomplete=autocomplete.indexed('upscalers'),
     )
     @option(
         'upscaler_2_strength',
@@ -108,7 +112,7 @@ class UpscaleCog(commands.Cog):
         # url *will* override init image for compatibility, can be changed here
         if init_url:
             try:
-                init_image = requests.get(init_url)
+                init_image = await webuiclient.fetch_image(init_url)
             except(Exception,):
                 await ctx.send_response('URL image not found!\nI have nothing to work with...', ephemeral=True)
                 has_image = False
@@ -139,11 +143,11 @@ class UpscaleCog(commands.Cog):
         # set up the queue if an image was found
         user_queue_limit = settings.queue_check(ctx.author)
         if has_image:
-            if queuehandler.GlobalQueue.dream_thread.is_alive():
+            if queuehandler.GlobalQueue.is_busy():
                 if user_queue_limit == "Stop":
                     await ctx.send_response(content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.", ephemeral=True)
                 else:
-                    queuehandler.GlobalQueue.queue.append(queuehandler.UpscaleObject(self, *input_tuple, view))
+                    queuehandler.GlobalQueue.queue.push(queuehandler.UpscaleObject(self, *input_tuple, view))
             else:
                 await queuehandler.process_dream(self, queuehandler.UpscaleObject(self, *input_tuple, view))
             if user_queue_limit != "Stop":
@@ -152,7 +156,8 @@ class UpscaleCog(commands.Cog):
     # the function to queue Discord posts
     def post(self, event_loop: AbstractEventLoop, post_queue_object: queuehandler.PostObject):
         event_loop.create_task(
-            post_queue_object.ctx.channel.send(
+            ratelimit.governor.send(
+                post_queue_object.ctx.channel,
                 content=post_queue_object.content,
                 file=post_queue_object.file,
                 view=post_queue_object.view
@@ -163,19 +168,15 @@ class UpscaleCog(commands.Cog):
 
     # generate the image
     def dream(self, event_loop: AbstractEventLoop, queue_object: queuehandler.UpscaleObject):
+        backend_url = getattr(queue_object, "backend_url", None) or settings.global_var.url
         try:
             start_time = time.time()
             image_url = queue_object.init_image
 
-            if isinstance(image_url, str) and image_url.startswith('file://'):
-                # If image_url starts with file://, open the file locally and read its contents
-                disassembled = urlparse(image_url)
-                with open(image_url[7:], 'rb') as f:
-                    image = base64.b64encode(f.read()).decode('utf-8')
-            else:
-                # If image_url doesn't start with file://, use requests to get the image data
-                disassembled = urlparse(image_url.url)
-                image = base64.b64encode(requests.get(image_url.url, stream=True).content).decode('utf-8')
+            # an attachment, a RemoteImage or a local file:// path
+            disassembled = urlparse(image_url if isinstance(image_url, str) else image_url.url)
+            # usually downloaded and encoded while the previous job rendered
+            image = GlobalQueue.prefetcher.take(queue_object).b64
 
             # pull the name from the image
             filename, file_ext = splitext(basename(disassembled.path))
@@ -198,11 +199,12 @@ class UpscaleCog(commands.Cog):
                 payload.update(up2_payload)
 
             # send normal payload to webui
-            s = settings.authenticate_user()
+            s = settings.authenticate_user(backend_url)
 
-            response = s.post(url=f'{settings.global_var.url}/sdapi/v1/extra-single-image', json=payload)
+            response = s.post(url=f'{backend_url}/sdapi/v1/extra-single-image', json=payload)
             response_data = response.json()
             end_time = time.time()
+            jobstate.advance(queue_object, jobstate.POSTPROCESSING)
 
             # create safe/sanitized filename
             epoch_time = int(time.time())
@@ -210,10 +212,12 @@ class UpscaleCog(commands.Cog):
 
             # save local copy of image
             image_data = response_data['image']
+            jobstate.add_output(queue_object, image_data)
             if settings.global_var.save_outputs == 'True':
                 with open(file_path, "wb") as fh:
                     fh.write(base64.b64decode(image_data))
                 print(f'Saved image: {file_path}')
+            statscounter.counter.add('upscales')
 
             # post to discord
             def post_dream():
@@ -229,16 +233,20 @@ class UpscaleCog(commands.Cog):
                     queuehandler.process_post(
                         self, queuehandler.PostObject(
                             self, queue_object.ctx, content=f'<@{queue_object.ctx.author.id}>, {message}', file=file, embed='', view=queue_object.view))
-            Thread(target=post_dream, daemon=True).start()
+            poststage.stage.submit([queue_object], post_dream)
 
+        except requests.exceptions.ConnectionError as e:
+            if GlobalQueue.failover(queue_object):
+                return
+            jobstate.advance(queue_object, jobstate.FAILED, e)
+            embed = discord.Embed(title='txt2img failed', description=f'{e}', color=settings.global_var.embed_color)
+            event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
         except Exception as e:
+            jobstate.advance(queue_object, jobstate.FAILED, e)
             embed = discord.Embed(title='txt2img failed', description=f'{e}\n{traceback.print_exc()}',
                                   color=settings.global_var.embed_color)
             event_loop.create_task(queue_object.ctx.channel.send(embed=embed))
 
-        # check each queue for any remaining tasks
-        GlobalQueue.process_queue()
-
 
 def setup(bot):
     bot.add_cog(UpscaleCog(bot))
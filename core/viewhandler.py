@@ -396,8 +396,8 @@ class DrawModal(Modal):
             print(f'Redraw -- {interaction.user.name}#{interaction.user.discriminator} -- Prompt: {pen[1]}')
 
             # check queue again, but now we know user is not in queue
-            if queuehandler.GlobalQueue.dream_thread.is_alive():
-                queuehandler.GlobalQueue.queue.append(queuehandler.DrawObject(stablecog.StableCog(self), *prompt_tuple, DrawView(prompt_tuple)))
+            if queuehandler.GlobalQueue.is_busy():
+                queuehandler.GlobalQueue.queue.push(queuehandler.DrawObject(stablecog.StableCog(self), *prompt_tuple, DrawView(prompt_tuple)))
             else:
                 await queuehandler.process_dream(draw_dream, queuehandler.DrawObject(stablecog.StableCog(self), *prompt_tuple, DrawView(prompt_tuple)))
             await interaction.response.send_message(f'<@{interaction.user.id}>, {settings.messages()}\nQueue: ``{len(queuehandler.GlobalQueue.queue)}``{prompt_output}')
@@ -432,7 +432,7 @@ class DrawView(View):
             if buttons_free:
                 # if there's room in the queue, open up the modal
                 user_queue_limit = settings.queue_check(interaction.user)
-                if queuehandler.GlobalQueue.dream_thread.is_alive():
+                if queuehandler.GlobalQueue.is_busy():
                     if user_queue_limit == "Stop":
                         await interaction.response.send_message(content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.", ephemeral=True)
                     else:
@@ -474,11 +474,14 @@ class DrawView(View):
                 # set up the draw dream and do queue code again for lack of a more elegant solution
                 draw_dream = stablecog.StableCog(self)
                 user_queue_limit = settings.queue_check(interaction.user)
-                if queuehandler.GlobalQueue.dream_thread.is_alive():
+                if queuehandler.GlobalQueue.is_busy():
                     if user_queue_limit == "Stop":
                         await interaction.response.send_message(content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.", ephemeral=True)
                     else:
-                        queuehandler.GlobalQueue.queue.append(queuehandler.DrawObject(stablecog.StableCog(self), *seed_tuple, DrawView(seed_tuple)))
+                        draw_object = queuehandler.DrawObject(stablecog.StableCog(self), *seed_tuple, DrawView(seed_tuple))
+                        # re-rolls are random anyway, so they can be merged with other identical re-rolls
+                        draw_object.coalescible = True
+                        queuehandler.GlobalQueue.queue.push(draw_object)
                 else:
                     await queuehandler.process_dream(draw_dream, queuehandler.DrawObject(stablecog.StableCog(self), *seed_tuple, DrawView(seed_tuple)))
 
@@ -526,11 +529,11 @@ class DrawView(View):
                     # set up the draw dream and do queue code again for lack of a more elegant solution
                     draw_dream = upscalecog.UpscaleCog(self)
                     user_queue_limit = settings.queue_check(interaction.user)
-                    if queuehandler.GlobalQueue.dream_thread.is_alive():
+                    if queuehandler.GlobalQueue.is_busy():
                         if user_queue_limit == "Stop":
                             await interaction.response.send_message(content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.", ephemeral=True)
                         else:
-                            queuehandler.GlobalQueue.queue.append(queuehandler.UpscaleObject(upscalecog.UpscaleCog(self), *upscale_tuple, DeleteView(upscale_tuple)))
+                            queuehandler.GlobalQueue.queue.push(queuehandler.UpscaleObject(upscalecog.UpscaleCog(self), *upscale_tuple, DeleteView(upscale_tuple)))
                     else:
                         await queuehandler.process_dream(draw_dream, queuehandler.UpscaleObject(upscalecog.UpscaleCog(self), *upscale_tuple, DeleteView(upscale_tuple)))
 
@@ -580,11 +583,11 @@ class DrawView(View):
                 # Configuration et ajout de la tâche dans la file d'attente
                 draw_dream = stablecog.StableCog(self)
                 user_queue_limit = settings.queue_check(interaction.user)
-                if queuehandler.GlobalQueue.dream_thread.is_alive():
+                if queuehandler.GlobalQueue.is_busy():
                     if user_queue_limit == "Stop":
                         await interaction.response.send_message(content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.", ephemeral=True)
                     else:
-                        queuehandler.GlobalQueue.queue.append(queuehandler.DrawObject(stablecog.StableCog(self), *input_tuple, DrawView(input_tuple)))
+                        queuehandler.GlobalQueue.queue.push(queuehandler.DrawObject(stablecog.StableCog(self), *input_tuple, DrawView(input_tuple)))
                 else:
                     await queuehandler.process_dream(draw_dream, queuehandler.DrawObject(stablecog.StableCog(self), *input_tuple, DrawView(input_tuple)))
 
@@ -748,11 +751,11 @@ class UpscaleMenu(discord.ui.Select):
                 # set up the draw dream and do queue code again for lack of a more elegant solution
                 draw_dream = upscalecog.UpscaleCog(self)
                 user_queue_limit = settings.queue_check(interaction.user)
-                if queuehandler.GlobalQueue.dream_thread.is_alive():
+                if queuehandler.GlobalQueue.is_busy():
                     if user_queue_limit == "Stop":
                         await interaction.response.send_message(content=f"Please wait! You're past your queue limit of {settings.global_var.queue_limit}.", ephemeral=True)
                     else:
-                        queuehandler.GlobalQueue.queue.append(queuehandler.UpscaleObject(upscalecog.UpscaleCog(self), *upscale_tuple, DeleteView(upscale_tuple)))
+                        queuehandler.GlobalQueue.queue.push(queuehandler.UpscaleObject(upscalecog.UpscaleCog(self), *upscale_tuple, DeleteView(upscale_tuple)))
                 else:
                     await queuehandler.process_dream(draw_dream, queuehandler.UpscaleObject(upscalecog.UpscaleCog(self), *upscale_tuple, DeleteView(upscale_tuple)))
 
@@ -0,0 +1,134 @@
+import asyncio
+
+import aiohttp
+
+from core import settings
+
+# seconds
+DEFAULT_TIMEOUT = 30
+FETCH_TIMEOUT = 15
+
+_session = None
+_logged_in = set()
+_login_lock = None
+
+
+class WebUIError(Exception):
+    """The Web UI answered, but not with what we asked for."""
+
+    def __init__(self, status, message):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+class RemoteImage:
+    """Stands in for a discord.Attachment when the image comes from a URL the user gave."""
+
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+
+
+def _client():
+    # one ClientSession for the bot's event loop, created on first use
+    global _session, _login_lock
+    if _session is None or _session.closed:
+        # the default jar ignores cookies from IP hosts like 127.0.0.1, which would drop the login cookie
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT),
+                                         cookie_jar=aiohttp.CookieJar(unsafe=True))
+        _login_lock = asyncio.Lock()
+        _logged_in.clear()
+    return _session
+
+
+def _auth():
+    # only ever sent to the web ui, never to user supplied URLs
+    if settings.global_var.api_auth:
+        return aiohttp.BasicAuth(settings.global_var.api_user or '', settings.global_var.api_pass or '')
+    return None
+
+
+async def _login(url):
+    async with _login_lock:
+        if url in _logged_in:
+            return
+        session = _client()
+        timeout = aiohttp.ClientTimeout(total=10)
+        # do a check to see if --gradio-auth is set
+        if settings.global_var.gradio_auth is None:
+            async with session.get(f'{url}/sdapi/v1/cmd-flags', auth=_auth(), timeout=timeout) as response:
+                settings.global_var.gradio_auth = response.status == 401
+        data = None
+        if settings.global_var.gradio_auth:
+            data = {'username': settings.global_var.username, 'password': settings.global_var.password}
+        async with session.post(f'{url}/login', data=data, auth=_auth(), timeout=timeout):
+            pass
+        _logged_in.add(url)
+
+
+async def _request(method, path, url=None, json=None, timeout=DEFAULT_TIMEOUT, retry=True):
+    url = (url or settings.global_var.url).rstrip('/')
+    session = _client()
+    if url not in _logged_in:
+        await _login(url)
+    async with session.request(method, f'{url}{path}', json=json, auth=_auth(),
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        if response.status == 401 and retry:
+            # login expired, e.g. the web ui restarted
+            _logged_in.discard(url)
+        elif response.status >= 400:
+            raise WebUIError(response.status, await response.text())
+        else:
+            return await response.json(content_type=None)
+    return await _request(method, path, url, json, timeout, retry=False)
+
+
+async def png_info(image_b64, url=None):
+    response = await _request('POST', '/sdapi/v1/png-info', url, {'image': 'data:image/png;base64,' + image_b64})
+    return response.get('info')
+
+
+async def progress(url=None, skip_current_image=False):
+    return await _request('GET', f'/sdapi/v1/progress?skip_current_image={str(skip_current_image).lower()}', url)
+
+
+async def interrupt(url=None):
+    return await _request('POST', '/sdapi/v1/interrupt', url)
+
+
+async def skip(url=None):
+    return await _request('POST', '/sdapi/v1/skip', url)
+
+
+async def options(url=None):
+    return await _request('GET', '/sdapi/v1/options', url)
+
+
+async def fetch(image_url, timeout=FETCH_TIMEOUT):
+    # plain download of a user supplied URL (not the web ui)
+    async with _client().get(image_url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        if response.status >= 400:
+            raise WebUIError(response.status, f"couldn't download {image_url}")
+        return await response.read()
+
+
+async def fetch_image(image_url, timeout=FETCH_TIMEOUT):
+    return RemoteImage(image_url, await fetch(image_url, timeout))
+
+
+async def is_offline(url=None):
+    # True when the web ui answers but its API is missing (started without --api)
+    url = (url or settings.global_var.url).rstrip('/')
+    try:
+        async with _client().get(f'{url}/sdapi/v1/cmd-flags', auth=_auth(), timeout=aiohttp.ClientTimeout(total=5)) as response:
+            if response.status == 404:
+                print('API is unreachable! Please check the WebUI manually.')
+                return True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f'An exception occurred while checking if the WebUI is online:\n{str(e)}')
+    return False
+
+
+async def close():
+    if _session is not None and not _session.closed:
+        await _session.close()
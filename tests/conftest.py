@@ -0,0 +1,56 @@
+import http.server
+import os
+import sys
+import threading
+
+import pytest
+
+# the bot runs from the repository root, its modules are imported as core.*
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import settings  # noqa: E402
+
+
+class FakeWebUI(http.server.BaseHTTPRequestHandler):
+    """Hands out a new session cookie on every login, only the latest one is accepted."""
+
+    protocol_version = 'HTTP/1.1'
+    session = 0
+    rejected = 0
+
+    def _reply(self, status, cookie=None):
+        self.send_response(status)
+        if cookie is not None:
+            self.send_header('Set-Cookie', f'access-token={cookie}; Path=/')
+        body = b'{}' if status == 200 else b''
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        type(self).session += 1
+        self._reply(200, self.session)
+
+    def do_GET(self):
+        if self.headers.get('Cookie') == f'access-token={self.session}':
+            self._reply(200)
+        else:
+            type(self).rejected += 1
+            self._reply(401)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def webui(monkeypatch):
+    monkeypatch.setattr(settings.global_var, 'gradio_auth', False)
+    monkeypatch.setattr(settings.global_var, 'api_auth', False)
+    FakeWebUI.session = 0
+    FakeWebUI.rejected = 0
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeWebUI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,236 @@
+import asyncio
+import http.server
+import itertools
+import json
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from core import jobstate
+from core import settings
+from core.backendpool import BackendPool, BackendWorker
+from core.scheduler import JobScheduler
+
+
+def fake_backend(images=None):
+    """A Web UI answering txt2img with one image per batch slot, or only `images` of them."""
+
+    class FakeBackend(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        batches = []
+
+        def _reply(self, data):
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._reply({})
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            self.batches.append(payload['batch_size'])
+            count = payload['batch_size'] if images is None else images
+            self._reply({'images': [f'image-{n}' for n in range(count)]})
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeBackend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, FakeBackend
+
+
+def dead_url():
+    # a port nobody listens on, like a web ui that went down
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+
+class FakeCog:
+    """Does what the draw cog does with the pool: one request per job and its merged followers,
+    failover on a dropped connection, post-processing for the jobs that got an image."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def dream(self, event_loop, queue_object):
+        jobs = [queue_object] + queue_object.coalesced
+        # the web ui seeds image i with seed + i
+        for index, job in enumerate(queue_object.coalesced, start=1):
+            job.set_seed(queue_object.seed + index)
+        try:
+            response = requests.post(f'{queue_object.backend_url}/sdapi/v1/txt2img',
+                                     json={'batch_size': len(jobs)}, timeout=5)
+        except requests.exceptions.ConnectionError:
+            self.pool.failover(queue_object)
+            return
+        for job, image in zip(jobs, response.json()['images']):
+            jobstate.advance(job, jobstate.POSTPROCESSING)
+            jobstate.add_output(job, image)
+            job.is_done = True
+
+
+class FakeDraw:
+    def __init__(self, cog, prompt, coalescible, seed):
+        self.cog = cog
+        self.user_id = 1
+        self.data_model = ''
+        self.prompt = prompt
+        self.is_done = False
+        self.coalescible = coalescible
+        self.coalesced = []
+        self.seed = self.requested_seed = seed
+
+    def set_seed(self, seed):
+        self.seed = seed
+
+
+_seeds = itertools.count(1000, 100)
+
+
+def draw(cog, prompt='a cat', coalescible=False):
+    return FakeDraw(cog, prompt, coalescible, next(_seeds))
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(images=None):
+        server, handler = fake_backend(images)
+        started.append(server)
+        return f'http://127.0.0.1:{server.server_port}', handler
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def make_pool(urls, loop):
+    pool = BackendPool(JobScheduler(key=lambda job: job.prompt if job.coalescible else None))
+    pool.retry_interval = 0.1
+    pool.configure(urls)
+    for backend in pool.backends:
+        # fresh enough that the worker doesn't recheck them before a job
+        backend.last_ok = time.time()
+    pool.workers = [BackendWorker(pool, backend, loop) for backend in pool.backends]
+    return pool
+
+
+def test_job_fails_over_to_the_next_backend(servers):
+    url, backend = servers()
+
+    async def scenario():
+        pool = make_pool([dead_url(), url], asyncio.get_running_loop())
+        job = draw(FakeCog(pool))
+        pool.queue.push(job)
+        handle = jobstate.JobHandle(job)
+
+        await pool.workers[0].run_once()
+        assert not pool.backends[0].healthy
+        assert job.attempts == 1
+        assert jobstate.state(job) == jobstate.QUEUED
+
+        await pool.workers[1].run_once()
+        result = await handle
+        assert result.images == ['image-0']
+        assert job.timeline.runs == 2
+        assert job.backend_url == url
+        # only the backend that drew it counts the job
+        assert [backend.jobs_done for backend in pool.backends] == [0, 1]
+
+    asyncio.run(scenario())
+    assert backend.batches == [1]
+
+
+def test_job_fails_after_max_attempts(servers):
+    async def scenario():
+        pool = make_pool([dead_url(), dead_url()], asyncio.get_running_loop())
+        job = draw(FakeCog(pool))
+        pool.queue.push(job)
+        handle = jobstate.JobHandle(job)
+
+        await pool.workers[0].run_once()
+        await pool.workers[1].run_once()
+        assert not pool.queue
+        with pytest.raises(jobstate.JobFailed):
+            await handle
+        assert [backend.jobs_done for backend in pool.backends] == [0, 0]
+
+    asyncio.run(scenario())
+
+
+def test_unfinished_followers_are_requeued(servers, monkeypatch):
+    monkeypatch.setattr(settings.global_var, 'coalesce_max_batch', 4)
+    # the web ui hands back two images for the three merged draws
+    url, backend = servers(images=2)
+
+    async def scenario():
+        pool = make_pool([url], asyncio.get_running_loop())
+        cog = FakeCog(pool)
+        jobs = [draw(cog, coalescible=True) for _ in range(3)]
+        for job in jobs:
+            pool.queue.push(job)
+
+        await pool.workers[0].run_once()
+        assert [jobstate.state(job) for job in jobs] == [jobstate.DONE, jobstate.DONE, jobstate.QUEUED]
+        assert list(pool.queue) == [jobs[2]]
+        assert jobs[1].seed == jobs[0].seed + 1
+        # it runs on its own the next time, with the seed it was queued with
+        assert not jobs[2].coalescible
+        assert jobs[2].seed == jobs[2].requested_seed
+
+        await pool.workers[0].run_once()
+        assert (await jobstate.JobHandle(jobs[2])).images == ['image-0']
+
+    asyncio.run(scenario())
+    assert backend.batches == [3, 1]
+
+
+def test_worker_prefers_jobs_for_its_loaded_checkpoint(servers):
+    url, backend = servers()
+
+    async def scenario():
+        pool = make_pool([url], asyncio.get_running_loop())
+        pool.backends[0].current_model = 'model_b'
+        cog = FakeCog(pool)
+        older, newer = draw(cog), draw(cog)
+        older.data_model, newer.data_model = 'model_a', 'model_b'
+        pool.queue.push(older)
+        pool.queue.push(newer)
+
+        await pool.workers[0].run_once()
+        assert jobstate.state(newer) == jobstate.DONE
+        assert jobstate.state(older) == jobstate.QUEUED
+        assert pool.backends[0].model_switches == 0
+
+        await pool.workers[0].run_once()
+        assert jobstate.state(older) == jobstate.DONE
+        assert pool.backends[0].model_switches == 1
+
+    asyncio.run(scenario())
+
+
+def test_followers_of_a_failed_over_job_get_their_seed_back(servers, monkeypatch):
+    monkeypatch.setattr(settings.global_var, 'coalesce_max_batch', 4)
+
+    async def scenario():
+        pool = make_pool([dead_url(), dead_url()], asyncio.get_running_loop())
+        cog = FakeCog(pool)
+        jobs = [draw(cog, coalescible=True) for _ in range(3)]
+        for job in jobs:
+            pool.queue.push(job)
+
+        await pool.workers[0].run_once()
+        assert [jobstate.state(job) for job in jobs] == [jobstate.QUEUED] * 3
+        assert [job.seed for job in jobs] == [job.requested_seed for job in jobs]
+
+    asyncio.run(scenario())
@@ -0,0 +1,19 @@
+import json
+
+from core.infotexts import response_infotexts
+
+
+def test_infotexts_from_the_info_string():
+    response_data = {'images': ['a', 'b'], 'info': json.dumps({'infotexts': ['one', 'two']})}
+    assert response_infotexts(response_data, 2) == ['one', 'two']
+
+
+def test_infotexts_from_an_info_dict():
+    assert response_infotexts({'info': {'infotexts': ['one']}}, 1) == ['one']
+
+
+def test_missing_or_mismatched_infotexts():
+    assert response_infotexts({}, 1) is None
+    assert response_infotexts({'info': 'not json'}, 1) is None
+    assert response_infotexts({'info': json.dumps({'infotexts': ['one']})}, 2) is None
+    assert response_infotexts({'info': json.dumps({'seed': 1})}, 1) is None
@@ -0,0 +1,16 @@
+from core.promptpipeline import PromptPipeline
+
+
+def test_list_shaped_network_names():
+    # /config choices may come as [name, ...] lists instead of plain names
+    pipeline = PromptPipeline((), (), (), ('None', ['hyper_a', 'hyper_a']), ('None', ['lora_a', 'lora_a']))
+    assert pipeline.hyper_names == {'None', 'hyper_a'}
+    assert pipeline.lora_names == {'None', 'lora_a'}
+    assert pipeline.add_extra_net('a cat', 'lora_a', 0.8) == 'a cat <lora:lora_a:0.8>'
+    assert pipeline.add_extra_net('a cat', 'hyper_a', 0.5) == 'a cat <hypernet:hyper_a:0.5>'
+
+
+def test_plain_network_names():
+    pipeline = PromptPipeline((), (), (), ('hyper_a',), ('lora_a',))
+    assert pipeline.add_extra_net('a cat <lora:lora_a:1>', 'lora_a', 0.8) == 'a cat <lora:lora_a:1>'
+    assert pipeline.add_extra_net('a cat', 'other', 0.8) == 'a cat'
@@ -0,0 +1,21 @@
+import asyncio
+from types import SimpleNamespace
+
+from core.scheduler import JobScheduler
+
+
+def job(user_id=1):
+    return SimpleNamespace(user_id=user_id)
+
+
+def test_listeners_hear_about_requeued_jobs():
+    queue = JobScheduler()
+    heard = []
+    queue.listeners.append(lambda: heard.append(len(queue)))
+    first = job()
+    queue.push(first)
+    assert asyncio.run(queue.get(timeout=1)) is first
+
+    queue.requeue(first)
+    assert heard == [1, 0, 1]
+    assert list(queue) == [first]
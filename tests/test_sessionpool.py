@@ -0,0 +1,15 @@
+from conftest import FakeWebUI
+from core.sessionpool import WebUISession
+
+
+def test_expired_login_is_retried_with_the_new_cookie(webui):
+    session = WebUISession(webui, 2)
+    session.login()
+    assert session.get(webui + '/sdapi/v1/options').status_code == 200
+
+    # the web ui restarted, the cookie we hold is no longer valid
+    FakeWebUI.session += 1
+    response = session.get(webui + '/sdapi/v1/options')
+    assert response.status_code == 200
+    assert FakeWebUI.rejected == 1
+    assert session.get(webui + '/sdapi/v1/options').status_code == 200
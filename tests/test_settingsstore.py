@@ -0,0 +1,46 @@
+import json
+import sqlite3
+
+import pytest
+
+from core import settings
+from core.settingsstore import SettingsStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    (tmp_path / '123.json').write_text(json.dumps({'count': '3,1', 'max_count': '4,1', 'steps': 30}))
+    store = SettingsStore(str(tmp_path / 'settings.db'), flush_interval=0)
+    store.migrate_json(str(tmp_path))
+    monkeypatch.setattr(settings, '_store', store)
+    monkeypatch.setattr(settings, 'template', {'batch': '1,1', 'max_batch': '1,1', 'steps': 20})
+    settings.clear_settings_cache()
+    yield store
+    store.close()
+    settings.clear_settings_cache()
+
+
+def test_legacy_count_keys_are_renamed_on_import(store):
+    assert store.get('123') == {'batch': '3,1', 'max_batch': '4,1', 'steps': 30}
+
+
+def test_batch_survives_a_cache_miss(store):
+    settings.update('123', 'batch', '2,2')
+    store.flush()
+    settings.clear_settings_cache()
+    assert settings.read('123')['batch'] == '2,2'
+    assert settings.read('123')['max_batch'] == '4,1'
+
+
+def test_legacy_rows_in_the_database_are_renamed_once(tmp_path):
+    db_path = str(tmp_path / 'legacy.db')
+    SettingsStore(db_path).close()
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany('INSERT INTO channel_settings VALUES (?, ?, ?)', [
+            ('1', 'count', json.dumps('3,1')), ('1', 'max_count', json.dumps('4,1')), ('1', 'batch', json.dumps('2,2'))])
+    store = SettingsStore(db_path)
+    try:
+        # the batch saved after the old migration wins over the stale count row
+        assert store.get('1') == {'batch': '2,2', 'max_batch': '4,1'}
+    finally:
+        store.close()
@@ -0,0 +1,18 @@
+import asyncio
+
+from conftest import FakeWebUI
+from core import webuiclient
+
+
+def test_login_cookie_kept_for_ip_hosts(webui):
+    # the default web ui address is an IP, its login cookie must be sent back
+    async def calls():
+        try:
+            first = await webuiclient.options(webui)
+            second = await webuiclient.options(webui)
+        finally:
+            await webuiclient.close()
+        return first, second
+
+    assert asyncio.run(calls()) == ({}, {})
+    assert FakeWebUI.rejected == 0